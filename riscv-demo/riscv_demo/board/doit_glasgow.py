@@ -1,12 +1,11 @@
 import importlib.resources
 
-from doit.tools import run_once
-
 
 TOOLS_DIR = importlib.resources.files("riscv_demo") / "tools"
 
 
 def task_build_bitstream():
+    # Always run: the step elaborates the design and only rebuilds if it isn't in the cache.
     return {
         "actions": [
 	        "pdm run chipflow board build-bitstream",
@@ -15,7 +14,7 @@ def task_build_bitstream():
             "build/board/top.bin",
         ],
         "uptodate": [
-            run_once,
+            False,
         ],
     }
 
@@ -35,9 +34,9 @@ def task_load_bitstream():
 
 
 def task_flash_software():
+    # Only the 4K sectors that changed since the last time are erased, programmed and verified.
     return {
         "actions": [
-	        "pdm run glasgow run memory-25x -V 3.3 --pins-cs 7 --pin-sck 6 --pins-io 5,4,8,9 erase-program -S 4096 -P 64 0x100000 -f zephyr.bin",
-	        "pdm run glasgow run memory-25x -V 3.3 --pins-cs 7 --pin-sck 6 --pins-io 5,4,8,9 verify 0x100000 -f zephyr.bin",
+	        f"pdm run python {TOOLS_DIR}/flash_delta.py zephyr.bin 0x100000 -- -V 3.3 --pins-cs 7 --pin-sck 6 --pins-io 5,4,8,9",
         ],
     }
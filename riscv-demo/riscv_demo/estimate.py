@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .history import parse_yosys_log
+from .yosys import run_yosys
+
+
+__all__ = ["find_liberty", "split_rtlil", "estimate_design"]
+
+
+CACHE_DIR = os.path.join("build", "silicon", "estimate")
+LIBERTY   = os.path.join("ihp-sg13g2", "libs.ref", "sg13g2_stdcell", "lib",
+                         "sg13g2_stdcell_typ_1p20V_25C.lib")
+
+# Each module is synthesized on its own, with its submodules replaced by blackboxes, so that
+# the result only depends on the module itself and can be cached. The logic depth (between
+# registers and ports) is measured with `ltp -noff` on a generic gate mapping, since `ltp`
+# doesn't recognize the flip-flops of the cell library.
+SCRIPT = """\
+read_liberty -lib {liberty}
+read_rtlil {rtlil}
+hierarchy -top {name}
+proc
+synth -run coarse: -noabc
+design -save generic
+abc
+ltp -noff
+design -load generic
+dfflibmap -liberty {liberty}
+abc -liberty {liberty}
+opt_clean
+stat -liberty {liberty}
+"""
+
+
+def find_liberty():
+    """Return the path of the typical corner sg13g2 standard cell library in `$PDK_ROOT`."""
+    if "PDK_ROOT" not in os.environ:
+        return None
+    liberty = os.path.join(os.environ["PDK_ROOT"], LIBERTY)
+    if not os.path.exists(liberty):
+        return None
+    return liberty
+
+
+def split_rtlil(text):
+    """Return the text of each module in an RTLIL file (including its attributes) by name,
+    and the name of the top module."""
+    modules = {}
+    top = None
+    attributes = []
+    lines = None
+    for line in text.splitlines(keepends=True):
+        if lines is not None:
+            lines.append(line)
+            if line.rstrip() == "end":
+                modules[name] = "".join(lines)
+                lines = None
+        elif line.startswith("attribute "):
+            attributes.append(line)
+        elif line.startswith("module "):
+            name = line.split()[1]
+            if any(attribute.split()[1:] == ["\\top", "1"] for attribute in attributes):
+                top = name
+            lines = attributes + [line]
+            attributes = []
+    if top is None and modules:
+        top = list(modules)[-1]
+    return modules, top
+
+
+def _submodules(module_text):
+    return re.findall(r"^\s+cell (\\\S+) \S+$", module_text, re.M)
+
+
+def _blackbox(name, module_text):
+    ports = re.findall(r"^\s+(wire .*\b(?:input|output|inout) \d+.*)$", module_text, re.M)
+    return "".join([
+        "attribute \\blackbox 1\n",
+        f"module {name}\n",
+        *(f"  {port}\n" for port in ports),
+        "end\n",
+    ])
+
+
+def _strip_src(text):
+    # Source locations change whenever unrelated code above them moves; they don't affect
+    # the netlist, so they are left out of the cache key and of the synthesized RTLIL.
+    return re.sub(r"^\s*attribute \\src .*\n", "", text, flags=re.M)
+
+
+def _synthesize(name, rtlil_text, liberty, work_dir):
+    # YoWASP only gives Yosys access to the current directory, so all paths are relative to it.
+    os.makedirs(work_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        rtlil_path  = os.path.join(tmp_dir, "module.il")
+        script_path = os.path.join(tmp_dir, "module.ys")
+        with open(rtlil_path, "w") as f:
+            f.write(rtlil_text)
+        with open(script_path, "w") as f:
+            f.write(SCRIPT.format(liberty=os.path.relpath(liberty), rtlil=os.path.relpath(rtlil_path),
+                                  name=name))
+        result = run_yosys(["-s", os.path.relpath(script_path)], capture_output=True, text=True)
+    log = result.stdout
+    if result.returncode != 0:
+        errors = [line for line in log.splitlines() if line.startswith("ERROR")]
+        raise Exception(f"Synthesis of {name} failed: {' '.join(errors) or log[-1000:]}")
+    depth = re.search(r"Longest topological path in .* \(length=(\d+)\)", log)
+    area  = re.findall(r"Chip area for (?:top )?module '.*': ([0-9.]+)", log)
+    cells = parse_yosys_log(log)
+    return {
+        "area":  float(area[-1]) if area else 0.0,
+        "cells": sum(count for cell, count in cells.items() if cell.startswith("sg13g2_")),
+        "depth": int(depth[1]) if depth else 0,
+    }
+
+
+def _write_atomic(filename, data):
+    # Several estimates (e.g. of the variants in a sweep) may share the cache directory.
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(filename), delete=False) as f:
+        f.write(data)
+    os.replace(f.name, filename)
+
+
+def estimate_design(rtlil_path, liberty, *, jobs=None, cache_dir=CACHE_DIR):
+    """Synthesize each module of the design in `rtlil_path` against `liberty`.
+
+    Returns a dict with the `area`, `cells` and `depth` of each module (excluding its
+    submodules), the number of `instances` of it in the design, and whether the result was
+    `cached`, by module name; and the name of the top module.
+    """
+    with open(rtlil_path) as f:
+        modules, top = split_rtlil(f.read())
+    with open(liberty, "rb") as f:
+        liberty_data = f.read()
+    liberty_hash = hashlib.sha256(liberty_data).hexdigest()
+    # The library is usually in the PDK, outside of the directory Yosys can access.
+    os.makedirs(cache_dir, exist_ok=True)
+    liberty = os.path.join(cache_dir, f"{liberty_hash}.lib")
+    if not os.path.exists(liberty):
+        _write_atomic(liberty, liberty_data)
+
+    jobs_by_name = {}
+    for name, text in modules.items():
+        text = _strip_src(text)
+        stubs = "".join(_blackbox(submodule, modules[submodule])
+                        for submodule in sorted(set(_submodules(text)))
+                        if submodule in modules)
+        key = hashlib.sha256("\0".join([
+            SCRIPT, liberty_hash, stubs,
+            # The module's own name doesn't affect the result.
+            text.replace(f"module {name}\n", "module \\m\n", 1),
+        ]).encode()).hexdigest()
+        jobs_by_name[name] = (key, stubs + text)
+
+    def run(name):
+        key, rtlil_text = jobs_by_name[name]
+        cache_path = os.path.join(cache_dir, f"{key}.json")
+        if os.path.exists(cache_path):
+            with open(cache_path) as f:
+                return {**json.load(f), "cached": True}
+        result = _synthesize(name, rtlil_text, liberty, os.path.join(cache_dir, "work"))
+        _write_atomic(cache_path, json.dumps(result).encode())
+        return {**result, "cached": False}
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        results = dict(zip(modules, executor.map(run, modules)))
+
+    # Amaranth emits a module per elaboratable, but a module could still be instantiated more
+    # than once (e.g. when it comes from an extra RTLIL file).
+    def count_instances(name, count):
+        results[name]["instances"] = results[name].get("instances", 0) + count
+        for submodule in _submodules(modules[name]):
+            if submodule in modules:
+                count_instances(submodule, count)
+    for result in results.values():
+        result["instances"] = 0
+    if top is not None:
+        count_instances(top, 1)
+    return results, top
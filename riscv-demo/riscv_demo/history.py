@@ -0,0 +1,144 @@
+import os
+import re
+import sqlite3
+import argparse
+import datetime
+import subprocess
+
+
+__all__ = ["HISTORY_FILE", "parse_yosys_log", "parse_nextpnr_log", "record_build"]
+
+
+HISTORY_FILE = os.path.join("build", "history.sqlite")
+
+
+def parse_yosys_log(text):
+    """Return the cell counts from the last `stat` report in a Yosys log."""
+    blocks = re.split(r"^=== .* ===$", text, flags=re.M)
+    if len(blocks) == 1:
+        return {}
+    cells = {}
+    # Older Yosys versions print `<cell> <count>`, newer ones `<count> [<area>] <cell>`. Cell
+    # types are told apart from the other statistics (wires, ports, ...) by their `_` or `$`.
+    cell_type = r"(\$\w+|[A-Za-z]\w*_\w*)"
+    pattern = rf"^\s+(?:{cell_type}\s+(\d+)|(\d+)\s+(?:[0-9.]+\s+|-\s+)?{cell_type})\s*$"
+    for match in re.finditer(pattern, blocks[-1], re.M):
+        if match[1] is not None:
+            cells[match[1]] = int(match[2])
+        else:
+            cells[match[4]] = int(match[3])
+    return cells
+
+
+def parse_nextpnr_log(text):
+    """Return the post-route maximum frequency in MHz of each clock and the device utilisation
+    from a nextpnr log."""
+    fmax = {}
+    # nextpnr reports the estimate after placement and again after routing; the last one wins.
+    for match in re.finditer(r"Max frequency for clock\s+'(.+?)': ([0-9.]+) MHz", text):
+        fmax[match[1]] = float(match[2])
+    utilisation = {}
+    for match in re.finditer(r"^Info:\s+(\w+):\s+(\d+)/\s*(\d+)\s+\d+%", text, re.M):
+        utilisation[match[1]] = int(match[2])
+    return fmax, utilisation
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _connect(filename):
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    db = sqlite3.connect(filename)
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS builds (
+            id      INTEGER PRIMARY KEY,
+            time    TEXT NOT NULL,
+            step    TEXT NOT NULL,
+            "commit" TEXT,
+            dirty   INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS metrics (
+            build   INTEGER NOT NULL REFERENCES builds(id),
+            name    TEXT NOT NULL,
+            value   REAL NOT NULL
+        );
+    """)
+    return db
+
+
+def record_build(step, metrics, *, filename=HISTORY_FILE):
+    """Append the `metrics` (a mapping of names to numbers) of a build of `step` to the history,
+    together with the commit it was built from."""
+    commit = _git("rev-parse", "--short", "HEAD")
+    dirty  = _git("status", "--porcelain", "--untracked-files=no")
+    with _connect(filename) as db:
+        build = db.execute(
+            """INSERT INTO builds (time, step, "commit", dirty) VALUES (?, ?, ?, ?)""",
+            (datetime.datetime.now().isoformat(timespec="seconds"), step, commit,
+             None if dirty is None else int(dirty != ""))).lastrowid
+        db.executemany("INSERT INTO metrics (build, name, value) VALUES (?, ?, ?)",
+                       [(build, name, value) for name, value in metrics.items()])
+    db.close()
+
+
+def query_history(step, *, metric="%", limit=20, filename=HISTORY_FILE):
+    """Return the names of the metrics of `step` matching the SQL `LIKE` pattern `metric`, and
+    a `(commit, dirty, values)` row for each of the last `limit` commits. If a commit was built
+    several times, the last build is used."""
+    with _connect(filename) as db:
+        rows = db.execute("""
+            SELECT builds.id, "commit", dirty, name, value FROM builds
+            JOIN metrics ON metrics.build = builds.id
+            WHERE builds.id IN (
+                SELECT MAX(id) FROM builds WHERE step = ? GROUP BY "commit", dirty
+                ORDER BY MAX(id) DESC LIMIT ?
+            ) AND name LIKE ?
+            ORDER BY builds.id
+        """, (step, limit, metric)).fetchall()
+    db.close()
+    names  = sorted({name for _, _, _, name, _ in rows})
+    builds = {}
+    for build, commit, dirty, name, value in rows:
+        builds.setdefault(build, (commit, dirty, {}))[2][name] = value
+    return names, list(builds.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Show how the timing and utilisation of the design changed between commits.")
+    parser.add_argument("step", nargs="?", default="board",
+        help="show the builds of STEP (default: %(default)s)")
+    parser.add_argument("--metric", default="%",
+        help="only show the metrics matching this SQL LIKE pattern, e.g. 'fmax.%%'")
+    parser.add_argument("--limit", type=int, default=20,
+        help="show the last LIMIT commits (default: %(default)s)")
+    parser.add_argument("--history", default=HISTORY_FILE,
+        help="history database (default: %(default)s)")
+    args = parser.parse_args()
+
+    names, builds = query_history(args.step, metric=args.metric, limit=args.limit,
+                                  filename=args.history)
+    widths = [max(len(name), 16) for name in names]
+    print(f"{'commit':<10}", *(f"{name:>{width}}" for name, width in zip(names, widths)))
+    previous = {}
+    for commit, dirty, values in builds:
+        cells = []
+        for name, width in zip(names, widths):
+            if name not in values:
+                cells.append(f"{'-':>{width}}")
+                continue
+            cell = f"{values[name]:g}"
+            if name in previous and values[name] != previous[name]:
+                cell += f" ({values[name] - previous[name]:+g})"
+            cells.append(f"{cell:>{width}}")
+        print(f"{(commit or '?') + ('+' if dirty else ''):<10}", *cells)
+        previous.update(values)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+from .crossbar import *
@@ -0,0 +1,135 @@
+from amaranth import *
+from amaranth.utils import exact_log2
+
+from amaranth_soc.memory import MemoryMap
+
+
+__all__ = ["WishboneCrossbar"]
+
+
+class WishboneCrossbar(Elaboratable):
+    """Wishbone interconnect with an arbiter for each target.
+
+    Unlike a shared bus (an arbiter followed by a decoder), each initiator has its own path to
+    each target, so initiators that access different targets do so in the same cycle; e.g. the
+    CPU can load from SRAM while an instruction fetch waits on the flash. Initiators that access
+    the same target are granted it in round-robin order, and keep it until they end the cycle.
+
+    Accesses to addresses that aren't decoded are never acknowledged, like with
+    :class:`amaranth_soc.wishbone.Decoder`.
+
+    Parameters
+    ----------
+    addr_width, data_width, granularity : int
+        Bus parameters of the initiators and targets.
+
+    Attributes
+    ----------
+    memory_map : MemoryMap
+        Memory map of the targets, in units of `granularity`.
+    """
+    def __init__(self, *, addr_width, data_width, granularity=8):
+        self._addr_width  = addr_width
+        self._data_width  = data_width
+        self._granularity = granularity
+        self._initiators  = []
+        self._targets     = []
+
+        self.memory_map = MemoryMap(addr_width=addr_width + exact_log2(data_width // granularity),
+                                    data_width=granularity)
+
+    def _check_bus(self, bus, kind):
+        if bus.data_width != self._data_width or bus.granularity != self._granularity:
+            raise ValueError(f"{kind} bus has data width {bus.data_width} and granularity "
+                             f"{bus.granularity}, which is not the same as the crossbar data "
+                             f"width {self._data_width} and granularity {self._granularity}")
+
+    def add_initiator(self, intr_bus):
+        """Add an initiator bus (e.g. a CPU bus) to the crossbar."""
+        self._check_bus(intr_bus, "Initiator")
+        if intr_bus.addr_width != self._addr_width:
+            raise ValueError(f"Initiator bus has address width {intr_bus.addr_width}, which is "
+                             f"not the same as the crossbar address width {self._addr_width}")
+        self._initiators.append(intr_bus)
+
+    def add_target(self, sub_bus, *, name=None, addr=None):
+        """Add a target bus to the crossbar at `addr` (in units of `granularity`).
+
+        The target is decoded by comparing the address bits above its own, so it must be
+        aligned to its size. Returns the `(start, end, ratio)` of its window.
+        """
+        self._check_bus(sub_bus, "Target")
+        start, end, ratio = self.memory_map.add_window(sub_bus.memory_map, name=name, addr=addr)
+        if start % (end - start) != 0:
+            raise ValueError(f"Target bus at {start:#x} is not aligned to its size "
+                             f"{end - start:#x}")
+        self._targets.append((sub_bus, start, end))
+        return start, end, ratio
+
+    def elaborate(self, platform):
+        m = Module()
+
+        word_shift = exact_log2(self._data_width // self._granularity)
+
+        # selected[i][j]: initiator `i` is addressing target `j`.
+        selected = []
+        for i, intr_bus in enumerate(self._initiators):
+            selected.append([])
+            for j, (sub_bus, start, end) in enumerate(self._targets):
+                size_bits = exact_log2(end - start) - word_shift
+                sel = Signal(name=f"intr{i}_sel{j}")
+                m.d.comb += sel.eq(intr_bus.adr[size_bits:] == start >> (word_shift + size_bits))
+                selected[i].append(sel)
+
+        # granted[i][j]: initiator `i` is connected to target `j`.
+        granted = [[None] * len(self._targets) for _ in self._initiators]
+        for j, (sub_bus, start, end) in enumerate(self._targets):
+            requests = Signal(len(self._initiators), name=f"sub{j}_requests")
+            grant    = Signal(range(len(self._initiators)), name=f"sub{j}_grant")
+            m.d.comb += requests.eq(Cat(intr_bus.cyc & selected[i][j]
+                                        for i, intr_bus in enumerate(self._initiators)))
+
+            # Round-robin, as in `amaranth_soc.wishbone.Arbiter`; the grant only moves while the
+            # target is idle, so a cycle is never interrupted.
+            with m.If(~sub_bus.cyc):
+                with m.Switch(grant):
+                    for i in range(len(self._initiators)):
+                        with m.Case(i):
+                            for pred in reversed(range(i)):
+                                with m.If(requests[pred]):
+                                    m.d.sync += grant.eq(pred)
+                            for succ in reversed(range(i + 1, len(self._initiators))):
+                                with m.If(requests[succ]):
+                                    m.d.sync += grant.eq(succ)
+
+            with m.Switch(grant):
+                for i, intr_bus in enumerate(self._initiators):
+                    with m.Case(i):
+                        m.d.comb += [
+                            sub_bus.adr  .eq(intr_bus.adr),
+                            sub_bus.dat_w.eq(intr_bus.dat_w),
+                            sub_bus.sel  .eq(intr_bus.sel),
+                            sub_bus.we   .eq(intr_bus.we),
+                            sub_bus.cyc  .eq(requests[i]),
+                            sub_bus.stb  .eq(intr_bus.stb & selected[i][j]),
+                        ]
+                        for optional in ("cti", "bte"):
+                            if hasattr(sub_bus, optional) and hasattr(intr_bus, optional):
+                                m.d.comb += getattr(sub_bus, optional).eq(
+                                    getattr(intr_bus, optional))
+
+            for i in range(len(self._initiators)):
+                granted[i][j] = Signal(name=f"intr{i}_granted{j}")
+                m.d.comb += granted[i][j].eq((grant == i) & selected[i][j])
+
+        for i, intr_bus in enumerate(self._initiators):
+            for j, (sub_bus, start, end) in enumerate(self._targets):
+                with m.If(granted[i][j]):
+                    m.d.comb += [
+                        intr_bus.dat_r.eq(sub_bus.dat_r),
+                        intr_bus.ack  .eq(sub_bus.ack),
+                    ]
+                    if hasattr(intr_bus, "err") and hasattr(sub_bus, "err"):
+                        m.d.comb += intr_bus.err.eq(sub_bus.err)
+
+        return m
@@ -84,6 +84,10 @@ class IOStreamer(wiring.Component):
     On reset, output ports have their drivers enabled, and bidirectional ports have them disabled.
     All of the signals are deasserted, which could be a low or a high level depending on the port
     polarity.
+
+    The inputs can be captured up to `max_sample_delay` cycles later than the outputs were
+    updated, as set by `sample_delay`, to compensate for the round trip delay through the pads
+    and the peripheral. `sample_delay` should only be changed while no transfer is in flight.
     """
 
     @staticmethod
@@ -106,7 +110,8 @@ class IOStreamer(wiring.Component):
             "meta": meta_layout,
         }))
 
-    def __init__(self, ioshape, ports, /, *, ratio=1, init=None, meta_layout=0):
+    def __init__(self, ioshape, ports, /, *, ratio=1, init=None, meta_layout=0,
+                 max_sample_delay=0):
         assert isinstance(ioshape, (int, dict))
         assert ratio in (1, 2)
 
@@ -114,10 +119,13 @@ class IOStreamer(wiring.Component):
         self._ports   = ports
         self._ratio   = ratio
         self._init    = init
+        self._max_sample_delay = max_sample_delay
 
         super().__init__({
             "o_stream":  In(self.o_stream_signature(ioshape, ratio=ratio, meta_layout=meta_layout)),
             "i_stream": Out(self.i_stream_signature(ioshape, ratio=ratio, meta_layout=meta_layout)),
+
+            "sample_delay": In(range(max_sample_delay + 1)),
         })
 
     def elaborate(self, platform):
@@ -163,11 +171,15 @@ class IOStreamer(wiring.Component):
                 m.d.comb += buffer_parts.oe.eq(latch_parts.oe)
 
         def delay(value, name):
-            for stage in range(latency):
+            stages = []
+            for stage in range(latency + self._max_sample_delay):
                 next_value = Signal.like(value, name=f"{name}_{stage}")
                 m.d.sync += next_value.eq(value)
                 value = next_value
-            return value
+                stages.append(value)
+            if self._max_sample_delay == 0:
+                return value
+            return Array(stages[latency - 1:])[self.sample_delay]
 
         i_en = delay(self.o_stream.valid & self.o_stream.ready &
                      self.o_stream.p.i_en, name="i_en")
@@ -176,17 +188,18 @@ class IOStreamer(wiring.Component):
         # This skid buffer is organized as a shift register to avoid any uncertainties associated
         # with the use of an async read memory. On platforms that have LUTRAM, this implementation
         # may be slightly worse than using LUTRAM, and may have to be revisited in the future.
+        depth = latency + self._max_sample_delay
         skid = Array(Signal(self.i_stream.payload.shape(), name=f"skid_{stage}")
-                     for stage in range(1 + latency))
+                     for stage in range(1 + depth))
         for skid_parts, buffer_parts in _iter_ioshape("i", self._ioshape, skid[0].port, buffer):
             m.d.comb += skid_parts.i.eq(buffer_parts.i)
         m.d.comb += skid[0].meta.eq(meta)
 
-        skid_at = Signal(range(1 + latency))
+        skid_at = Signal(range(1 + depth))
         with m.If(i_en & ~self.i_stream.ready):
-            # m.d.sync += Assert(skid_at != latency)
+            # m.d.sync += Assert(skid_at != depth)
             m.d.sync += skid_at.eq(skid_at + 1)
-            for n_shift in range(latency):
+            for n_shift in range(depth):
                 m.d.sync += skid[n_shift + 1].eq(skid[n_shift])
         with m.Elif((skid_at != 0) & self.i_stream.ready):
             m.d.sync += skid_at.eq(skid_at - 1)
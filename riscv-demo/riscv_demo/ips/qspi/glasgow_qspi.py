@@ -1,3 +1,6 @@
+import functools
+import operator
+
 from amaranth import *
 from amaranth.lib import enum, data, wiring, stream, io
 from amaranth.lib.wiring import In, Out, connect, flipped
@@ -21,8 +24,12 @@ class QSPIMode(enum.Enum, shape=3):
 
 
 class QSPIEnframer(wiring.Component):
-    def __init__(self, *, chip_count=1):
+    # With several lanes, each IO signal is as wide as the number of lanes, and all of the lanes
+    # are driven with the same data; i.e. the chips of a striped flash are sent the same command
+    # and address at once.
+    def __init__(self, *, chip_count=1, lane_count=1):
         assert chip_count >= 1
+        assert lane_count >= 1
 
         super().__init__({
             "octets": In(stream.Signature(data.StructLayout({
@@ -32,13 +39,14 @@ class QSPIEnframer(wiring.Component):
             }))),
             "frames": Out(IOClocker.i_stream_signature({
                 "sck": ("o",  1),
-                "io0": ("io", 1),
-                "io1": ("io", 1),
-                "io2": ("io", 1),
-                "io3": ("io", 1),
+                "io0": ("io", lane_count),
+                "io1": ("io", lane_count),
+                "io2": ("io", lane_count),
+                "io3": ("io", lane_count),
                 "cs":  ("o",  chip_count),
             }, meta_layout=QSPIMode))
         })
+        self._lane_count = lane_count
 
     def elaborate(self, platform):
         m = Module()
@@ -65,26 +73,27 @@ class QSPIEnframer(wiring.Component):
         m.d.comb += self.frames.p.port.sck.oe.eq(1) # (for bypass only)
 
         rev_data = self.octets.p.data[::-1] # MSB first
+        io_o = [Signal(name=f"io{n}_o") for n in range(4)]
+        m.d.comb += [
+            getattr(self.frames.p.port, f"io{n}").o.eq(io_o[n].replicate(self._lane_count))
+            for n in range(4)
+        ]
         with m.Switch(self.octets.p.mode):
             with m.Case(QSPIMode.PutX1, QSPIMode.Swap):
-                m.d.comb += self.frames.p.port.io0.o.eq(rev_data.word_select(cycle, 1))
+                m.d.comb += io_o[0].eq(rev_data.word_select(cycle, 1))
                 m.d.comb += self.frames.p.port.io0.oe.eq(0b1)
                 m.d.comb += self.frames.p.i_en.eq(self.octets.p.mode == QSPIMode.Swap)
             with m.Case(QSPIMode.GetX1):
                 m.d.comb += self.frames.p.port.io0.oe.eq(0b1)
                 m.d.comb += self.frames.p.i_en.eq(1)
             with m.Case(QSPIMode.PutX2):
-                m.d.comb += Cat(self.frames.p.port.io1.o,
-                                self.frames.p.port.io0.o).eq(rev_data.word_select(cycle, 2))
+                m.d.comb += Cat(io_o[1], io_o[0]).eq(rev_data.word_select(cycle, 2))
                 m.d.comb += Cat(self.frames.p.port.io1.oe,
                                 self.frames.p.port.io0.oe).eq(0b11)
             with m.Case(QSPIMode.GetX2):
                 m.d.comb += self.frames.p.i_en.eq(1)
             with m.Case(QSPIMode.PutX4):
-                m.d.comb += Cat(self.frames.p.port.io3.o,
-                                self.frames.p.port.io2.o,
-                                self.frames.p.port.io1.o,
-                                self.frames.p.port.io0.o).eq(rev_data.word_select(cycle, 4))
+                m.d.comb += Cat(io_o[3], io_o[2], io_o[1], io_o[0]).eq(rev_data.word_select(cycle, 4))
                 m.d.comb += Cat(self.frames.p.port.io3.oe,
                                 self.frames.p.port.io2.oe,
                                 self.frames.p.port.io1.oe,
@@ -99,18 +108,23 @@ class QSPIEnframer(wiring.Component):
 
 
 class QSPIDeframer(wiring.Component): # meow :3
-    def __init__(self):
+    # With several lanes, an octet is received on each lane at once, and they are concatenated
+    # (lane 0 in the low bits) into `octets.p.data`.
+    def __init__(self, *, lane_count=1):
+        assert lane_count >= 1
+
         super().__init__({
             "frames": In(IOStreamer.i_stream_signature({
-                "io0": ("io", 1),
-                "io1": ("io", 1),
-                "io2": ("io", 1),
-                "io3": ("io", 1),
+                "io0": ("io", lane_count),
+                "io1": ("io", lane_count),
+                "io2": ("io", lane_count),
+                "io3": ("io", lane_count),
             }, meta_layout=QSPIMode)),
             "octets": Out(stream.Signature(data.StructLayout({
-                "data": 8,
+                "data": 8 * lane_count,
             }))),
         })
+        self._lane_count = lane_count
 
     def elaborate(self, platform):
         m = Module()
@@ -128,18 +142,18 @@ class QSPIDeframer(wiring.Component): # meow :3
             with m.If(self.frames.ready):
                 m.d.sync += cycle.eq(Mux(self.octets.valid, 0, cycle + 1))
 
-        data_reg = Signal(8)
-        with m.Switch(self.frames.p.meta):
-            with m.Case(QSPIMode.GetX1, QSPIMode.Swap): # note: samples IO1
-                m.d.comb += self.octets.p.data.eq(Cat(self.frames.p.port.io1.i, data_reg))
-            with m.Case(QSPIMode.GetX2):
-                m.d.comb += self.octets.p.data.eq(Cat(self.frames.p.port.io0.i,
-                                                      self.frames.p.port.io1.i, data_reg))
-            with m.Case(QSPIMode.GetX4):
-                m.d.comb += self.octets.p.data.eq(Cat(self.frames.p.port.io0.i,
-                                                      self.frames.p.port.io1.i,
-                                                      self.frames.p.port.io2.i,
-                                                      self.frames.p.port.io3.i, data_reg))
+        data_reg = Signal(8 * self._lane_count)
+        for lane in range(self._lane_count):
+            lane_data = self.octets.p.data.word_select(lane, 8)
+            lane_reg  = data_reg.word_select(lane, 8)
+            io0, io1, io2, io3 = (getattr(self.frames.p.port, f"io{n}").i[lane] for n in range(4))
+            with m.Switch(self.frames.p.meta):
+                with m.Case(QSPIMode.GetX1, QSPIMode.Swap): # note: samples IO1
+                    m.d.comb += lane_data.eq(Cat(io1, lane_reg))
+                with m.Case(QSPIMode.GetX2):
+                    m.d.comb += lane_data.eq(Cat(io0, io1, lane_reg))
+                with m.Case(QSPIMode.GetX4):
+                    m.d.comb += lane_data.eq(Cat(io0, io1, io2, io3, lane_reg))
         with m.If(self.frames.valid & self.frames.ready):
             m.d.sync += data_reg.eq(self.octets.p.data)
 
@@ -147,22 +161,33 @@ class QSPIDeframer(wiring.Component): # meow :3
 
 
 class QSPIController(wiring.Component):
-    def __init__(self, ports, *, chip_count=1, use_ddr_buffers=False):
+    # With `lane_count` > 1, several flash chips share SCK and CS#, and each one has its own four
+    # IO lines (IO0-IO3 of lane 0 are `ports.io[0:4]`, those of lane 1 are `ports.io[4:8]`, etc).
+    # They receive the same command and address, and each octet of `i_octets` is the
+    # concatenation of an octet from every lane.
+    def __init__(self, ports, *, chip_count=1, lane_count=1, use_ddr_buffers=False,
+                 max_sample_delay=0):
         assert len(ports.sck) == 1 and ports.sck.direction in (io.Direction.Output, io.Direction.Bidir)
-        assert len(ports.io) == 4 and ports.io.direction == io.Direction.Bidir
+        assert len(ports.io) == 4 * lane_count and ports.io.direction == io.Direction.Bidir
         assert len(ports.cs) >= 1 and ports.cs.direction in (io.Direction.Output, io.Direction.Bidir)
 
+        def lanes(n):
+            return functools.reduce(operator.add,
+                                    (ports.io[4 * lane + n] for lane in range(lane_count)))
+
         self._ports = PortGroup(
             sck=ports.sck,
-            io0=ports.io[0],
-            io1=ports.io[1],
-            io2=ports.io[2],
-            io3=ports.io[3],
+            io0=lanes(0),
+            io1=lanes(1),
+            io2=lanes(2),
+            io3=lanes(3),
             cs=~ports.cs,
         )
 
         self._ddr = use_ddr_buffers
         self._chip_count = chip_count
+        self._lane_count = lane_count
+        self._max_sample_delay = max_sample_delay
 
         super().__init__({
             "o_octets": In(stream.Signature(data.StructLayout({
@@ -171,26 +196,28 @@ class QSPIController(wiring.Component):
                 "data": 8
             }))),
             "i_octets": Out(stream.Signature(data.StructLayout({
-                "data": 8
+                "data": 8 * lane_count
             }))),
 
             "divisor": In(16),
+            "sample_delay": In(range(max_sample_delay + 1)),
         })
 
     def elaborate(self, platform):
         ratio = (2 if self._ddr else 1)
         ioshape = {
             "sck": ("o",  1),
-            "io0": ("io", 1),
-            "io1": ("io", 1),
-            "io2": ("io", 1),
-            "io3": ("io", 1),
+            "io0": ("io", self._lane_count),
+            "io1": ("io", self._lane_count),
+            "io2": ("io", self._lane_count),
+            "io3": ("io", self._lane_count),
             "cs":  ("o",  len(self._ports.cs)),
         }
 
         m = Module()
 
-        m.submodules.enframer = enframer = QSPIEnframer(chip_count = self._chip_count)
+        m.submodules.enframer = enframer = QSPIEnframer(chip_count = self._chip_count,
+                                                               lane_count = self._lane_count)
         connect(m, controller=flipped(self.o_octets), enframer=enframer.octets)
 
         m.submodules.io_clocker = io_clocker = IOClocker(ioshape,
@@ -201,15 +228,18 @@ class QSPIController(wiring.Component):
         m.submodules.io_streamer = io_streamer = IOStreamer(ioshape, self._ports, init={
             "sck": {"o": 1, "oe": 1}, # Motorola "Mode 3" with clock idling high
             "cs":  {"o": 0, "oe": 1}, # deselected
-        }, ratio=ratio, meta_layout=QSPIMode)
+        }, ratio=ratio, meta_layout=QSPIMode, max_sample_delay=self._max_sample_delay)
         connect(m, io_clocker=io_clocker.o_stream, io_streamer=io_streamer.o_stream)
+        m.d.comb += io_streamer.sample_delay.eq(self.sample_delay)
 
-        m.submodules.deframer = deframer = QSPIDeframer()
+        m.submodules.deframer = deframer = QSPIDeframer(lane_count = self._lane_count)
+        def first_phase(i):
+            return i[0] if self._ddr else i
         m.d.comb += [ # connect() wouldn't work if DDR buffers are used
-            deframer.frames.p.port.io0.i.eq(io_streamer.i_stream.p.port.io0.i[0]),
-            deframer.frames.p.port.io1.i.eq(io_streamer.i_stream.p.port.io1.i[0]),
-            deframer.frames.p.port.io2.i.eq(io_streamer.i_stream.p.port.io2.i[0]),
-            deframer.frames.p.port.io3.i.eq(io_streamer.i_stream.p.port.io3.i[0]),
+            deframer.frames.p.port.io0.i.eq(first_phase(io_streamer.i_stream.p.port.io0.i)),
+            deframer.frames.p.port.io1.i.eq(first_phase(io_streamer.i_stream.p.port.io1.i)),
+            deframer.frames.p.port.io2.i.eq(first_phase(io_streamer.i_stream.p.port.io2.i)),
+            deframer.frames.p.port.io3.i.eq(first_phase(io_streamer.i_stream.p.port.io3.i)),
             deframer.frames.p.meta.eq(io_streamer.i_stream.p.meta),
             deframer.frames.valid.eq(io_streamer.i_stream.valid),
             io_streamer.i_stream.ready.eq(deframer.frames.ready),
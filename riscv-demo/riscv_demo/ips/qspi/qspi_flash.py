@@ -1,9 +1,9 @@
 from amaranth import *
 from amaranth.lib import enum, data, wiring, stream
-from amaranth.lib.wiring import In, Out
+from amaranth.lib.wiring import In, Out, flipped, connect
 from amaranth.utils import exact_log2
 
-from amaranth_soc import wishbone
+from amaranth_soc import csr, wishbone
 from amaranth_soc.memory import MemoryMap
 
 from ..ports import PortGroup
@@ -22,10 +22,110 @@ class QSPIFlashCommand(enum.Enum, shape=8):
     FastReadQuadInOut   = 0xEB
 
 
+class _LoadableFieldAction(csr.FieldAction):
+    """Read-write field that the peripheral can also load a value into."""
+    def __init__(self, shape, *, init=0):
+        super().__init__(shape, access="rw", members=(
+            ("data",      Out(shape)),
+            ("load",      In(1)),
+            ("load_data", In(shape)),
+        ))
+        self._storage = Signal(shape, init=init)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        with m.If(self.port.w_stb):
+            m.d.sync += self._storage.eq(self.port.w_data)
+        with m.Elif(self.load):
+            m.d.sync += self._storage.eq(self.load_data)
+
+        m.d.comb += [
+            self.port.r_data.eq(self._storage),
+            self.data.eq(self._storage),
+        ]
+
+        return m
+
+
 class WishboneQSPIFlashController(wiring.Component):
-    def __init__(self, *, addr_width, data_width):
+    """Read-only memory-mapped access to a QSPI flash, with registers to set up the SPI clock
+    and calibrate it.
+
+    Calibration first reads `CAL_OCTETS` bytes at `CalAddress` with the slowest divisor to try,
+    as a reference. It then reads them again with each sample delay at faster and faster
+    divisors, until none of the sample delays read the reference. The fastest divisor that
+    worked is loaded into `PhyConfig`, with the sample delay in the middle of the first range of
+    delays that worked. Reads from the bus wait until calibration is done, so firmware running
+    from the flash can calibrate it.
+
+    With `lane_count` > 1, the flash is striped over that many chips read in parallel (see
+    :class:`QSPIController`): byte `n` of the memory is at address `n // lane_count` of the chip
+    on lane `n % lane_count`. A word is then read in `lane_count` times fewer SPI clock cycles.
+    `CalAddress` is an address in the memory, like bus addresses.
+
+    With `continuous_read`, the flash is read with the Fast Read Quad I/O command (which needs
+    IO2 and IO3 to be connected, and the QE bit of the flash to be set), sending the mode bits
+    `CONTINUOUS_MODE_BITS` after the address. This puts the flash in continuous read mode, in
+    which the next read starts with the address, saving the 8 SCK cycles of the command. As the
+    flash may still be in continuous read mode when the controller is reset, the controller
+    first sends the mode bit reset sequence (all IOs high for 8 SCK cycles), which flashes not
+    in continuous read mode ignore as command 0xFF.
+
+    Registers
+    ---------
+    0x0  PhyConfig   bits 0-15: divisor; bits 16 and up: sample delay. Takes effect between reads.
+    0x4  CalAddress  address of the calibration pattern in the flash
+    0x8  CalControl  bits 0-15: slowest divisor to try; bit 16: write 1 to start calibration
+    0xc  CalStatus   bit 0: busy
+    """
+    CAL_OCTETS = 8
+
+    # Mode bits M5-4 = 0b10 keep the flash in continuous read mode after a Fast Read Quad I/O.
+    CONTINUOUS_MODE_BITS = 0xA0
+    # SCK cycles between the mode bits and the data of a Fast Read Quad I/O.
+    QUAD_DUMMY_CYCLES = 4
+
+    class PhyConfig(csr.Register, access="rw"):
+        def __init__(self, divisor_init, max_sample_delay):
+            super().__init__({
+                "divisor":      csr.Field(_LoadableFieldAction, 16, init=divisor_init),
+                "sample_delay": csr.Field(_LoadableFieldAction, range(max_sample_delay + 1)),
+            })
+
+    class CalAddress(csr.Register, access="rw"):
+        addr: csr.Field(csr.action.RW, 24)
+
+    class CalControl(csr.Register, access="rw"):
+        max_divisor: csr.Field(csr.action.RW, 16, init=8)
+        start:       csr.Field(csr.action.W,  1)
+
+    class CalStatus(csr.Register, access="r"):
+        busy: csr.Field(csr.action.R, 1)
+
+    def __init__(self, *, addr_width, data_width, lane_count=1, continuous_read=False,
+                 divisor_init=0, max_sample_delay=3):
+        assert max_sample_delay >= 1
+        assert lane_count in (1, 2, 4) and lane_count <= data_width // 8
+
+        self._lane_count       = lane_count
+        self._continuous_read  = continuous_read
+        self._divisor_init     = divisor_init
+        self._max_sample_delay = max_sample_delay
+
+        regs = csr.Builder(addr_width=4, data_width=8)
+
+        self._phy_config  = regs.add("phy_config",  self.PhyConfig(divisor_init, max_sample_delay),
+                                     offset=0x0)
+        self._cal_address = regs.add("cal_address", self.CalAddress(), offset=0x4)
+        self._cal_control = regs.add("cal_control", self.CalControl(), offset=0x8)
+        self._cal_status  = regs.add("cal_status",  self.CalStatus(),  offset=0xc)
+
+        self._bridge = csr.Bridge(regs.as_memory_map())
+
         super().__init__({
             "wb_bus": In(wishbone.Signature(addr_width=addr_width, data_width=data_width, granularity=8)),
+            "csr_bus": In(csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)),
             "spi_bus": Out(wiring.Signature({
                 "o_octets": Out(stream.Signature(data.StructLayout({
                     "chip": 1,
@@ -33,9 +133,10 @@ class WishboneQSPIFlashController(wiring.Component):
                     "data": 8,
                 }))),
                 "i_octets": In(stream.Signature(data.StructLayout({
-                    "data": 8,
+                    "data": 8 * lane_count,
                 }))),
                 "divisor": Out(16),
+                "sample_delay": Out(range(max_sample_delay + 1)),
             })),
         })
 
@@ -43,54 +144,160 @@ class WishboneQSPIFlashController(wiring.Component):
                                            data_width=8)
         self.wb_bus.memory_map.add_resource(self, name="data", size=0x400000) # FIXME
 
+        self.csr_bus.memory_map = self._bridge.bus.memory_map
+
     def elaborate(self, platform):
         m = Module()
 
-        wb_data_octets = self.wb_bus.data_width // 8
+        m.submodules.bridge = self._bridge
+        connect(m, flipped(self.csr_bus), self._bridge.bus)
+
+        # Each octet transfer reads an octet from every lane.
+        lane_shift   = exact_log2(self._lane_count)
+        lane_width   = 8 * self._lane_count
+        wb_transfers = self.wb_bus.data_width // lane_width
+        max_transfers = max(wb_transfers, self.CAL_OCTETS // self._lane_count)
 
         o_addr_count = Signal(range(3))
-        o_data_count = Signal(range(wb_data_octets + 1))
-        i_data_count = Signal(range(wb_data_octets + 1))
+        o_misc_count = Signal(range(max(4, self.QUAD_DUMMY_CYCLES)))
+        o_data_count = Signal(range(max_transfers + 1))
+        i_data_count = Signal(range(max_transfers + 1))
 
-        flash_addr = self.wb_bus.adr << exact_log2(wb_data_octets)
+        # The clock settings in use. They only change between reads, to the ones in `PhyConfig`
+        # or to the ones being tried during calibration.
+        divisor      = Signal(16, init=self._divisor_init)
+        sample_delay = Signal.like(self.spi_bus.sample_delay)
+        m.d.comb += [
+            self.spi_bus.divisor.eq(divisor),
+            self.spi_bus.sample_delay.eq(sample_delay),
+        ]
+
+        cal_pending   = Signal()
+        calibrating   = Signal()
+        cal_data      = Signal(8 * self.CAL_OCTETS)
+        cal_reference = Signal(8 * self.CAL_OCTETS)
+        cal_has_ref   = Signal()
+        # The first range of sample delays that read the reference at the current divisor.
+        cal_found     = Signal()
+        cal_closed    = Signal()
+        cal_first     = Signal.like(sample_delay)
+        cal_last      = Signal.like(sample_delay)
+        best_divisor  = Signal.like(divisor)
+        best_delay    = Signal.like(sample_delay)
+
+        with m.If(self._cal_control.f.start.w_stb & self._cal_control.f.start.w_data):
+            m.d.sync += cal_pending.eq(1)
+        m.d.comb += self._cal_status.f.busy.r_data.eq(cal_pending | calibrating)
+
+        phy_divisor      = self._phy_config.f.divisor
+        phy_sample_delay = self._phy_config.f.sample_delay
+
+        flash_addr     = self.wb_bus.adr << exact_log2(wb_transfers)
+        read_addr      = Mux(calibrating, self._cal_address.f.addr.data >> lane_shift, flash_addr)
+        read_transfers = Mux(calibrating, self.CAL_OCTETS // self._lane_count, wb_transfers)
+
+        if self._continuous_read:
+            read_command, addr_mode, data_mode = \
+                QSPIFlashCommand.FastReadQuadInOut, QSPIMode.PutX4, QSPIMode.GetX4
+        else:
+            read_command, addr_mode, data_mode = \
+                QSPIFlashCommand.Read, QSPIMode.PutX1, QSPIMode.GetX1
+        # The flash is in continuous read mode, and the next read starts with the address.
+        continuous = Signal()
+
+        with m.FSM(init="Exit-Continuous" if self._continuous_read else "Wait"):
+            if self._continuous_read:
+                with m.State("Exit-Continuous"):
+                    m.d.comb += self.spi_bus.o_octets.p.chip.eq(1)
+                    m.d.comb += self.spi_bus.o_octets.p.mode.eq(QSPIMode.PutX4)
+                    m.d.comb += self.spi_bus.o_octets.p.data.eq(0xff)
+                    m.d.comb += self.spi_bus.o_octets.valid.eq(1)
+                    with m.If(self.spi_bus.o_octets.ready):
+                        m.d.sync += o_misc_count.eq(o_misc_count + 1)
+                        with m.If(o_misc_count == 3):
+                            m.d.sync += o_misc_count.eq(0)
+                            m.next = "SPI-Deselect"
 
-        with m.FSM():
             with m.State("Wait"):
                 m.d.comb += self.spi_bus.o_octets.p.chip.eq(1)
                 m.d.comb += self.spi_bus.o_octets.p.mode.eq(QSPIMode.PutX1)
-                m.d.comb += self.spi_bus.o_octets.p.data.eq(QSPIFlashCommand.Read)
-                with m.If(self.wb_bus.cyc & self.wb_bus.stb & ~self.wb_bus.we):
-                    m.d.comb += self.spi_bus.o_octets.valid.eq(1)
-                    with m.If(self.spi_bus.o_octets.ready):
+                m.d.comb += self.spi_bus.o_octets.p.data.eq(read_command)
+                with m.If(cal_pending & ~calibrating):
+                    m.d.sync += [
+                        cal_pending.eq(0),
+                        calibrating.eq(1),
+                        cal_has_ref.eq(0),
+                        divisor.eq(self._cal_control.f.max_divisor.data),
+                        sample_delay.eq(0),
+                    ]
+                with m.Elif(~calibrating & ((divisor != phy_divisor.data) |
+                                            (sample_delay != phy_sample_delay.data))):
+                    m.d.sync += [
+                        divisor.eq(phy_divisor.data),
+                        sample_delay.eq(phy_sample_delay.data),
+                    ]
+                with m.Elif(calibrating | (self.wb_bus.cyc & self.wb_bus.stb & ~self.wb_bus.we)):
+                    with m.If(continuous):
                         m.d.sync += o_addr_count.eq(2)
                         m.next = "SPI-Address"
+                    with m.Else():
+                        m.d.comb += self.spi_bus.o_octets.valid.eq(1)
+                        with m.If(self.spi_bus.o_octets.ready):
+                            m.d.sync += o_addr_count.eq(2)
+                            m.next = "SPI-Address"
 
             with m.State("SPI-Address"):
                 m.d.comb += self.spi_bus.o_octets.p.chip.eq(1)
-                m.d.comb += self.spi_bus.o_octets.p.mode.eq(QSPIMode.PutX1)
-                m.d.comb += self.spi_bus.o_octets.p.data.eq(flash_addr.word_select(o_addr_count, 8))
+                m.d.comb += self.spi_bus.o_octets.p.mode.eq(addr_mode)
+                m.d.comb += self.spi_bus.o_octets.p.data.eq(read_addr.word_select(o_addr_count, 8))
                 m.d.comb += self.spi_bus.o_octets.valid.eq(1)
                 with m.If(self.spi_bus.o_octets.ready):
                     with m.If(o_addr_count != 0):
                         m.d.sync += o_addr_count.eq(o_addr_count - 1)
                     with m.Else():
-                        m.next = "SPI-Data-Read"
+                        m.next = "SPI-Mode" if self._continuous_read else "SPI-Data-Read"
+
+            if self._continuous_read:
+                with m.State("SPI-Mode"):
+                    m.d.comb += self.spi_bus.o_octets.p.chip.eq(1)
+                    m.d.comb += self.spi_bus.o_octets.p.mode.eq(QSPIMode.PutX4)
+                    m.d.comb += self.spi_bus.o_octets.p.data.eq(self.CONTINUOUS_MODE_BITS)
+                    m.d.comb += self.spi_bus.o_octets.valid.eq(1)
+                    with m.If(self.spi_bus.o_octets.ready):
+                        m.d.sync += continuous.eq(1)
+                        m.next = "SPI-Dummy"
+
+                with m.State("SPI-Dummy"):
+                    # Each dummy octet is a single SCK cycle with the IOs released.
+                    m.d.comb += self.spi_bus.o_octets.p.chip.eq(1)
+                    m.d.comb += self.spi_bus.o_octets.p.mode.eq(QSPIMode.Dummy)
+                    m.d.comb += self.spi_bus.o_octets.valid.eq(1)
+                    with m.If(self.spi_bus.o_octets.ready):
+                        m.d.sync += o_misc_count.eq(o_misc_count + 1)
+                        with m.If(o_misc_count == self.QUAD_DUMMY_CYCLES - 1):
+                            m.d.sync += o_misc_count.eq(0)
+                            m.next = "SPI-Data-Read"
 
             with m.State("SPI-Data-Read"):
                 m.d.comb += self.spi_bus.o_octets.p.chip.eq(1)
-                m.d.comb += self.spi_bus.o_octets.p.mode.eq(QSPIMode.GetX1)
-                with m.If(o_data_count != wb_data_octets):
+                m.d.comb += self.spi_bus.o_octets.p.mode.eq(data_mode)
+                with m.If(o_data_count != read_transfers):
                     m.d.comb += self.spi_bus.o_octets.valid.eq(1)
                     with m.If(self.spi_bus.o_octets.ready):
                         m.d.sync += o_data_count.eq(o_data_count + 1)
 
                 m.d.comb += self.spi_bus.i_octets.ready.eq(1)
                 with m.If(self.spi_bus.i_octets.valid):
-                    m.d.sync += self.wb_bus.dat_r.word_select(i_data_count, 8).eq(self.spi_bus.i_octets.p.data)
-                    with m.If(i_data_count != wb_data_octets - 1):
+                    with m.If(calibrating):
+                        m.d.sync += cal_data.word_select(i_data_count, lane_width).eq(
+                            self.spi_bus.i_octets.p.data)
+                    with m.Else():
+                        m.d.sync += self.wb_bus.dat_r.word_select(i_data_count, lane_width).eq(
+                            self.spi_bus.i_octets.p.data)
+                    with m.If(i_data_count != read_transfers - 1):
                         m.d.sync += i_data_count.eq(i_data_count + 1)
                     with m.Else():
-                        m.d.sync += self.wb_bus.ack.eq(1)
+                        m.d.sync += self.wb_bus.ack.eq(~calibrating)
                         m.d.sync += o_data_count.eq(0)
                         m.d.sync += i_data_count.eq(0)
                         m.next = "SPI-Deselect"
@@ -101,6 +308,74 @@ class WishboneQSPIFlashController(wiring.Component):
                 m.d.comb += self.spi_bus.o_octets.p.mode.eq(QSPIMode.Dummy)
                 m.d.comb += self.spi_bus.o_octets.valid.eq(1)
                 with m.If(self.spi_bus.o_octets.ready):
-                    m.next = "Wait"
+                    with m.If(calibrating):
+                        m.next = "Cal-Check"
+                    with m.Else():
+                        m.next = "Wait"
+
+            with m.State("Cal-Check"):
+                match     = cal_data == cal_reference
+                found     = cal_found | match
+                first     = Mux(cal_found, cal_first, sample_delay)
+                last      = Mux(match & ~cal_closed, sample_delay, cal_last)
+                # Try the next divisor (from the first sample delay), or finish.
+                next_divisor = [
+                    divisor.eq(divisor - 1),
+                    sample_delay.eq(0),
+                    cal_found.eq(0),
+                    cal_closed.eq(0),
+                ]
+
+                with m.If(~cal_has_ref):
+                    m.d.sync += [
+                        cal_reference.eq(cal_data),
+                        cal_has_ref.eq(1),
+                        best_divisor.eq(divisor),
+                        best_delay.eq(0),
+                    ]
+                    with m.If(divisor == 0):
+                        m.next = "Cal-Done"
+                    with m.Else():
+                        m.d.sync += next_divisor
+                        m.next = "Wait"
+
+                with m.Else():
+                    m.d.sync += [
+                        cal_found.eq(found),
+                        cal_closed.eq(cal_closed | (cal_found & ~match)),
+                        cal_first.eq(first),
+                        cal_last.eq(last),
+                    ]
+                    with m.If(sample_delay != self._max_sample_delay):
+                        m.d.sync += sample_delay.eq(sample_delay + 1)
+                        m.next = "Wait"
+                    with m.Elif(found):
+                        m.d.sync += [
+                            best_divisor.eq(divisor),
+                            best_delay.eq((first + last) >> 1),
+                        ]
+                        with m.If(divisor == 0):
+                            m.next = "Cal-Done"
+                        with m.Else():
+                            m.d.sync += next_divisor
+                            m.next = "Wait"
+                    with m.Else():
+                        m.next = "Cal-Done"
+
+            with m.State("Cal-Done"):
+                # `best_*` may have been updated on the way into this state, so the result is
+                # applied from here.
+                m.d.comb += [
+                    phy_divisor.load.eq(1),
+                    phy_divisor.load_data.eq(best_divisor),
+                    phy_sample_delay.load.eq(1),
+                    phy_sample_delay.load_data.eq(best_delay),
+                ]
+                m.d.sync += [
+                    divisor.eq(best_divisor),
+                    sample_delay.eq(best_delay),
+                    calibrating.eq(0),
+                ]
+                m.next = "Wait"
 
         return m
@@ -1,2 +1,3 @@
 from .periph import *
 from .phy import *
+from .loader import *
@@ -0,0 +1,234 @@
+import struct
+import zlib
+
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out, flipped, connect
+from amaranth.utils import ceil_log2
+
+from amaranth_soc import csr, wishbone
+from amaranth_stdio.serial import AsyncSerialRX
+
+
+__all__ = ["UARTLoader", "frame_image", "boot_rom"]
+
+
+def frame_image(image):
+    """Return the frame that loads `image` with a :class:`UARTLoader`; the image is padded to
+    a whole number of words."""
+    image = bytes(image) + b"\0" * (-len(image) % 4)
+    return (UARTLoader.MAGIC + struct.pack("<I", len(image)) + image +
+            struct.pack("<I", zlib.crc32(image)))
+
+
+def _crc32_byte(crc, byte):
+    # One byte of the (reflected) CRC-32 of zlib, a bit at a time.
+    crc = crc ^ byte
+    for _ in range(8):
+        crc = Mux(crc[0], (crc >> 1) ^ 0xedb88320, crc >> 1)
+    return crc
+
+
+class UARTLoader(wiring.Component):
+    """Loader of a memory image received on the line of a UART, at its own baud rate.
+
+    The loader listens to the RX line alongside the UART receiver. A frame is the 4 bytes of
+    :attr:`MAGIC`, the length of the image in bytes as a little-endian word, the image, and the
+    CRC-32 of the image (that of :func:`zlib.crc32`) as a little-endian word; see
+    :func:`frame_image`. Once the magic is received, `cpu_reset` is asserted, and each word of the
+    image is written to memory from `mem_base` by `wb_bus`. At the end of the frame, `cpu_reset`
+    is released, and the image is marked as loaded if its CRC matches; a CPU that boots from
+    :func:`boot_rom` then jumps to it.
+
+    A frame is rejected if the image is larger than `mem_size` or not a whole number of words, or
+    if no byte is received for `timeout` cycles; `cpu_reset` is released all the same.
+
+    Registers
+    ---------
+    0x00  Status  bit 0: loaded (the last frame was loaded); bit 1: error (it was rejected)
+    """
+    MAGIC = b"BOOT"
+
+    class Status(csr.Register, access="r"):
+        loaded: csr.Field(csr.action.R, 1)
+        error:  csr.Field(csr.action.R, 1)
+
+    def __init__(self, *, divisor, mem_base, mem_size, timeout):
+        if mem_base % 4 != 0 or mem_size % 4 != 0:
+            raise ValueError(f"Memory at {mem_base:#x} of size {mem_size:#x} is not word-aligned")
+        self._divisor  = divisor
+        self._mem_base = mem_base
+        self._mem_size = mem_size
+        self._timeout  = timeout
+
+        regs = csr.Builder(addr_width=2, data_width=8)
+        self._status = regs.add("status", self.Status(), offset=0x0)
+        self._bridge = csr.Bridge(regs.as_memory_map())
+
+        super().__init__({
+            "rx":        In(1, init=1),
+            "cpu_reset": Out(1),
+            "wb_bus":    Out(wishbone.Signature(addr_width=30, data_width=32, granularity=8)),
+            "csr_bus":   In(csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)),
+        })
+        self.csr_bus.memory_map = self._bridge.bus.memory_map
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = self._bridge
+        connect(m, flipped(self.csr_bus), self._bridge.bus)
+
+        m.submodules.serial = serial = \
+            AsyncSerialRX(divisor=self._divisor, divisor_bits=ceil_log2(self._divisor + 1))
+        m.d.comb += [
+            serial.i.eq(self.rx),
+            serial.ack.eq(1),
+        ]
+
+        # The last four bytes received, the last one in the top byte; i.e. the little-endian word
+        # that they end.
+        shreg = Signal(32)
+        word  = Cat(shreg[8:], serial.data)
+        with m.If(serial.rdy):
+            m.d.sync += shreg.eq(word)
+
+        count   = Signal(2)
+        length  = Signal(32)
+        left    = Signal(range(self._mem_size + 1))
+        crc     = Signal(32)
+        timer   = Signal(range(self._timeout + 1))
+        loaded  = Signal()
+        error   = Signal()
+        loading = Signal()
+
+        # Words are written while the next ones are received; a word takes much less time to
+        # write than to receive, as the CPU is held in reset and doesn't compete for the memory.
+        pending = Signal()
+        m.d.comb += [
+            self.wb_bus.cyc.eq(pending),
+            self.wb_bus.stb.eq(pending),
+            self.wb_bus.we.eq(1),
+            self.wb_bus.sel.eq(0b1111),
+        ]
+        with m.If(self.wb_bus.ack):
+            m.d.sync += [
+                pending.eq(0),
+                self.wb_bus.adr.eq(self.wb_bus.adr + 1),
+            ]
+
+        # Frames are abandoned when the line has been idle for `timeout` cycles.
+        with m.If(serial.rdy):
+            m.d.sync += timer.eq(self._timeout)
+        with m.Elif(timer != 0):
+            m.d.sync += timer.eq(timer - 1)
+
+        def start_field(state):
+            m.d.sync += count.eq(0)
+            m.next = state
+
+        def finish(ok):
+            m.d.sync += [
+                loaded.eq(ok),
+                error.eq(~ok),
+                loading.eq(0),
+            ]
+            m.next = "MAGIC"
+
+        with m.FSM():
+            with m.State("MAGIC"):
+                with m.If(serial.rdy & (word == int.from_bytes(self.MAGIC, "little"))):
+                    m.d.sync += [
+                        loaded.eq(0),
+                        error.eq(0),
+                        loading.eq(1),
+                    ]
+                    start_field("LENGTH")
+
+            with m.State("LENGTH"):
+                with m.If(serial.rdy):
+                    m.d.sync += count.eq(count + 1)
+                    with m.If(count == 3):
+                        m.d.sync += length.eq(word)
+                        m.next = "CHECK"
+                with m.Elif(timer == 0):
+                    finish(C(0))
+
+            with m.State("CHECK"):
+                with m.If((length > self._mem_size) | (length[:2] != 0)):
+                    finish(C(0))
+                with m.Else():
+                    m.d.sync += [
+                        left.eq(length),
+                        crc.eq(0xffffffff),
+                        self.wb_bus.adr.eq(self._mem_base // 4),
+                    ]
+                    with m.If(length == 0):
+                        start_field("CRC")
+                    with m.Else():
+                        start_field("DATA")
+
+            with m.State("DATA"):
+                with m.If(serial.rdy):
+                    m.d.sync += [
+                        count.eq(count + 1),
+                        left.eq(left - 1),
+                        crc.eq(_crc32_byte(crc, serial.data)),
+                    ]
+                    with m.If(count == 3):
+                        m.d.sync += [
+                            self.wb_bus.dat_w.eq(word),
+                            pending.eq(1),
+                        ]
+                    with m.If(left == 1):
+                        start_field("CRC")
+                with m.Elif(timer == 0):
+                    finish(C(0))
+
+            with m.State("CRC"):
+                with m.If(serial.rdy):
+                    m.d.sync += count.eq(count + 1)
+                    with m.If(count == 3):
+                        m.next = "DONE"
+                with m.Elif(timer == 0):
+                    finish(C(0))
+
+            with m.State("DONE"):
+                with m.If(~pending):
+                    finish(shreg == ~crc)
+
+        m.d.comb += [
+            self.cpu_reset.eq(loading),
+            self._status.f.loaded.r_data.eq(loaded),
+            self._status.f.error.r_data.eq(error),
+        ]
+
+        return m
+
+
+def _lui(rd, imm):
+    assert imm % 0x1000 == 0
+    return (imm & 0xfffff000) | rd << 7 | 0b0110111
+
+def _i_type(opcode, funct3, rd, rs1, imm):
+    return (imm & 0xfff) << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | opcode
+
+def _bne(rs1, rs2, offset):
+    return ((offset >> 12 & 1) << 31 | (offset >> 5 & 0x3f) << 25 | rs2 << 20 | rs1 << 15 |
+            0b001 << 12 | (offset >> 1 & 0xf) << 8 | (offset >> 11 & 1) << 7 | 0b1100011)
+
+
+def boot_rom(*, status_addr, image_addr, fallback_addr):
+    """Return the words of a boot ROM that jumps to the image loaded by a :class:`UARTLoader` at
+    `image_addr` if the `loaded` bit of its status register (at `status_addr`) is set, and to
+    `fallback_addr` otherwise. The addresses must be 4 KiB aligned."""
+    zero, t0, t1 = 0, 5, 6
+    return [
+        _lui(t0, status_addr),                    # lui  t0, %hi(status_addr)
+        _i_type(0b0000011, 0b100, t1, t0, 0),     # lbu  t1, 0(t0)
+        _i_type(0b0010011, 0b111, t1, t1, 1),     # andi t1, t1, 1
+        _lui(t0, image_addr),                     # lui  t0, %hi(image_addr)
+        _bne(t1, zero, 8),                        # bnez t1, 1f
+        _lui(t0, fallback_addr),                  # lui  t0, %hi(fallback_addr)
+        _i_type(0b1100111, 0b000, zero, t0, 0),   # 1: jr t0
+    ]
@@ -10,4 +10,122 @@ from .phy import UARTPhy
 __all__ = ["UARTPeripheral"]
 
 
-# TODO
+class _PhyConfigFieldAction(csr.FieldAction):
+    """Read-write field that can only be written while `w_en` is asserted (i.e. while the PHY
+    is held in reset)."""
+    def __init__(self, shape, *, init=0):
+        super().__init__(shape, access="rw", members=(
+            ("data", Out(shape)),
+            ("w_en", In(unsigned(1))),
+        ))
+        self._storage = Signal(shape, init=init)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        with m.If(self.w_en & self.port.w_stb):
+            m.d.sync += self._storage.eq(self.port.w_data)
+
+        m.d.comb += [
+            self.port.r_data.eq(self._storage),
+            self.data.eq(self._storage),
+        ]
+
+        return m
+
+
+class UARTPeripheral(wiring.Component):
+    """UART peripheral with a receiver and a transmitter, each controlled by its own registers.
+
+    The PHY of a direction is held in reset until it is enabled in its `Config` register, and its
+    `PhyConfig` register (the baud rate divisor) can only be written while it is disabled.
+
+    Registers (receiver at 0x000, transmitter at 0x200)
+    ----------------------------------------------------
+    0x00  Config     bit 0: enable
+    0x04  PhyConfig  divisor
+    0x08  Status     bit 0: ready; receiver only, write 1 to clear: bit 1: overflow, bit 2: error
+    0x0c  Data       receiver: read to dequeue a byte; transmitter: write to enqueue a byte
+    """
+    class Config(csr.Register, access="rw"):
+        enable: csr.Field(csr.action.RW, 1)
+
+    class PhyConfig(csr.Register, access="rw"):
+        def __init__(self, init):
+            super().__init__({"divisor": csr.Field(_PhyConfigFieldAction, 24, init=init)})
+
+    class RxStatus(csr.Register, access="rw"):
+        ready:    csr.Field(csr.action.R,    1)
+        overflow: csr.Field(csr.action.RW1C, 1)
+        error:    csr.Field(csr.action.RW1C, 1)
+
+    class TxStatus(csr.Register, access="r"):
+        ready: csr.Field(csr.action.R, 1)
+
+    class RxData(csr.Register, access="r"):
+        data: csr.Field(csr.action.R, 8)
+
+    class TxData(csr.Register, access="w"):
+        data: csr.Field(csr.action.W, 8)
+
+    def __init__(self, *, divisor_init):
+        regs = csr.Builder(addr_width=10, data_width=8)
+
+        self._rx_config     = regs.add("rx_config",     self.Config(),    offset=0x000)
+        self._rx_phy_config = regs.add("rx_phy_config", self.PhyConfig(divisor_init),
+                                       offset=0x004)
+        self._rx_status     = regs.add("rx_status",     self.RxStatus(),  offset=0x008)
+        self._rx_data       = regs.add("rx_data",       self.RxData(),    offset=0x00c)
+
+        self._tx_config     = regs.add("tx_config",     self.Config(),    offset=0x200)
+        self._tx_phy_config = regs.add("tx_phy_config", self.PhyConfig(divisor_init),
+                                       offset=0x204)
+        self._tx_status     = regs.add("tx_status",     self.TxStatus(),  offset=0x208)
+        self._tx_data       = regs.add("tx_data",       self.TxData(),    offset=0x20c)
+
+        self._bridge = csr.Bridge(regs.as_memory_map())
+
+        super().__init__({
+            "csr_bus": In(csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)),
+            "phy":     Out(UARTPhy.Signature()),
+        })
+        self.csr_bus.memory_map = self._bridge.bus.memory_map
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = self._bridge
+        connect(m, flipped(self.csr_bus), self._bridge.bus)
+
+        # Receiver
+
+        m.d.comb += [
+            self.phy.rx.reset.eq(~self._rx_config.f.enable.data),
+
+            self._rx_phy_config.f.divisor.w_en.eq(~self._rx_config.f.enable.data),
+            self.phy.rx.config.divisor.eq(self._rx_phy_config.f.divisor.data),
+
+            self._rx_status.f.ready.r_data.eq(self.phy.rx.symbols.valid),
+            self._rx_status.f.overflow.set.eq(self.phy.rx.overflow),
+            self._rx_status.f.error.set.eq(self.phy.rx.error),
+
+            self._rx_data.f.data.r_data.eq(self.phy.rx.symbols.payload),
+            self.phy.rx.symbols.ready.eq(self._rx_data.f.data.r_stb),
+        ]
+
+        # Transmitter
+
+        m.d.comb += [
+            self.phy.tx.reset.eq(~self._tx_config.f.enable.data),
+
+            self._tx_phy_config.f.divisor.w_en.eq(~self._tx_config.f.enable.data),
+            self.phy.tx.config.divisor.eq(self._tx_phy_config.f.divisor.data),
+
+            self._tx_status.f.ready.r_data.eq(self.phy.tx.symbols.ready &
+                                              self._tx_config.f.enable.data),
+
+            self.phy.tx.symbols.payload.eq(self._tx_data.f.data.w_data),
+            self.phy.tx.symbols.valid.eq(self._tx_data.f.data.w_stb),
+        ]
+
+        return m
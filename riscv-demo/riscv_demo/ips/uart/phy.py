@@ -17,6 +17,8 @@ class UARTPhyRx(wiring.Component):
                 "symbols":  In(stream.Signature(unsigned(8))),
                 "overflow": In(1),
                 "error":    In(1),
+                # The RX line itself, for other receivers of it (e.g. a `UARTLoader`).
+                "line":     In(1, init=1),
             })
 
     def __init__(self, port, clk_freq):
@@ -44,6 +46,8 @@ class UARTPhyRx(wiring.Component):
 
             self.overflow.eq(lower.err.overflow),
             self.error.eq(lower.err.frame),
+
+            self.line.eq(io_buffer.i),
         ]
 
         return m
@@ -0,0 +1,116 @@
+import os
+import re
+import time
+import argparse
+import subprocess
+
+from .sim import doit_build
+from .yosys import run_yosys
+
+
+__all__ = ["parse_meter", "bench_pipeline"]
+
+
+BENCH_DIR = os.path.join("build", "pipelines")
+
+
+def parse_meter(stderr):
+    """Return the number of cycles simulated and the wall-clock time taken, as reported by the
+    simulator at exit, or ``None`` for either if it wasn't reported."""
+    stopped = re.search(r"Simulation stopped after (\d+) cycles", stderr)
+    elapsed = re.search(r"([\d.]+) s of wall-clock time", stderr)
+    return (int(stopped[1]) if stopped else None,
+            float(elapsed[1]) if elapsed else None)
+
+
+def bench_pipeline(params, pipeline, *, firmware, cycles, bench_dir=BENCH_DIR, models_obj=None):
+    """Generate and compile the simulator of the `DemoSoC` with `params` using `pipeline`, and
+    run `firmware` on it for `cycles` cycles.
+
+    Returns a dict with the size of the generated code, the time taken by Yosys and by compiling
+    the generated code, and the simulation speed in kcycles/s.
+    """
+    # Imported here so that the results can be parsed without the design's dependencies.
+    from .steps.sim import _SimTop, _SimPlatform
+
+    pipeline_dir = os.path.join(bench_dir, pipeline)
+    os.makedirs(pipeline_dir, exist_ok=True)
+    if models_obj is None:
+        models_obj = doit_build.build_models(bench_dir)
+    _SimPlatform(build_dir=os.path.abspath(pipeline_dir), pipeline=pipeline) \
+        .build(_SimTop(**params))
+
+    start = time.perf_counter()
+    run_yosys(["-q", "sim_soc.ys"], cwd=pipeline_dir, check=True)
+    yosys_time = time.perf_counter() - start
+    with open(os.path.join(pipeline_dir, "sim_soc.cc"), "rb") as f:
+        code = f.read()
+
+    # Only the generated code is timed; the rest of the simulator is the same for each pipeline.
+    includes = doit_build.includes(".")
+    start = time.perf_counter()
+    doit_build.run_compiler([doit_build.ZIG_CXX, doit_build.CXXFLAGS, includes,
+                             "-c -o sim_soc.o sim_soc.cc"], cwd=pipeline_dir)
+    compile_time = time.perf_counter() - start
+    exe = "sim_soc.exe" if os.name == "nt" else "sim_soc"
+    doit_build.run_compiler([doit_build.ZIG_CXX, doit_build.CXXFLAGS, includes,
+                             f"-o {exe} sim_soc.o {doit_build.SOURCE_DIR}/main.cc {models_obj}",
+                             doit_build.LIBS], cwd=pipeline_dir)
+
+    result = subprocess.run(
+        [os.path.join(".", exe), "--firmware", os.path.abspath(firmware),
+         "--cycles", str(cycles), "--meter", "0"],
+        cwd=pipeline_dir, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, text=True)
+    run_cycles, run_time = parse_meter(result.stderr)
+    return {
+        "pipeline":  pipeline,
+        "code_kb":   round(len(code) / 1024),
+        "lines":     code.count(b"\n"),
+        "yosys_s":   round(yosys_time, 1),
+        "compile_s": round(compile_time, 1),
+        "kcycles/s": round(run_cycles / run_time / 1000, 1) if run_cycles and run_time else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the size of the generated code, the compile time, and the "
+                    "simulation speed of the CXXRTL simulator built with each Yosys pipeline.")
+    parser.add_argument("pipelines", nargs="*", metavar="PIPELINE",
+        help="pipelines to compare (default: all of them)")
+    parser.add_argument("--config", default="chipflow.toml", metavar="FILE",
+        help="take the DemoSoC parameters from the [chipflow.soc] section of FILE "
+             "(default: %(default)s)")
+    parser.add_argument("--firmware", default="zephyr.bin", metavar="FILE",
+        help="firmware image to run (default: %(default)s)")
+    parser.add_argument("--cycles", type=int, default=1_000_000, metavar="N",
+        help="simulate N cycles with each pipeline (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        import tomllib
+    except ImportError: # Python < 3.11
+        import tomli as tomllib
+    # Imported here so that `--help` works without the design's dependencies.
+    from .soc import soc_params
+    from .steps.sim import PIPELINES
+
+    with open(args.config, "rb") as f:
+        params = soc_params(tomllib.load(f))
+
+    pipelines = args.pipelines or list(PIPELINES)
+    models_obj = doit_build.build_models(BENCH_DIR)
+    rows = [bench_pipeline(params, pipeline, firmware=args.firmware, cycles=args.cycles,
+                           models_obj=models_obj)
+            for pipeline in pipelines]
+
+    columns = list(rows[0])
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+    print(*(f"{column:>{width}}" for column, width in zip(columns, widths)))
+    for row in rows:
+        print(*(f"{str(row[column]):>{width}}" for column, width in zip(columns, widths)))
+
+
+if __name__ == "__main__":
+    main()
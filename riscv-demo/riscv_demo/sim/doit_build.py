@@ -1,13 +1,17 @@
 import os
 import sys
+import hashlib
+import subprocess
 import importlib.resources
 
 from doit.action import CmdAction
+from doit.cmd_base import ModuleTaskLoader
+
+from ..yosys import find_yosys, run_yosys
 
 
 OUTPUT_DIR  = "./build/sim"
 SOURCE_DIR  = importlib.resources.files("riscv_demo") / "sim"
-RUNTIME_DIR = importlib.resources.files("yowasp_yosys") / "share/include/backends/cxxrtl/runtime"
 
 ZIG_CXX  = f"{sys.executable} -m ziglang c++"
 if os.name == "nt":
@@ -15,26 +19,80 @@ if os.name == "nt":
     LIBS = "-lws2_32"
 else:
     CXXFLAGS = f"-O3 -g -std=c++17 -Wno-array-bounds -Wno-shift-count-overflow -fbracket-depth=1024"
-    LIBS = ""
-INCLUDES = f"-I {OUTPUT_DIR} -I {SOURCE_DIR}/vendor -I {RUNTIME_DIR}"
+    LIBS = "-pthread"
+
+
+def includes(*dirs):
+    """Return the include options for compiling the simulator, with `dirs` (e.g. that of the
+    generated code) first. The CXXRTL runtime is that of the Yosys in use, which is only looked
+    for here, so that importing this module doesn't run Yosys."""
+    return " ".join([*(f"-I {dir}" for dir in dirs), f"-I {SOURCE_DIR}/vendor",
+                     f"-I {find_yosys().runtime_dir}"])
+
+
+def run_compiler(args, cwd=None):
+    """Run the compiler command line made of `args`, like the tasks below (through the shell)."""
+    subprocess.run(" ".join(args), shell=True, cwd=cwd, check=True)
+
+
+def build_models(build_dir):
+    """Compile the peripheral models into an object file in `build_dir`, and return its absolute
+    path.
+
+    The models don't depend on the design, so tools that build many simulators share one object
+    file. It is only compiled again when the model sources, or the CXXRTL runtime of the Yosys in
+    use, change.
+    """
+    sources = [SOURCE_DIR / "models.cc", SOURCE_DIR / "models.h"]
+    digest = hashlib.sha256(b"".join(source.read_bytes() for source in sources) +
+                            CXXFLAGS.encode() + includes().encode()).hexdigest()[:16]
+    models_obj = os.path.join(build_dir, f"models-{digest}.o")
+    if not os.path.exists(models_obj):
+        os.makedirs(build_dir, exist_ok=True)
+        run_compiler([ZIG_CXX, CXXFLAGS, includes(),
+                      f"-c -o {models_obj}.tmp {SOURCE_DIR}/models.cc"])
+        os.replace(f"{models_obj}.tmp", models_obj)
+    return os.path.abspath(models_obj)
+
+
+def _build_sim_rtlil_cmd(pipeline):
+    return "pdm run chipflow sim build-rtlil" + (f" --pipeline {pipeline}" if pipeline else "")
 
 
 def task_build_sim_rtlil():
     return {
         "actions": [
-            f"pdm run chipflow sim build-rtlil",
+            CmdAction(_build_sim_rtlil_cmd),
         ],
         "targets": [
             f"{OUTPUT_DIR}/sim_soc.ys",
             f"{OUTPUT_DIR}/sim_soc.il",
         ],
+        "params": [
+            # Empty for the pipeline of the last build.
+            {"name": "pipeline", "long": "pipeline", "default": ""},
+        ],
     }
 
 
+def make_loader(build_rtlil):
+    """Return a loader of these tasks that builds the RTLIL by calling `build_rtlil(pipeline=...)`
+    in this process, rather than in a `chipflow sim build-rtlil` process that would have to import
+    Amaranth and the design again."""
+    def task_build_sim_rtlil_in_process():
+        return {**task_build_sim_rtlil(), "actions": [build_rtlil]}
+
+    return ModuleTaskLoader({**globals(), "task_build_sim_rtlil": task_build_sim_rtlil_in_process})
+
+
+def _run_yosys_script(script):
+    return run_yosys([script], cwd=OUTPUT_DIR).returncode == 0
+
+
 def task_build_sim_cxxrtl():
     return {
         "actions": [
-            f"cd {OUTPUT_DIR} && pdm run yowasp-yosys sim_soc.ys",
+            (_run_yosys_script, ["sim_soc.ys"]),
         ],
         "targets": [
             f"{OUTPUT_DIR}/sim_soc.cc",
@@ -47,13 +105,70 @@ def task_build_sim_cxxrtl():
     }
 
 
+def _build_sim_cmd():
+    exe = ".exe" if os.name == "nt" else ""
+    return (f"{ZIG_CXX} {CXXFLAGS} {includes(OUTPUT_DIR)} -o {OUTPUT_DIR}/sim_soc{exe} "
+            f"{OUTPUT_DIR}/sim_soc.cc {SOURCE_DIR}/main.cc {SOURCE_DIR}/models.cc {LIBS}")
+
+
+# The profile-guided build (see `pgo.py`) replaces the simulator outside of doit, which doesn't
+# know about it; this file holds a digest of the sources it was built from, so that `build_sim`
+# keeps it for as long as they don't change.
+PGO_STAMP = f"{OUTPUT_DIR}/sim_soc.pgo"
+
+
+def _sim_sources_digest():
+    sources = [f"{OUTPUT_DIR}/sim_soc.cc", f"{OUTPUT_DIR}/sim_soc.h", f"{SOURCE_DIR}/main.cc",
+               f"{SOURCE_DIR}/models.cc", f"{SOURCE_DIR}/models.h"]
+    return hashlib.sha256(b"".join(open(source, "rb").read() for source in sources) +
+                          CXXFLAGS.encode()).hexdigest()
+
+
+def record_pgo_build():
+    """Record that the simulator was just built with a profile from the current sources."""
+    with open(PGO_STAMP, "w") as f:
+        f.write(_sim_sources_digest())
+
+
+def discard_pgo_build():
+    """Remove the profile-guided build of the simulator, if there is one, so that `build_sim`
+    builds it again."""
+    if os.path.exists(PGO_STAMP):
+        os.remove(PGO_STAMP)
+        exe = f"{OUTPUT_DIR}/sim_soc{'.exe' if os.name == 'nt' else ''}"
+        if os.path.exists(exe):
+            os.remove(exe)
+
+
+def _pgo_build_state():
+    # None if there is no profile-guided build, else whether it is built from the current sources.
+    exe = f"{OUTPUT_DIR}/sim_soc{'.exe' if os.name == 'nt' else ''}"
+    if not os.path.exists(PGO_STAMP):
+        return None
+    with open(PGO_STAMP) as f:
+        return os.path.exists(exe) and f.read() == _sim_sources_digest()
+
+
+def _no_stale_pgo_build():
+    # doit may consider the task up to date, as its dependencies are those it last saw, but the
+    # profile-guided build that replaced its target since is not.
+    return _pgo_build_state() is not False
+
+
+def _build_sim():
+    if _pgo_build_state():
+        print("Keeping the profile-guided build of the simulator")
+        return True
+    discard_pgo_build()
+    return subprocess.run(_build_sim_cmd(), shell=True).returncode == 0
+
+
 def task_build_sim():
     exe = ".exe" if os.name == "nt" else ""
 
     return {
         "actions": [
-            f"{ZIG_CXX} {CXXFLAGS} {INCLUDES} -o {OUTPUT_DIR}/sim_soc{exe} "
-            f"{OUTPUT_DIR}/sim_soc.cc {SOURCE_DIR}/main.cc {SOURCE_DIR}/models.cc {LIBS}"
+            (_build_sim, []),
         ],
         "targets": [
             f"{OUTPUT_DIR}/sim_soc{exe}"
@@ -67,6 +182,9 @@ def task_build_sim():
             f"{SOURCE_DIR}/vendor/nlohmann/json.hpp",
             f"{SOURCE_DIR}/vendor/cxxrtl/cxxrtl_server.h",
         ],
+        "uptodate": [
+            _no_stale_pgo_build,
+        ],
     }
 
 
@@ -75,9 +193,13 @@ def task_run_sim():
 
     return {
         "actions": [
-            CmdAction(f"{'' if os.name == 'nt' else './'}sim_soc{exe}", buffering=1, cwd=OUTPUT_DIR)
+            CmdAction(f"{'' if os.name == 'nt' else './'}sim_soc{exe} %(sim_args)s",
+                      buffering=1, cwd=OUTPUT_DIR)
         ],
         "file_dep": [
             f"{OUTPUT_DIR}/sim_soc{exe}"
         ],
+        "params": [
+            {"name": "sim_args", "long": "sim-args", "default": ""},
+        ],
     }
@@ -8,19 +8,224 @@
 
 #include <fstream>
 #include <filesystem>
+#include <chrono>
+#include <regex>
+#include <unordered_map>
 
 using namespace cxxrtl::time_literals;
 using namespace cxxrtl_design;
 
+static const char *usage =
+    "Usage: %s [options]\n"
+    "  --commands FILE      read input commands from FILE\n"
+    "  --events FILE        write the event log to FILE (default: events.json)\n"
+    "  --cycles N           stop after N cycles\n"
+    "  --timeout SECONDS    stop after SECONDS of wall-clock time\n"
+    "  --after-commands N   stop N cycles after all input commands have been executed\n"
+    "  --uart-match REGEX   stop when the current line of UART output matches REGEX\n"
+    "  --idle N             stop when the CPU has made no data accesses, and only fetched\n"
+    "                       instructions from a few words, for N cycles\n"
+    "  --idle-ibus NAME     instruction bus watched to detect idling (default: 'soc cpu ibus')\n"
+    "  --idle-dbus NAME     data bus watched to detect idling (default: 'soc cpu dbus')\n"
+    "  --profile FILE       sample the CPU fetch address and write a histogram to FILE\n"
+    "  --profile-interval N sample every N cycles in which a fetch is requested (default: 100)\n"
+    "  --profile-bus NAME   instruction bus to sample (default: 'soc cpu ibus')\n"
+    "  --profile-shift N    shift samples left by N bits to get a byte address (default: 2)\n"
+    "  --flash-stats FILE   write flash access statistics to FILE\n"
+    "  --flash-line-size N  count flash reads per N bytes (default: 16)\n"
+    "  --flash-timing OP=N  make a flash program or erase operation take N cycles; OP is one\n"
+    "                       of page_program, sector_erase, block_erase_32k, block_erase_64k,\n"
+    "                       chip_erase (may be repeated)\n"
+    "  --firmware FILE      load FILE into the flash at 0x100000 (default: ../../zephyr.bin)\n"
+    "  --uart-baud N        baud rate of the output of the design's UART (default: 115200)\n"
+    "  --uart-pty           connect the UART to a pseudo-terminal instead of stdio\n"
+    "  --uart-pty-poll N    poll the pseudo-terminal every N cycles (default: 1000)\n"
+    "  --uart-pty-pace      only read input from the pseudo-terminal at the line rate\n"
+    "  --interactive        stream events to stdout and read actions from stdin, one JSON\n"
+    "                       object per line; stop when stdin is closed\n"
+    "  --meter SECONDS      report the simulation speed every SECONDS of wall-clock time\n"
+    "                       (default: 10; 0 to only report it at exit)\n"
+    "  --breakdown          measure the host time spent in each part of the simulation\n"
+    "                       (the design, each model, tracing, ...) and report it at exit\n"
+    "The exit status is 2 (--cycles) or 3 (--timeout) if a limit is reached before any of\n"
+    "the other conditions are met, and 0 otherwise.\n";
+
+// Width (in words) of the address range that an idle loop is allowed to span.
+static const uint32_t IDLE_WINDOW = 16;
+
+// Host time spent in each part of the simulation loop. Reading the clock around every part
+// slows the simulation down noticeably, so this is only done if enabled.
+struct cost_breakdown {
+    using clock = std::chrono::steady_clock;
+
+    bool enabled = false;
+    std::vector<std::string> names;
+    std::vector<clock::duration> totals;
+
+    size_t add(const std::string &name) {
+        names.push_back(name);
+        totals.emplace_back();
+        return names.size() - 1;
+    }
+
+    template<typename F>
+    void measure(size_t part, F &&f) {
+        if (!enabled) {
+            f();
+            return;
+        }
+        auto start = clock::now();
+        f();
+        totals[part] += clock::now() - start;
+    }
+
+    void report(clock::duration elapsed) const {
+        auto seconds = [](clock::duration d) { return std::chrono::duration<double>(d).count(); };
+        clock::duration rest = elapsed;
+        std::cerr << "Host time breakdown:" << std::endl;
+        for (size_t part = 0; part < names.size(); part++) {
+            rest -= totals[part];
+            std::cerr << stringf("  %-12s %10.3f s %6.1f%%", names[part].c_str(),
+                                 seconds(totals[part]),
+                                 100 * seconds(totals[part]) / seconds(elapsed)) << std::endl;
+        }
+        std::cerr << stringf("  %-12s %10.3f s %6.1f%%", "(other)", seconds(rest),
+                             100 * seconds(rest) / seconds(elapsed)) << std::endl;
+    }
+};
+
 int main(int argc, char **argv) {
+    std::string commands_file, events_file;
+    std::optional<uint64_t> max_cycles, after_commands, idle_cycles;
+    std::optional<double> timeout;
+    std::optional<std::regex> uart_match;
+    std::string idle_ibus_name = "soc cpu ibus", idle_dbus_name = "soc cpu dbus";
+    std::string profile_file, profile_bus_name = "soc cpu ibus";
+    unsigned profile_interval = 100, profile_shift = 2;
+    std::string flash_stats_file;
+    unsigned flash_line_size = 16;
+    std::vector<std::pair<std::string, unsigned>> flash_timing;
+    std::string firmware_file = "../../zephyr.bin";
+    unsigned uart_baud = 115200;
+    // The environment variables predate the options.
+    bool uart_pty = getenv("UART_PTY"), uart_pty_pace = getenv("UART_PTY_PACE");
+    unsigned uart_pty_poll = getenv("UART_PTY_POLL") ? atoi(getenv("UART_PTY_POLL")) : 1000;
+    bool interactive = false;
+    double meter_interval = 10;
+    cost_breakdown costs;
+    for (int i = 1; i < argc; i++) {
+        std::string arg = argv[i];
+        if (arg == "--interactive") {
+            interactive = true;
+            continue;
+        }
+        if (arg == "--breakdown") {
+            costs.enabled = true;
+            continue;
+        }
+        if (arg == "--uart-pty") {
+            uart_pty = true;
+            continue;
+        }
+        if (arg == "--uart-pty-pace") {
+            uart_pty_pace = true;
+            continue;
+        }
+        if (arg == "--help" || arg == "-h" || i + 1 == argc) {
+            fprintf(stderr, usage, argv[0]);
+            return arg == "--help" || arg == "-h" ? 0 : 1;
+        }
+        std::string param = argv[++i];
+        if (arg == "--commands")
+            commands_file = param;
+        else if (arg == "--events")
+            events_file = param;
+        else if (arg == "--cycles")
+            max_cycles = std::stoull(param);
+        else if (arg == "--timeout")
+            timeout = std::stod(param);
+        else if (arg == "--after-commands")
+            after_commands = std::stoull(param);
+        else if (arg == "--uart-match")
+            uart_match = std::regex(param);
+        else if (arg == "--idle")
+            idle_cycles = std::stoull(param);
+        else if (arg == "--idle-ibus")
+            idle_ibus_name = param;
+        else if (arg == "--idle-dbus")
+            idle_dbus_name = param;
+        else if (arg == "--profile")
+            profile_file = param;
+        else if (arg == "--profile-interval")
+            profile_interval = std::max(std::stoul(param), 1UL);
+        else if (arg == "--profile-bus")
+            profile_bus_name = param;
+        else if (arg == "--profile-shift")
+            profile_shift = std::stoul(param);
+        else if (arg == "--flash-stats")
+            flash_stats_file = param;
+        else if (arg == "--flash-line-size")
+            flash_line_size = std::max(std::stoul(param), 1UL);
+        else if (arg == "--flash-timing" && param.find('=') != std::string::npos)
+            flash_timing.emplace_back(param.substr(0, param.find('=')),
+                                      std::stoul(param.substr(param.find('=') + 1)));
+        else if (arg == "--firmware")
+            firmware_file = param;
+        else if (arg == "--uart-baud" && std::stoul(param) > 0 &&
+                 std::stoul(param) <= uart_model::clk_freq)
+            uart_baud = std::stoul(param);
+        else if (arg == "--uart-pty-poll")
+            uart_pty_poll = std::stoul(param);
+        else if (arg == "--meter")
+            meter_interval = std::stod(param);
+        else {
+            fprintf(stderr, usage, argv[0]);
+            return 1;
+        }
+    }
+
     p_sim__top top;
 
-    spiflash_model flash("flash",
-        top.p_qspi__sck____o,
-        top.p_qspi__cs____o,
-        top.p_qspi__io____o, top.p_qspi__io____oe, top.p_qspi__io____i);
+    // A striped flash (`flash_lanes` in `[chipflow.soc]`) is a chip per four of the QSPI data
+    // lines, all with the same SCK and CS#. Each chip has its own copy of its four lines, which
+    // are copied from and to the design around the model steps.
+    constexpr size_t flash_lanes = decltype(top.p_qspi__io____o)::bits / 4;
+    std::array<value<4>, flash_lanes> flash_d_o, flash_d_oe, flash_d_i;
+    std::vector<std::unique_ptr<spiflash_model>> flashes;
+    for (size_t lane = 0; lane < flash_lanes; lane++)
+        flashes.push_back(std::make_unique<spiflash_model>(
+            flash_lanes == 1 ? std::string("flash") : stringf("flash%zu", lane),
+            top.p_qspi__sck____o,
+            top.p_qspi__cs____o,
+            flash_d_o[lane], flash_d_oe[lane], flash_d_i[lane]));
+    for (auto &flash : flashes)
+        for (auto &operation : flash_timing)
+            flash->set_timing(operation.first, operation.second);
+    // All of the chips see the same commands, so the statistics of the first one are enough;
+    // its reads are `flash_lanes` times shorter than those of the CPU, which
+    // `tools/flash_stats.py` corrects for.
+    if (!flash_stats_file.empty())
+        flashes[0]->enable_stats(flash_line_size, flash_lanes);
 
-    uart_model uart("uart", top.p_uart__tx____o, top.p_uart__rx____i);
+    uart_model uart("uart", top.p_uart__tx____o, top.p_uart__rx____i,
+                    uart_model::clk_freq / uart_baud);
+
+    bool uart_matched = false;
+    std::string uart_line;
+    if (uart_match) {
+        uart.on_output = [&](uint8_t byte) {
+            if (byte == '\n') {
+                uart_line.clear();
+            } else if (byte != '\r') {
+                uart_line.push_back(char(byte));
+                if (std::regex_search(uart_line, *uart_match))
+                    uart_matched = true;
+            }
+        };
+    }
+    if (uart_pty)
+        std::cerr << "UART available on " << uart.open_pty(uart_pty_poll, uart_pty_pace)
+                  << std::endl;
 
     cxxrtl::agent agent(cxxrtl::spool("spool.bin"), top);
     if (getenv("DEBUG")) // can also be done when a condition is violated, etc
@@ -30,44 +235,125 @@ int main(int argc, char **argv) {
     std::ofstream vcd_file;
     debug_items debug_items;
     uint64_t cycle = 0;
+    bool trace = getenv("TRACE");
 
-    if (getenv("TRACE")) {
-        vcd_file.open("trace.vcd");
+    if (trace || idle_cycles || !profile_file.empty())
         top.debug_info(&debug_items, /*scopes=*/nullptr, "");
+
+    if (trace) {
+        vcd_file.open("trace.vcd");
         vcd.timescale(1, "us");
         vcd.add_without_memories(debug_items);
     }
 
+    auto find_item = [&](const std::string &name) -> const debug_item * {
+        if (!debug_items.count(name)) {
+            // The fast pipeline flattens the design and drops most of the debug information.
+            std::cerr << "Unknown debug item: " << name << " (--idle and --profile need a "
+                         "simulation built with the debug pipeline)" << std::endl;
+            exit(1);
+        }
+        return &debug_items[name];
+    };
+    auto read_item = [](const debug_item *item) {
+        if (item->type == debug_item::OUTLINE)
+            item->outline->eval();
+        return item->curr[0];
+    };
+
+    // Idle detection: the address of an instruction fetch is only meaningful while one is
+    // requested (with an instruction cache, the bus is quiet while the CPU runs from the cache),
+    // and a tight loop that polls a peripheral or works on data is not idle.
+    struct bus_items {
+        const debug_item *adr, *cyc, *stb;
+    };
+    auto find_bus = [&](const std::string &name) {
+        return bus_items { find_item(name + "__adr"), find_item(name + "__cyc"),
+                           find_item(name + "__stb") };
+    };
+    auto bus_active = [&](const bus_items &bus) {
+        return read_item(bus.cyc) && read_item(bus.stb);
+    };
+    std::optional<bus_items> idle_ibus, idle_dbus;
+    if (idle_cycles) {
+        idle_ibus = find_bus(idle_ibus_name);
+        idle_dbus = find_bus(idle_dbus_name);
+    }
+
+    // Sampling profiler: a histogram of the sampled addresses is cheap enough to keep for a full
+    // boot; symbolization is left to `tools/sim_profile.py`. Like for idle detection, the fetch
+    // address is only sampled while a fetch is requested: between fetches it is that of the last
+    // one, and would be counted for every cycle of a stall or of running from the cache.
+    std::optional<bus_items> profile_bus;
+    if (!profile_file.empty())
+        profile_bus = find_bus(profile_bus_name);
+    std::unordered_map<uint32_t, uint64_t> profile;
+    unsigned profile_counter = 0;
+
+    if (!commands_file.empty())
+        open_input_commands(commands_file);
+    if (!commands_file.empty() || !events_file.empty())
+        open_event_log(events_file.empty() ? "events.json" : events_file);
+    if (interactive)
+        open_command_stream();
+
+    // The design cost includes recording it into the spool; events logged by the models are
+    // part of the cost of each model.
+    size_t cost_design = costs.add("design");
+    std::vector<size_t> cost_flashes;
+    for (auto &flash : flashes)
+        cost_flashes.push_back(costs.add(flash->name));
+    size_t cost_uart     = costs.add("uart");
+    size_t cost_trace    = costs.add("trace");
+    size_t cost_snapshot = costs.add("snapshot");
+    size_t cost_probes   = costs.add("probes");
+    size_t cost_commands = costs.add("commands");
+
     unsigned timestamp = 0;
     auto tick = [&]() {
-        flash.step(timestamp);
-        uart.step(timestamp);
+        uint32_t io_o = top.p_qspi__io____o.get<uint32_t>(), io_oe = top.p_qspi__io____oe.get<uint32_t>();
+        uint32_t io_i = 0;
+        for (size_t lane = 0; lane < flash_lanes; lane++) {
+            flash_d_o[lane].set((io_o >> (4 * lane)) & 0xfU);
+            flash_d_oe[lane].set((io_oe >> (4 * lane)) & 0xfU);
+            costs.measure(cost_flashes[lane], [&] { flashes[lane]->step(timestamp); });
+            io_i |= flash_d_i[lane].get<uint32_t>() << (4 * lane);
+        }
+        top.p_qspi__io____i.set(io_i);
+        costs.measure(cost_uart, [&] { uart.step(timestamp); });
 
         top.p_clk.set(false);
-        agent.step();
-        agent.advance(1_us);
+        costs.measure(cost_design, [&] {
+            agent.step();
+            agent.advance(1_us);
+        });
         ++timestamp;
 
-        if (getenv("TRACE"))
-            vcd.sample(2 * cycle);
+        if (trace)
+            costs.measure(cost_trace, [&] { vcd.sample(2 * cycle); });
 
         top.p_clk.set(true);
-        agent.step();
-        agent.advance(1_us);
+        costs.measure(cost_design, [&] {
+            agent.step();
+            agent.advance(1_us);
+        });
         ++timestamp;
 
         if (timestamp % 100000 == 0)
-            agent.snapshot();
+            costs.measure(cost_snapshot, [&] { agent.snapshot(); });
 
-        if (getenv("TRACE")) {
-            vcd.sample(2 * cycle + 1);
-            vcd_file << vcd.buffer;
-            vcd.buffer.clear();
+        if (trace) {
+            costs.measure(cost_trace, [&] {
+                vcd.sample(2 * cycle + 1);
+                vcd_file << vcd.buffer;
+                vcd.buffer.clear();
+            });
             cycle += 1;
         }
     };
 
-    flash.load_data("../../zephyr.bin", 0x00100000U);
+    for (size_t lane = 0; lane < flash_lanes; lane++)
+        flashes[lane]->load_data(firmware_file, 0x00100000U, flash_lanes, lane);
     agent.step();
     agent.advance(1_us);
 
@@ -75,8 +361,121 @@ int main(int argc, char **argv) {
     tick();
 
     top.p_rst.set(false);
-    while (1)
+
+    // Limits only indicate a failure if they were reached while waiting for some other condition.
+    bool has_condition = after_commands || uart_match || idle_cycles;
+    int status = -1;
+    std::string reason;
+    auto stop = [&](int limit_status, const std::string &why) {
+        status = has_condition ? limit_status : 0;
+        reason = why;
+    };
+
+    auto start_time = std::chrono::steady_clock::now();
+    auto meter_time = start_time;
+    uint64_t meter_cycles = 0;
+    auto seconds_since = [](std::chrono::steady_clock::time_point since) {
+        return std::chrono::duration<double>(std::chrono::steady_clock::now() - since).count();
+    };
+    uint64_t cycles = 0, commands_done_at = 0, idle_count = 0;
+    bool commands_done = false;
+    uint32_t idle_lo = 0, idle_hi = 0;
+    while (status < 0) {
+        bool stream_open = true;
+        if (interactive)
+            costs.measure(cost_commands, [&] { stream_open = poll_command_stream(); });
+        if (!stream_open) {
+            status = 0;
+            reason = "command stream closed";
+            break;
+        }
+
         tick();
+        ++cycles;
+
+        if (uart_matched) {
+            status = 0;
+            reason = "UART output matched";
+        }
+        if (after_commands) {
+            if (!commands_done && all_actions_executed()) {
+                commands_done = true;
+                commands_done_at = cycles;
+            }
+            if (commands_done && cycles - commands_done_at >= *after_commands) {
+                status = 0;
+                reason = "all input commands executed";
+            }
+        }
+        if (profile_bus || idle_ibus) {
+            costs.measure(cost_probes, [&] {
+                if (profile_bus && bus_active(*profile_bus) &&
+                        ++profile_counter == profile_interval) {
+                    profile_counter = 0;
+                    ++profile[read_item(profile_bus->adr) << profile_shift];
+                }
+                if (idle_ibus) {
+                    if (bus_active(*idle_dbus)) {
+                        idle_count = 0;
+                    } else {
+                        if (bus_active(*idle_ibus)) {
+                            uint32_t addr = read_item(idle_ibus->adr);
+                            idle_lo = std::min(idle_lo, addr);
+                            idle_hi = std::max(idle_hi, addr);
+                            if (idle_hi - idle_lo >= IDLE_WINDOW) {
+                                idle_lo = idle_hi = addr;
+                                idle_count = 0;
+                            }
+                        }
+                        if (++idle_count >= *idle_cycles) {
+                            status = 0;
+                            reason = "CPU idle";
+                        }
+                    }
+                }
+            });
+        }
+        if (status >= 0)
+            break;
+        if (max_cycles && cycles >= *max_cycles)
+            stop(2, "cycle limit reached");
+        // Checking the clock is comparatively expensive, so only do it every 1024 cycles.
+        if ((timeout || meter_interval > 0) && (cycles % 1024) == 0) {
+            if (timeout && seconds_since(start_time) >= *timeout)
+                stop(3, "timeout reached");
+            double interval = seconds_since(meter_time);
+            if (meter_interval > 0 && interval >= meter_interval) {
+                std::cerr << stringf("%.1f s: %llu cycles, %.1f kcycles/s", seconds_since(start_time),
+                                     (unsigned long long)cycles,
+                                     (cycles - meter_cycles) / interval / 1e3) << std::endl;
+                meter_time = std::chrono::steady_clock::now();
+                meter_cycles = cycles;
+            }
+        }
+    }
 
-    return 0;
+    double elapsed = seconds_since(start_time);
+    std::cerr << std::endl << "Simulation stopped after " << cycles << " cycles: "
+              << reason << std::endl;
+    std::cerr << stringf("%.3f s of wall-clock time, %.1f kcycles/s", elapsed,
+                         cycles / elapsed / 1e3) << std::endl;
+    if (costs.enabled)
+        costs.report(std::chrono::steady_clock::now() - start_time);
+    if (uart.pty_dropped)
+        std::cerr << stringf("%llu bytes of UART output dropped, as nothing read the PTY",
+                             (unsigned long long)uart.pty_dropped) << std::endl;
+    if (!commands_file.empty() || !events_file.empty())
+        close_event_log();
+    if (!flash_stats_file.empty())
+        flashes[0]->write_stats(flash_stats_file);
+    if (profile_bus) {
+        std::vector<std::pair<uint32_t, uint64_t>> samples(profile.begin(), profile.end());
+        std::sort(samples.begin(), samples.end());
+        std::ofstream profile_out(profile_file);
+        profile_out << "# interval " << profile_interval << std::endl;
+        for (auto &sample : samples)
+            profile_out << stringf("%08x %llu", sample.first, (unsigned long long)sample.second)
+                        << std::endl;
+    }
+    return status;
 }
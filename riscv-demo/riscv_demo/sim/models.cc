@@ -7,8 +7,19 @@
 #include <fstream>
 #include <stdarg.h>
 #include <unordered_map>
+#include <iostream>
+#include <thread>
+#include <mutex>
+#include <atomic>
+#include <tuple>
 #include "models.h"
 
+#ifndef _WIN32
+#include <fcntl.h>
+#include <unistd.h>
+#include <termios.h>
+#endif
+
 namespace cxxrtl_design {
 
 // Helper functions
@@ -72,6 +83,54 @@ void fetch_actions_into_queue() {
 }
 }
 
+// Command stream (interactive mode)
+namespace {
+bool stream_events = false;
+std::mutex stream_mutex;
+std::vector<json> stream_cmds;
+std::atomic<bool> stream_pending{false};
+std::atomic<bool> stream_closed{false};
+}
+
+void open_command_stream() {
+    stream_events = true;
+    // Commands are read on a separate thread so that the simulation never blocks on stdin.
+    std::thread([]() {
+        std::string line;
+        while (std::getline(std::cin, line)) {
+            if (line.empty())
+                continue;
+            // Anything thrown on this thread would terminate the simulation, so check the command
+            // before using it: it must be an action (the default) with a peripheral and an event.
+            json cmd = json::parse(line, nullptr, /*allow_exceptions=*/false);
+            if (cmd.is_discarded() || !cmd.is_object()
+                    || (cmd.contains("type") && cmd["type"] != "action")
+                    || !cmd.contains("peripheral") || !cmd["peripheral"].is_string()
+                    || !cmd.contains("event") || !cmd["event"].is_string()) {
+                fprintf(stderr, "WARNING: ignoring invalid command: %s\n", line.c_str());
+                continue;
+            }
+            std::lock_guard<std::mutex> guard(stream_mutex);
+            stream_cmds.push_back(std::move(cmd));
+            stream_pending = true;
+        }
+        stream_closed = true;
+    }).detach();
+}
+
+bool poll_command_stream() {
+    // Read this first: once the stream is closed, all of its commands have been pushed already.
+    bool closed = stream_closed;
+    if (stream_pending.load(std::memory_order_relaxed)) {
+        std::lock_guard<std::mutex> guard(stream_mutex);
+        for (auto &cmd : stream_cmds)
+            queued_actions[cmd["peripheral"]].emplace_back(cmd["event"], cmd["payload"]);
+        stream_cmds.clear();
+        stream_pending = false;
+    }
+    return !closed;
+}
+
 void open_input_commands(const std::string &filename) {
     std::ifstream f(filename);
     if (!f) {
@@ -103,9 +162,13 @@ void log_event(unsigned timestamp, const std::string &peripheral, const std::str
     if (had_event)
         event_log << "," << std::endl;
     auto payload_str = payload.dump();
-    event_log << stringf("{ \"timestamp\": %u, \"peripheral\": \"%s\", \"event\": \"%s\", \"payload\": %s }",
+    auto event_str = stringf("{ \"timestamp\": %u, \"peripheral\": \"%s\", \"event\": \"%s\", \"payload\": %s }",
         timestamp, peripheral.c_str(), event_type.c_str(), payload_str.c_str());
+    event_log << event_str;
     had_event = true;
+    // In interactive mode, also stream one event per line as it happens
+    if (stream_events)
+        std::cout << event_str << std::endl;
     // Check if we have actions waiting on this
     if (input_ptr < input_cmds.size()) {
         const auto &cmd = input_cmds.at(input_ptr);
@@ -125,6 +188,15 @@ std::vector<action> get_pending_actions(const std::string &peripheral) {
     return result;
 }
 
+bool all_actions_executed() {
+    if (input_ptr != input_cmds.size())
+        return false;
+    for (auto &queued : queued_actions)
+        if (!queued.second.empty())
+            return false;
+    return true;
+}
+
 void close_event_log() {
     event_log << std::endl << "]" << std::endl;
     event_log << "}" << std::endl;
@@ -135,16 +207,147 @@ void close_event_log() {
 }
 
 // SPI flash
-void spiflash_model::load_data(const std::string &filename, unsigned offset) {
+void spiflash_model::load_data(const std::string &filename, unsigned offset, unsigned stride, unsigned phase) {
     std::ifstream in(filename, std::ifstream::binary);
+    offset /= stride;
     if (offset >= data.size()) {
         throw std::out_of_range("flash: offset beyond end");
     }
     if (!in) {
         throw std::runtime_error("flash: failed to read input file: " + filename);
     }
-    in.read(reinterpret_cast<char*>(data.data() + offset), (data.size() - offset));
+    if (stride == 1) {
+        in.read(reinterpret_cast<char*>(data.data() + offset), (data.size() - offset));
+        return;
+    }
+    std::vector<char> image((std::istreambuf_iterator<char>(in)), std::istreambuf_iterator<char>());
+    for (size_t index = phase; index < image.size() && offset < data.size(); index += stride)
+        data[offset++] = uint8_t(image[index]);
 }
+void spiflash_model::set_timing(const std::string &operation, unsigned cycles) {
+    if (operation == "page_program")
+        timing.page_program = cycles;
+    else if (operation == "sector_erase")
+        timing.sector_erase = cycles;
+    else if (operation == "block_erase_32k")
+        timing.block_erase_32k = cycles;
+    else if (operation == "block_erase_64k")
+        timing.block_erase_64k = cycles;
+    else if (operation == "chip_erase")
+        timing.chip_erase = cycles;
+    else
+        throw std::out_of_range("flash: unknown timing: " + operation);
+}
+
+void spiflash_model::enable_stats(unsigned line_size, unsigned lanes) {
+    st = std::make_unique<stats>();
+    st->line_size = line_size;
+    st->lanes = lanes;
+}
+
+void spiflash_model::update_stats() {
+    // A transaction in continuous read mode starts at the address, as if after the command byte.
+    int command_bytes = s.continuous_start ? 0 : 1;
+    if (s.byte_count == 1 - command_bytes)
+        return;
+    st->transactions += 1;
+    st->bytes += s.byte_count - 1 + command_bytes;
+    if (s.continuous_start)
+        st->continuous_reads += 1;
+    else
+        st->commands[s.command] += 1;
+
+    // Bytes clocked out after the command, address, and mode/dummy bytes
+    int data_start = (s.command == 0x03) ? 4 : (s.command == 0xeb) ? 7 : -1;
+    if (data_start < 0 || s.byte_count <= data_start)
+        return;
+    uint32_t length = s.byte_count - data_start;
+    st->data_bytes += length;
+    for (uint32_t line = s.read_addr / st->line_size;
+            line <= (s.read_addr + length - 1) / st->line_size; line++)
+        st->line_reads[line * st->line_size] += 1;
+    if (s.read_addr != st->run_end) {
+        if (st->run_end != st->run_start)
+            st->run_lengths[st->run_end - st->run_start] += 1;
+        st->run_start = s.read_addr;
+    }
+    st->run_end = s.read_addr + length;
+}
+
+void spiflash_model::write_stats(const std::string &filename) {
+    std::ofstream out(filename);
+    if (!out) {
+        throw std::runtime_error("flash: failed to open statistics for writing: " + filename);
+    }
+    if (st->run_end != st->run_start)
+        st->run_lengths[st->run_end - st->run_start] += 1;
+    st->run_start = st->run_end;
+    out << "kind,key,count" << std::endl;
+    out << "total,transactions," << st->transactions << std::endl;
+    out << "total,continuous_reads," << st->continuous_reads << std::endl;
+    out << "total,cs_cycles," << st->cs_cycles << std::endl;
+    out << "total,bytes," << st->bytes << std::endl;
+    out << "total,data_bytes," << st->data_bytes << std::endl;
+    out << "total,line_size," << st->line_size << std::endl;
+    out << "total,lanes," << st->lanes << std::endl;
+    for (auto &it : st->commands)
+        out << stringf("command,0x%02x,", it.first) << it.second << std::endl;
+    for (auto &it : st->run_lengths)
+        out << "run," << it.first << "," << it.second << std::endl;
+    for (auto &it : st->line_reads)
+        out << stringf("line,0x%06x,", it.first) << it.second << std::endl;
+}
+
+void spiflash_model::complete_command(unsigned timestamp) {
+    auto start_busy = [&](unsigned cycles) {
+        if (cycles == 0) {
+            s.sr1 &= ~0x03U;
+        } else {
+            s.sr1 |= 0x01U;
+            s.busy_counter = cycles;
+        }
+    };
+    auto erase = [&](uint32_t size, unsigned cycles) {
+        uint32_t base = s.addr & ~(size - 1);
+        std::fill(data.begin() + base, data.begin() + base + size, 0xFF);
+        log_event(timestamp, name, "erase", json({{"addr", base}, {"size", size}}));
+        start_busy(cycles);
+    };
+
+    if (s.ignored) {
+        return;
+    } else if (s.command == 0x06 && s.byte_count == 1) {
+        // write enable
+        s.sr1 |= 0x02U;
+    } else if (s.command == 0x04 && s.byte_count == 1) {
+        // write disable
+        s.sr1 &= ~0x02U;
+    } else if (s.command == 0x02 || s.command == 0x32 || s.command == 0x20 || s.command == 0x52
+            || s.command == 0xd8 || s.command == 0x60 || s.command == 0xc7) {
+        if (!(s.sr1 & 0x02U)) {
+            // like the real device, ignore program/erase without a preceding write enable
+            fprintf(stderr, "flash: command %02x ignored, write not enabled\n", s.command);
+        } else if ((s.command == 0x02 || s.command == 0x32) && s.byte_count >= 5) {
+            // page program; NOR flash can only clear bits
+            uint32_t page_base = s.page_addr & ~0xFFU;
+            for (unsigned i = 0; i < s.page_buffer.size(); i++)
+                data.at(page_base + i) &= s.page_buffer[i];
+            log_event(timestamp, name, "program", json({{"addr", s.page_addr},
+                {"length", std::min<unsigned>(s.page_count, s.page_buffer.size())}}));
+            start_busy(timing.page_program);
+        } else if (s.command == 0x20 && s.byte_count == 4) {
+            erase(4 * 1024, timing.sector_erase);
+        } else if (s.command == 0x52 && s.byte_count == 4) {
+            erase(32 * 1024, timing.block_erase_32k);
+        } else if (s.command == 0xd8 && s.byte_count == 4) {
+            erase(64 * 1024, timing.block_erase_64k);
+        } else if ((s.command == 0x60 || s.command == 0xc7) && s.byte_count == 1) {
+            s.addr = 0;
+            erase(uint32_t(data.size()), timing.chip_erase);
+        }
+    }
+}
+
 void spiflash_model::step(unsigned timestamp) {
     auto process_byte = [&]() {
         s.out_buffer = 0;
@@ -152,50 +355,117 @@ void spiflash_model::step(unsigned timestamp) {
             s.addr = 0;
             s.data_width = 1;
             s.command = s.curr_byte;
-            if (s.command == 0xab) {
+            if ((s.sr1 & 0x01U) && s.command != 0x05 && s.command != 0x35) {
+                // like the real device, ignore anything but a status read while busy; this is
+                // a driver bug, so report it, but let the simulation go on
+                fprintf(stderr, "flash: command %02x ignored, busy\n", s.command);
+                log_event(timestamp, name, "ignored", json({{"command", s.command}}));
+                s.ignored = true;
+            }
+            if (s.ignored) {
+                // the rest of the transaction is ignored too
+            } else if (s.command == 0xab) {
                 // power up
             } else if (s.command == 0x03 || s.command == 0x9f || s.command == 0xff
                 || s.command == 0x35 || s.command == 0x31 || s.command == 0x50
-                || s.command == 0x05 || s.command == 0x01 || s.command == 0x06) {
+                || s.command == 0x05 || s.command == 0x01 || s.command == 0x06
+                || s.command == 0x04) {
                 // nothing to do
+            } else if (s.command == 0x02 || s.command == 0x32) {
+                s.page_buffer.fill(0xFF);
+                s.page_count = 0;
+            } else if (s.command == 0x20 || s.command == 0x52 || s.command == 0xd8
+                || s.command == 0x60 || s.command == 0xc7) {
+                // erase commands are executed when CS# is deasserted
             } else if (s.command == 0xeb) {
                 s.data_width = 4;
             } else {
                 throw std::runtime_error(stringf("flash: unknown command %02x", s.command));
             }
-        } else {
+        } else if (!s.ignored) {
             if (s.command == 0x03) {
                 // Single read
                 if (s.byte_count <= 3) {
                     s.addr |= (uint32_t(s.curr_byte) << ((3 - s.byte_count) * 8));
+                    s.read_addr = s.addr;
                 }
                 if (s.byte_count >= 3) {
                     s.out_buffer = data.at(s.addr);
                     s.addr = (s.addr + 1) & 0x00FFFFFF;
                 }
             } else if (s.command == 0xeb) {
-                // Quad read
+                // Fast read quad I/O: address, mode bits, 4 dummy cycles (2 bytes), data
                 if (s.byte_count <= 3) {
                     s.addr |= (uint32_t(s.curr_byte) << ((3 - s.byte_count) * 8));
+                    s.read_addr = s.addr;
                 }
-                if (s.byte_count >= 4) {
-                    // read 4 bytes
+                if (s.byte_count == 4) {
+                    // Any other mode bits, including those of the mode bit reset sequence
+                    // (all IOs high for 8 cycles), leave continuous read mode.
+                    s.continuous = (s.curr_byte & 0x30U) == 0x20U;
+                }
+                if (s.byte_count >= 6) {
                     s.out_buffer = data.at(s.addr);
                     s.addr = (s.addr + 1) & 0x00FFFFFF;
                 }
+            } else if (s.command == 0x02 || s.command == 0x32) {
+                // Page program (single or quad input)
+                if (s.byte_count <= 3) {
+                    s.addr |= (uint32_t(s.curr_byte) << ((3 - s.byte_count) * 8));
+                }
+                if (s.byte_count == 3) {
+                    s.page_addr = s.addr;
+                    if (s.command == 0x32)
+                        s.data_width = 4;
+                }
+                if (s.byte_count >= 4) {
+                    // the address wraps around within the page
+                    s.page_buffer.at(s.addr & 0xFF) = s.curr_byte;
+                    s.addr = (s.addr & 0x00FFFF00) | ((s.addr + 1) & 0xFF);
+                    ++s.page_count;
+                }
+            } else if (s.command == 0x20 || s.command == 0x52 || s.command == 0xd8) {
+                // Sector/block erase
+                if (s.byte_count <= 3) {
+                    s.addr |= (uint32_t(s.curr_byte) << ((3 - s.byte_count) * 8));
+                }
             }
         }
-        if (s.command == 0x9f) {
+        if (!s.ignored && s.command == 0x9f) {
             // Read ID
             static const std::array<uint8_t, 4> flash_id{0xCA, 0x7C, 0xA7, 0xFF};
             s.out_buffer = flash_id.at(s.byte_count % int(flash_id.size()));
         }
+        if (s.command == 0x05) {
+            // Read status register 1
+            s.out_buffer = s.sr1;
+        }
     };
 
+    if (s.busy_counter > 0 && --s.busy_counter == 0) {
+        // program/erase done; clear WIP and WEL
+        s.sr1 &= ~0x03U;
+    }
+
+    if (st && !csn)
+        st->cs_cycles += 1;
+
     if (csn && !s.last_csn) {
+        if (st)
+            update_stats();
+        complete_command(timestamp);
+        s.ignored = false;
         s.bit_count = 0;
-        s.byte_count = 0;
-        s.data_width = 1;
+        s.continuous_start = s.continuous;
+        if (s.continuous) {
+            // the next transaction starts with the address, as if after a quad read command
+            s.byte_count = 1;
+            s.data_width = 4;
+            s.addr = 0;
+        } else {
+            s.byte_count = 0;
+            s.data_width = 1;
+        }
     } else if (clk && !s.last_clk && !csn) {
         if (s.data_width == 4)
             s.curr_byte = (s.curr_byte << 4U) | (d_o.get<uint32_t>() & 0xF);
@@ -221,15 +491,80 @@ void spiflash_model::step(unsigned timestamp) {
 
 // UART
 
+std::string uart_model::open_pty(unsigned poll_interval, bool pace) {
+#ifdef _WIN32
+    throw std::runtime_error("uart: PTY bridge is not supported on Windows");
+#else
+    pty_master = posix_openpt(O_RDWR | O_NOCTTY);
+    if (pty_master < 0 || grantpt(pty_master) < 0 || unlockpt(pty_master) < 0)
+        throw std::runtime_error("uart: failed to allocate a PTY");
+    fcntl(pty_master, F_SETFL, fcntl(pty_master, F_GETFL) | O_NONBLOCK);
+    std::string pty_name = ptsname(pty_master);
+    // Keep the slave side open, so that reads don't fail while no terminal is attached, and put it
+    // in raw mode, so that the line discipline doesn't echo firmware output back as input.
+    pty_slave = open(pty_name.c_str(), O_RDWR | O_NOCTTY);
+    if (pty_slave < 0)
+        throw std::runtime_error("uart: failed to open PTY " + pty_name);
+    struct termios tio;
+    tcgetattr(pty_slave, &tio);
+    cfmakeraw(&tio);
+    tcsetattr(pty_slave, TCSANOW, &tio);
+    pty_poll_interval = std::max(poll_interval, 1U);
+    pty_pace = pace;
+    return pty_name;
+#endif
+}
+
+void uart_model::flush_pty() {
+#ifndef _WIN32
+    while (!pty_pending.empty()) {
+        ssize_t count = write(pty_master, pty_pending.data(), pty_pending.size());
+        if (count <= 0)
+            break;
+        pty_pending.erase(0, count);
+    }
+#endif
+}
+
+void uart_model::poll_pty() {
+#ifndef _WIN32
+    flush_pty();
+    // In pacing mode, only keep enough bytes queued to keep the line busy until the next poll.
+    size_t limit = pty_pace ? 1 + pty_poll_interval / (10 * s.tx_baud_div) : SIZE_MAX;
+    uint8_t buf[256];
+    while (s.tx_queue.size() < limit) {
+        ssize_t count = read(pty_master, buf, std::min(sizeof(buf), limit - s.tx_queue.size()));
+        if (count <= 0)
+            break;
+        for (ssize_t index = 0; index < count; index++)
+            s.tx_queue.emplace_back(buf[index], s.tx_baud_div);
+    }
+#endif
+}
+
 void uart_model::step(unsigned timestamp) {
 
     for (auto action : get_pending_actions(name)) {
         if (action.event == "tx") {
-            s.tx_active = true;
-            s.tx_data = uint8_t(action.payload);
+            s.tx_queue.emplace_back(uint8_t(action.payload), s.tx_baud_div);
+        } else if (action.event == "baud") {
+            // The bytes sent to the design from now on are at this baud rate (e.g. that of
+            // the UART loader); those already queued are sent at the previous one.
+            if (!action.payload.is_number_unsigned() || action.payload == 0 ||
+                    action.payload > clk_freq) {
+                fprintf(stderr, "uart: baud rate %s ignored, not in 1..%u\n",
+                        action.payload.dump().c_str(), clk_freq);
+                continue;
+            }
+            s.tx_baud_div = clk_freq / unsigned(action.payload);
         }
     }
 
+    if (pty_master >= 0 && ++s.pty_counter >= pty_poll_interval) {
+        s.pty_counter = 0;
+        poll_pty();
+    }
+
     if (s.rx_counter == 0) {
         if (s.tx_last && !tx) { // start bit
             s.rx_counter = 1;
@@ -245,8 +580,21 @@ void uart_model::step(unsigned timestamp) {
             if (bit == 8) {
                 // print to console
                 log_event(timestamp, name, "tx", json(s.rx_sr));
-                if (name == "uart")
+                if (on_output)
+                    on_output(s.rx_sr);
+                if (pty_master >= 0) {
+                    // The PTY is non-blocking: if its buffer is full (e.g. nothing is reading
+                    // it), keep the output until the next poll rather than dropping it, up to
+                    // a limit.
+                    if (pty_pending.size() >= PTY_PENDING_LIMIT) {
+                        pty_dropped += PTY_PENDING_LIMIT / 2;
+                        pty_pending.erase(0, PTY_PENDING_LIMIT / 2);
+                    }
+                    pty_pending.push_back(char(s.rx_sr));
+                    flush_pty();
+                } else if (name == "uart") {
                     fprintf(stderr, "%c", char(s.rx_sr));
+                }
             }
             if (bit == 9) {
                 // end
@@ -256,9 +604,16 @@ void uart_model::step(unsigned timestamp) {
     }
     s.tx_last = bool(tx);
 
+    if (!s.tx_active && !s.tx_queue.empty()) {
+        s.tx_active = true;
+        s.tx_counter = 0;
+        std::tie(s.tx_data, s.tx_data_div) = s.tx_queue.front();
+        s.tx_queue.pop_front();
+    }
+
     if (s.tx_active) {
         ++s.tx_counter;
-        int bit = (s.tx_counter  / baud_div);
+        int bit = (s.tx_counter  / s.tx_data_div);
         if (bit == 0) {
             rx.set(0); // start
         } else if (bit >= 1 && bit <= 8) {
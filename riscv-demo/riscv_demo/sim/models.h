@@ -6,6 +6,11 @@
 #include <vector>
 #include <algorithm>
 #include <optional>
+#include <array>
+#include <deque>
+#include <functional>
+#include <map>
+#include <memory>
 
 #include "vendor/nlohmann/json.hpp"
 
@@ -25,8 +30,13 @@ struct action {
 
 void open_event_log(const std::string &filename);
 void open_input_commands(const std::string &filename);
+// Interactive mode: stream events to stdout and read actions from stdin, one JSON object per line.
+void open_command_stream();
+// Queue actions received on stdin; returns false once stdin has been closed.
+bool poll_command_stream();
 void log_event(unsigned timestamp, const std::string &peripheral, const std::string &event_type, json payload);
 std::vector<action> get_pending_actions(const std::string &peripheral);
+bool all_actions_executed();
 void close_event_log();
 
 struct spiflash_model {
@@ -37,9 +47,29 @@ struct spiflash_model {
         std::fill(data.begin(), data.end(), 0xFF); // flash starting value
     };
 
-    void load_data(const std::string &filename, unsigned offset);
+    // With `stride` > 1, load only every `stride`-th byte of the file, starting from byte `phase`,
+    // at `offset / stride`; i.e. the part of a striped image that is stored in this chip.
+    void load_data(const std::string &filename, unsigned offset, unsigned stride = 1, unsigned phase = 0);
     void step(unsigned timestamp);
 
+    // Busy time of program and erase operations, in `step` calls (i.e. clock cycles). Defaults are
+    // typical W25Q128 datasheet values at 48 MHz.
+    struct {
+        unsigned page_program = 48 * 400;           // 0.4 ms
+        unsigned sector_erase = 48 * 45000;         // 45 ms  (4K)
+        unsigned block_erase_32k = 48 * 120000;     // 120 ms
+        unsigned block_erase_64k = 48 * 150000;     // 150 ms
+        unsigned chip_erase = 48 * 40000000U;       // 40 s
+    } timing;
+    // Set one of the `timing` fields by name, e.g. "page_program".
+    void set_timing(const std::string &operation, unsigned cycles);
+
+    // Collect access statistics, with read counts per `line_size` bytes, and write them as CSV.
+    // `lanes` is the number of chips the data is striped over, recorded for the tools that read
+    // the statistics; the addresses and lengths are those of this chip.
+    void enable_stats(unsigned line_size, unsigned lanes = 1);
+    void write_stats(const std::string &filename);
+
 private:
     std::vector<uint8_t> data;
     const value<1> &clk;
@@ -57,19 +87,72 @@ private:
         uint8_t curr_byte = 0;
         uint8_t command = 0;
         uint8_t out_buffer = 0;
+        // status register 1 (bit 0: WIP, bit 1: WEL)
+        uint8_t sr1 = 0;
+        unsigned busy_counter = 0;
+        // the command was issued while busy, and is ignored until CS# is deasserted
+        bool ignored = false;
+        // page program buffer, committed when CS# is deasserted
+        std::array<uint8_t, 256> page_buffer;
+        uint32_t page_addr = 0;
+        unsigned page_count = 0;
+        // first address of a read
+        uint32_t read_addr = 0;
+        // continuous read mode: set by mode bits M5-4 = 0b10 after a Fast Read Quad I/O, in which
+        // case the next transaction starts with the address of another one
+        bool continuous = false;
+        // this transaction started in continuous read mode, without a command byte
+        bool continuous_start = false;
     } s;
+
+    struct stats {
+        unsigned line_size, lanes;
+        std::map<uint8_t, uint64_t> commands;
+        std::map<uint32_t, uint64_t> line_reads;
+        // lengths (in bytes) of runs of reads, each starting where the previous one ended
+        std::map<uint32_t, uint64_t> run_lengths;
+        uint32_t run_start = 0, run_end = 0;
+        uint64_t transactions = 0, continuous_reads = 0, cs_cycles = 0, bytes = 0, data_bytes = 0;
+    };
+    std::unique_ptr<stats> st;
+
+    void complete_command(unsigned timestamp);
+    void update_stats();
 };
 
 struct uart_model {
-    std::string name;
-    uart_model(const std::string &name, const value<1> &tx, value<1> &rx, unsigned baud_div = 48000000/115200) : name(name), tx(tx), rx(rx), baud_div(baud_div) {};
+    static constexpr unsigned clk_freq = 48000000;
 
+    std::string name;
+    uart_model(const std::string &name, const value<1> &tx, value<1> &rx, unsigned baud_div = clk_freq/115200) : name(name), tx(tx), rx(rx), baud_div(baud_div) { s.tx_baud_div = baud_div; };
+
+    // Expose the UART as a pseudo-terminal, polled every `poll_interval` cycles. If `pace` is set,
+    // host bytes are only read as fast as they can be sent at the line rate, leaving the rest
+    // in the PTY buffer; otherwise they are all queued at once. Returns the PTY device name.
+    std::string open_pty(unsigned poll_interval, bool pace);
+    // Called for every byte transmitted by the design.
+    std::function<void(uint8_t)> on_output;
+    // Bytes of output dropped because the PTY didn't take them (e.g. while no terminal was
+    // attached) and `PTY_PENDING_LIMIT` bytes were already waiting.
+    uint64_t pty_dropped = 0;
     void step(unsigned timestamp);
 private:
     const value<1> &tx;
     value<1> &rx;
     unsigned baud_div;
 
+    int pty_master = -1, pty_slave = -1;
+    unsigned pty_poll_interval = 0;
+    bool pty_pace = false;
+
+    // Firmware output that the PTY couldn't take yet; retried at every poll. When it reaches
+    // the limit, the oldest half is dropped.
+    static constexpr size_t PTY_PENDING_LIMIT = 1 << 20;
+    std::string pty_pending;
+
+    void poll_pty();
+    void flush_pty();
+
     // model state
     struct {
         bool tx_last;
@@ -78,6 +161,10 @@ private:
         bool tx_active = false;
         int tx_counter = 0;
         uint8_t tx_data = 0;
+        // divisor of the bytes queued from now on, and of the byte being sent
+        unsigned tx_baud_div = 0, tx_data_div = 0;
+        std::deque<std::pair<uint8_t, unsigned>> tx_queue;
+        unsigned pty_counter = 0;
     } s;
 };
 
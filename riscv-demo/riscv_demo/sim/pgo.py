@@ -0,0 +1,95 @@
+import os
+import re
+import glob
+import shutil
+import hashlib
+import subprocess
+
+from chipflow_lib import ChipFlowError
+
+from . import doit_build
+
+
+__all__ = ["build_sim_pgo"]
+
+
+PGO_DIR = os.path.join(doit_build.OUTPUT_DIR, "pgo")
+# The training workload: a Zephyr boot up to its banner.
+PGO_MARKER = r"\*\*\* Booting Zephyr OS"
+PGO_TIMEOUT = 600
+
+
+def _compiler():
+    # The profiling runtime isn't shipped with `ziglang`, so the host clang is used instead; it
+    # accepts the same flags. GCC would need different ones, and a profile per object file.
+    cxx = os.environ.get("CXX", "clang++")
+    try:
+        version = subprocess.run([cxx, "--version"], capture_output=True, text=True,
+                                 check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        raise ChipFlowError(f"Could not run the C++ compiler `{cxx}`; set $CXX to a clang++")
+    if "clang" not in version:
+        raise ChipFlowError(f"Profile-guided builds need clang, but `{cxx}` is not clang; "
+                            f"set $CXX to a clang++")
+    profdata = os.environ.get("LLVM_PROFDATA") or shutil.which("llvm-profdata")
+    if profdata is None:
+        raise ChipFlowError(f"Could not find llvm-profdata (of the same LLVM version as `{cxx}`); "
+                            f"add it to $PATH or set $LLVM_PROFDATA")
+    return cxx, version, profdata
+
+
+def _compile(cxx, flags, exe):
+    sources = [f"{doit_build.OUTPUT_DIR}/sim_soc.cc", f"{doit_build.SOURCE_DIR}/main.cc",
+               f"{doit_build.SOURCE_DIR}/models.cc"]
+    # Same command line as the `build_sim` task, which runs it through the shell.
+    subprocess.run(" ".join([cxx, doit_build.CXXFLAGS, flags,
+                             doit_build.includes(doit_build.OUTPUT_DIR), f"-o {exe}", *sources,
+                             doit_build.LIBS]), shell=True, check=True)
+
+
+def build_sim_pgo(*, marker=PGO_MARKER, timeout=PGO_TIMEOUT, uart_baud=115200):
+    """Build the simulator optimized with a profile of the training workload, i.e. running
+    the firmware until the UART output (at `uart_baud`) matches `marker`.
+
+    The profile is kept under a digest of the simulator sources (including the generated
+    `sim_soc.cc`) and the compiler version, and training is skipped if there is already one.
+    """
+    cxx, version, profdata = _compiler()
+    exe = ".exe" if os.name == "nt" else ""
+    sources = [f"{doit_build.OUTPUT_DIR}/sim_soc.cc", f"{doit_build.OUTPUT_DIR}/sim_soc.h",
+               f"{doit_build.SOURCE_DIR}/main.cc", f"{doit_build.SOURCE_DIR}/models.cc",
+               f"{doit_build.SOURCE_DIR}/models.h"]
+    digest = hashlib.sha256(b"".join(open(source, "rb").read() for source in sources) +
+                            version.encode() + doit_build.CXXFLAGS.encode()).hexdigest()[:16]
+    profile_dir = os.path.join(PGO_DIR, digest)
+    profile = os.path.join(profile_dir, "sim_soc.profdata")
+
+    if os.path.exists(profile):
+        print(f"Using cached profile {profile}")
+    else:
+        os.makedirs(profile_dir, exist_ok=True)
+        for raw in glob.glob(os.path.join(profile_dir, "*.profraw")):
+            os.remove(raw)
+        instrumented = os.path.join(profile_dir, f"sim_soc{exe}")
+        _compile(cxx, "-fprofile-instr-generate", instrumented)
+
+        print(f"Training until the UART output matches {marker!r}")
+        # Run from the usual directory, so that the default firmware path is the same.
+        result = subprocess.run(
+            [os.path.abspath(instrumented), "--uart-match", marker, "--uart-baud", str(uart_baud),
+             "--timeout", str(timeout), "--meter", "0"],
+            cwd=doit_build.OUTPUT_DIR, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, text=True,
+            env={**os.environ,
+                 "LLVM_PROFILE_FILE": os.path.abspath(os.path.join(profile_dir, "%p.profraw"))})
+        stopped = re.search(r"Simulation stopped after \d+ cycles: (.*)", result.stderr)
+        if stopped is None or stopped[1] != "UART output matched":
+            raise ChipFlowError(f"The training run didn't reach {marker!r}:\n{result.stderr}")
+
+        subprocess.run([profdata, "merge", "-o", f"{profile}.tmp",
+                        *glob.glob(os.path.join(profile_dir, "*.profraw"))], check=True)
+        os.replace(f"{profile}.tmp", profile)
+
+    _compile(cxx, f"-fprofile-instr-use={profile}",
+             os.path.join(doit_build.OUTPUT_DIR, f"sim_soc{exe}"))
+    doit_build.record_pgo_build()
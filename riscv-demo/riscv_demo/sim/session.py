@@ -0,0 +1,105 @@
+import os
+import json
+import asyncio
+
+
+__all__ = ["SimSession"]
+
+
+class SimSession:
+    """Interactive session with the CXXRTL simulator.
+
+    The simulator is launched in interactive mode: it reports each event as it happens and accepts
+    actions at any time, instead of following a command script prepared in advance. Sessions are
+    independent, so any number of them can run concurrently in one event loop::
+
+        async with SimSession(args=["--timeout", "60"]) as session:
+            await session.wait_for("uart", "tx", ord(">"))
+            for char in b"help\\r":
+                await session.send("uart", "tx", char)
+
+    Like the waits in a command script, `wait_for` matches events in order: it only considers
+    the events after the one it matched last, including those that arrived before it was called.
+
+    By default, the simulator built in the project (`build/sim/sim_soc`) is run in its own
+    directory; `args` are passed to it as additional options (e.g. termination conditions).
+    """
+    def __init__(self, executable=None, *, args=(), cwd=None, stderr=None):
+        if executable is None:
+            executable = os.path.join(os.environ.get("CHIPFLOW_ROOT", "."), "build", "sim",
+                                      "sim_soc.exe" if os.name == "nt" else "sim_soc")
+        self._executable = os.path.abspath(executable)
+        self._args   = list(args)
+        self._cwd    = cwd or os.path.dirname(self._executable)
+        self._stderr = stderr
+
+        self._process = None
+        self._reader  = None
+        self._changed = None
+        self._eof     = False
+        self._cursor  = 0
+        self.events   = []
+
+    async def start(self):
+        assert self._process is None, "Session already started"
+        self._process = await asyncio.create_subprocess_exec(
+            self._executable, "--interactive", *self._args, cwd=self._cwd,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=self._stderr)
+        self._changed = asyncio.Condition()
+        self._reader = asyncio.create_task(self._read_events())
+
+    async def _read_events(self):
+        async for line in self._process.stdout:
+            async with self._changed:
+                self.events.append(json.loads(line))
+                self._changed.notify_all()
+        async with self._changed:
+            self._eof = True
+            self._changed.notify_all()
+
+    async def send(self, peripheral, event, payload):
+        """Send an action to a peripheral model, e.g. `send("uart", "tx", 0x41)`."""
+        command = {"type": "action", "peripheral": peripheral, "event": event, "payload": payload}
+        self._process.stdin.write(json.dumps(command).encode() + b"\n")
+        await self._process.stdin.drain()
+
+    async def wait_for(self, peripheral, event, payload=None, *, timeout=None):
+        """Wait for an event from a peripheral model, with any payload if `payload` is `None`.
+
+        Returns the event as a dictionary with `timestamp`, `peripheral`, `event`, and `payload`
+        keys. Raises `EOFError` if the simulator exits first, or `asyncio.TimeoutError` if
+        `timeout` (in seconds) expires first.
+        """
+        def match():
+            while self._cursor < len(self.events):
+                candidate = self.events[self._cursor]
+                self._cursor += 1
+                if (candidate["peripheral"] == peripheral and candidate["event"] == event and
+                        (payload is None or candidate["payload"] == payload)):
+                    return candidate
+            if self._eof:
+                raise EOFError(f"Simulator exited while waiting for {peripheral} {event}")
+
+        async def wait():
+            async with self._changed:
+                while (result := match()) is None:
+                    await self._changed.wait()
+                return result
+
+        return await asyncio.wait_for(wait(), timeout)
+
+    async def close(self):
+        """Stop the simulator and return its exit status."""
+        if self._process.returncode is None:
+            self._process.stdin.close() # the simulator stops once its input is closed
+        await self._reader
+        return await self._process.wait()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self._process.returncode is None:
+            self._process.kill()
+        await self.close()
@@ -1,18 +1,182 @@
+import inspect
+
 from amaranth import *
 from amaranth.lib import wiring
 from amaranth.lib.wiring import connect
+from amaranth.utils import exact_log2
 
-from amaranth_soc import csr, wishbone
+from amaranth_soc import csr
 from amaranth_soc.csr.wishbone import WishboneCSRBridge
 from amaranth_soc.wishbone.sram import WishboneSRAM
 
 from minerva.core import Minerva
 
+from .ips.interconnect import WishboneCrossbar
 from .ips.qspi import QSPIController, WishboneQSPIFlashController
-from .ips.uart import UARTPhy, UARTPeripheral
+from .ips.uart import UARTPhy, UARTPeripheral, UARTLoader, boot_rom
+
+
+__all__ = ["DemoSoC", "soc_params"]
+
+
+class DemoSoC(wiring.Component):
+    """Minerva SoC running firmware in place from a QSPI flash.
+
+    The CPU options are the parameters of the same name of :class:`minerva.core.Minerva`.
+    The caches only cover the flash; the SRAM and the peripherals are fast enough without them.
+
+    With `flash_lanes` > 1, the flash is striped over that many chips that share SCK and CS#,
+    each with its own four of the `ports.qspi.io` lines; see :class:`WishboneQSPIFlashController`.
+    With `flash_continuous_read`, the flash is read in continuous read mode, which needs IO2 and
+    IO3 to be connected; this also selects the read command, Fast Read Quad I/O (EBh) rather
+    than Read (03h). `flash_divisor_init` is the SCK divisor used until the firmware changes or
+    calibrates it, and `flash_use_ddr_buffers` clocks the QSPI lines with DDR I/O buffers.
+
+    `uart_baud` is the baud rate of the UART until the firmware changes it.
+
+    With `with_uart_loader`, firmware can also be loaded to the SRAM over the UART line at
+    `uart_loader_baud`, without writing it to the flash; see :class:`UARTLoader` and
+    `riscv_demo/tools/uart_boot.py`. The CPU then boots from a ROM, which jumps to the firmware in
+    the SRAM if one was loaded, or in the flash otherwise.
+
+    Memory map
+    ----------
+    0x00000000  QSPI flash (the firmware starts at 0x00100000, after the bitstream)
+    0x10000000  SRAM
+    0x20000000  boot ROM (with `with_uart_loader`)
+    0xb0000000  CSRs; the QSPI flash controller is at 0xb0000000, the UART at 0xb2000000, the UART
+                loader at 0xb3000000
+    """
+    mem_flash_base   = 0x00000000
+    mem_sram_base    = 0x10000000
+    mem_bootrom_base = 0x20000000
+    csr_base         = 0xb0000000
+    csr_flash_base   = 0xb0000000
+    csr_uart_base    = 0xb2000000
+    csr_loader_base  = 0xb3000000
+
+    flash_size   = 0x01000000
+    bootrom_size = 0x20
+    reset_addr   = 0x00100000
+
+    # Sample delays (in cycles) that QSPI flash calibration tries at each divisor.
+    flash_max_sample_delay = 3
+
+    def __init__(self, ports, *, clk_freq=48e6, sram_size=0x2000,
+                 with_icache=False, icache_nways=1, icache_nlines=32, icache_nwords=4,
+                 with_dcache=False, dcache_nways=1, dcache_nlines=32, dcache_nwords=4,
+                 with_muldiv=True, flash_lanes=1, flash_continuous_read=False,
+                 flash_divisor_init=0, flash_use_ddr_buffers=False, uart_baud=115200,
+                 with_uart_loader=False, uart_loader_baud=1_000_000):
+        self._ports       = ports
+        self._clk_freq    = clk_freq
+        self._sram_size   = sram_size
+        self._flash_lanes = flash_lanes
+        self._flash_continuous_read = flash_continuous_read
+        self._flash_divisor_init    = flash_divisor_init
+        self._flash_use_ddr_buffers = flash_use_ddr_buffers
+        self._uart_baud        = uart_baud
+        self._with_uart_loader = with_uart_loader
+        self._uart_loader_baud = uart_loader_baud
+
+        self._cpu_params = dict(
+            with_icache=with_icache,
+            icache_nways=icache_nways, icache_nlines=icache_nlines, icache_nwords=icache_nwords,
+            icache_base=self.mem_flash_base, icache_limit=self.mem_flash_base + self.flash_size,
+            with_dcache=with_dcache,
+            dcache_nways=dcache_nways, dcache_nlines=dcache_nlines, dcache_nwords=dcache_nwords,
+            dcache_base=self.mem_flash_base, dcache_limit=self.mem_flash_base + self.flash_size,
+            with_muldiv=with_muldiv,
+        )
+
+        super().__init__({})
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Instruction fetches and data accesses to different targets proceed in parallel, e.g.
+        # loads from SRAM don't wait for a fetch from flash to complete.
+        m.submodules.crossbar = crossbar = \
+            WishboneCrossbar(addr_width=30, data_width=32, granularity=8)
+        m.submodules.csr_decoder = csr_decoder = csr.Decoder(addr_width=28, data_width=8)
+
+        # CPU
+
+        if self._with_uart_loader:
+            # The UART loader holds the CPU (and the UART) in reset while it loads an image, after
+            # which the boot ROM jumps to it.
+            m.submodules.uart_loader = uart_loader = \
+                UARTLoader(divisor=int(self._clk_freq // self._uart_loader_baud),
+                           mem_base=self.mem_sram_base, mem_size=self._sram_size,
+                           timeout=int(self._clk_freq // 10))
+            cpu = Minerva(reset_address=self.mem_bootrom_base, **self._cpu_params)
+            m.submodules.cpu = ResetInserter(uart_loader.cpu_reset)(cpu)
+        else:
+            m.submodules.cpu = cpu = Minerva(reset_address=self.reset_addr, **self._cpu_params)
+        crossbar.add_initiator(cpu.ibus)
+        crossbar.add_initiator(cpu.dbus)
+
+        # QSPI flash
+
+        m.submodules.qspi = qspi = \
+            QSPIController(self._ports.qspi, lane_count=self._flash_lanes,
+                           use_ddr_buffers=self._flash_use_ddr_buffers,
+                           max_sample_delay=self.flash_max_sample_delay)
+        m.submodules.flash = flash = \
+            WishboneQSPIFlashController(addr_width=exact_log2(self.flash_size // 4), data_width=32,
+                                        lane_count=self._flash_lanes,
+                                        continuous_read=self._flash_continuous_read,
+                                        divisor_init=self._flash_divisor_init,
+                                        max_sample_delay=self.flash_max_sample_delay)
+        connect(m, flash.spi_bus, qspi)
+        crossbar.add_target(flash.wb_bus, name="flash", addr=self.mem_flash_base)
+        csr_decoder.add(flash.csr_bus, name="flash", addr=self.csr_flash_base - self.csr_base)
+
+        # SRAM
+
+        m.submodules.sram = sram = \
+            WishboneSRAM(size=self._sram_size, data_width=32, granularity=8)
+        crossbar.add_target(sram.wb_bus, name="sram", addr=self.mem_sram_base)
+
+        # UART
+
+        m.submodules.uart_phy = uart_phy = UARTPhy(self._ports.uart, self._clk_freq)
+        uart = UARTPeripheral(divisor_init=int(self._clk_freq // self._uart_baud))
+        if self._with_uart_loader:
+            m.submodules.uart = ResetInserter(uart_loader.cpu_reset)(uart)
+        else:
+            m.submodules.uart = uart
+        connect(m, uart.phy, uart_phy)
+        csr_decoder.add(uart.csr_bus, name="uart", addr=self.csr_uart_base - self.csr_base)
+
+        # UART loader and boot ROM
+
+        if self._with_uart_loader:
+            m.d.comb += uart_loader.rx.eq(uart_phy.rx.line)
+            crossbar.add_initiator(uart_loader.wb_bus)
+            csr_decoder.add(uart_loader.csr_bus, name="uart_loader",
+                            addr=self.csr_loader_base - self.csr_base)
+
+            m.submodules.bootrom = bootrom = \
+                WishboneSRAM(size=self.bootrom_size, data_width=32, granularity=8, writable=False,
+                             init=boot_rom(status_addr=self.csr_loader_base,
+                                           image_addr=self.mem_sram_base,
+                                           fallback_addr=self.reset_addr))
+            crossbar.add_target(bootrom.wb_bus, name="bootrom", addr=self.mem_bootrom_base)
+
+        # Wishbone-CSR bridge
+
+        m.submodules.wb_to_csr = wb_to_csr = WishboneCSRBridge(csr_decoder.bus, data_width=32)
+        crossbar.add_target(wb_to_csr.wb_bus, name="csr", addr=self.csr_base)
 
+        return m
 
-__all__ = ["DemoSoC"]
 
+def soc_params(config):
+    """Return the `DemoSoC` parameters in the `[chipflow.soc]` section of the configuration.
 
-# TODO
+    Raises :exc:`TypeError` if the section has options that aren't `DemoSoC` parameters.
+    """
+    params = config["chipflow"].get("soc", {})
+    inspect.signature(DemoSoC).bind(None, **params)
+    return params
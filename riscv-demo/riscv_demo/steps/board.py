@@ -1,25 +1,33 @@
-from amaranth import *
+import os
+import json
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 
-from doit.cmd_base import ModuleTaskLoader
-from doit.doit_cmd import DoitMain
+from amaranth import *
 
+from chipflow_lib import ChipFlowError
 from chipflow_lib.steps.board import BoardStep
 
-from glasgow.platform.generic import GlasgowPlatformPort
-from glasgow.platform.rev_c import GlasgowRevC123Platform
-from glasgow.target.hardware import GlasgowBuildPlan
-from glasgow.target.toolchain import find_toolchain
-
-from ..soc import DemoSoC
-from ..board import doit_glasgow
+from ..history import parse_yosys_log, parse_nextpnr_log, record_build
 from ..ips.ports import PortGroup
 
 
 __all__ = ["GlasgowBoardStep"]
 
 
+CACHE_DIR = Path("build/board/cache")
+NEXTPNR_OPTS = "--timing-allow-fail"
+
+
 class _GlasgowTop(Elaboratable):
+    def __init__(self, **soc_params):
+        self._soc_params = soc_params
+
     def elaborate(self, platform):
+        from glasgow.platform.generic import GlasgowPlatformPort
+        from ..soc import DemoSoC
+
         m = Module()
 
         a_ports = [platform.request("port_a", n, dir={"io": "-", "oe": "-"}) for n in range(8)]
@@ -39,20 +47,124 @@ class _GlasgowTop(Elaboratable):
         ports.uart.rx = GlasgowPlatformPort(io=a_ports[0].io, oe=a_ports[0].oe)
         ports.uart.tx = GlasgowPlatformPort(io=a_ports[1].io, oe=a_ports[1].oe)
 
-        m.submodules.soc = soc = DemoSoC(ports)
+        m.submodules.soc = soc = DemoSoC(ports, **self._soc_params)
 
         return m
 
 
+def _build_plan(nextpnr_opts, soc_params):
+    from glasgow.platform.rev_c import GlasgowRevC123Platform
+    from glasgow.target.hardware import GlasgowBuildPlan
+    from glasgow.target.toolchain import find_toolchain
+
+    return GlasgowBuildPlan(
+        find_toolchain(),
+        GlasgowRevC123Platform().prepare(_GlasgowTop(**soc_params), nextpnr_opts=nextpnr_opts))
+
+
+def _build_cached(nextpnr_opts, soc_params):
+    # Runs in a worker process when building several seeds, so the design is elaborated (and
+    # the platform created) here rather than passed in.
+    plan = _build_plan(nextpnr_opts, soc_params)
+    # The bitstream ID is a digest of the elaborated design, the build options and the toolchain
+    # version, so it can be used as a cache key; switching back to a design built before is
+    # a cache hit.
+    cache_dir = CACHE_DIR / plan.bitstream_id.hex()
+    if (cache_dir / "top.bin").exists():
+        print(f"Using cached bitstream {cache_dir}")
+    else:
+        plan.execute(build_dir=str(cache_dir), debug=True)
+    return cache_dir
+
+
+def _read_fmax(cache_dir):
+    fmax, _ = parse_nextpnr_log((cache_dir / "top.tim").read_text())
+    return fmax
+
+
+def _select_seed(builds, target_freq=None):
+    """Choose the bitstream to use among those built with several seeds.
+
+    `builds` yields a `(seed, build)` pair as each seed finishes, where `build()` returns the
+    cache directory of its bitstream (or raises if the build failed). It is only consumed up to
+    the first seed whose slowest clock reaches `target_freq` (in MHz), if given; otherwise the
+    seed with the fastest slowest clock is chosen.
+
+    Returns the chosen result and the results of all the seeds consumed, each a dict with the
+    `seed`, the `fmax` of each clock, and the `build_dir`.
+    """
+    results = []
+    for seed, build in builds:
+        # A seed that fails, or whose report has no timing (e.g. if the format of the nextpnr log
+        # changes), is recorded but not ranked.
+        try:
+            cache_dir = build()
+            fmax = _read_fmax(cache_dir)
+        except Exception as error:
+            print(f"Seed {seed}: failed: {error}")
+            results.append({"seed": seed, "fmax": {}, "build_dir": None})
+            continue
+        results.append({"seed": seed, "fmax": fmax, "build_dir": str(cache_dir)})
+        if not fmax:
+            print(f"Seed {seed}: no timing in {cache_dir / 'top.tim'}")
+            continue
+        print(f"Seed {seed}: " +
+              ", ".join(f"{clock} {freq:.2f} MHz" for clock, freq in fmax.items()))
+        if target_freq is not None and min(fmax.values()) >= target_freq:
+            return results[-1], results
+
+    timed = [result for result in results if result["fmax"]]
+    if not timed:
+        raise ChipFlowError(f"None of the {len(results)} seeds produced a timing report")
+    return max(timed, key=lambda result: min(result["fmax"].values())), results
+
+
+def _store_seed(best, results, target_freq, cache_dir):
+    """Copy the bitstream and reports of the `best` seed to `cache_dir`, and record the results
+    of all the seeds in its `seeds.json`."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for filename in ("top.bin", "top.tim", "top.rpt"):
+        shutil.copyfile(Path(best["build_dir"]) / filename, cache_dir / filename)
+    with open(cache_dir / "seeds.json", "w") as f:
+        json.dump({"selected": best["seed"], "target_freq": target_freq,
+                   "results": sorted(results, key=lambda result: result["seed"])}, f, indent=2)
+
+
+def _record_build(cache_dir):
+    fmax, utilisation = parse_nextpnr_log((cache_dir / "top.tim").read_text())
+    cells = parse_yosys_log((cache_dir / "top.rpt").read_text())
+    metrics = {f"fmax.{clock}": freq for clock, freq in fmax.items()}
+    metrics.update({f"util.{bel}": count for bel, count in utilisation.items()})
+    metrics["cells.lut"] = cells.get("SB_LUT4", 0)
+    metrics["cells.ff"]  = sum(count for cell, count in cells.items() if cell.startswith("SB_DFF"))
+    record_build("board", metrics)
+
+
+# Glasgow, the design and doit are only imported by the actions that use them: every `chipflow`
+# command creates all of the steps. (The Glasgow platform is created by `_build_plan`.)
 class GlasgowBoardStep(BoardStep):
     def __init__(self, config):
-        platform = GlasgowRevC123Platform()
-        super().__init__(config, platform)
+        super().__init__(config, None)
+        self._config = config
+
+    @property
+    def _soc_params(self):
+        from ..soc import soc_params
+        return soc_params(self._config)
 
     def build_cli_parser(self, parser):
         action_argument = parser.add_subparsers(dest="action")
         build_subparser = action_argument.add_parser(
             "build-bitstream", help="Build the FPGA bitstream.")
+        build_subparser.add_argument(
+            "--seeds", type=int, default=1, metavar="COUNT",
+            help="place and route with COUNT seeds and keep the fastest bitstream")
+        build_subparser.add_argument(
+            "--target-freq", type=float, default=None, metavar="MHZ",
+            help="keep the first seed that reaches MHZ and skip the seeds not yet started")
+        build_subparser.add_argument(
+            "--jobs", type=int, default=None, metavar="COUNT",
+            help="number of seeds to build at once (default: number of CPUs)")
         bitstream_subparser = action_argument.add_parser(
             "load-bitstream", help="Load the FPGA bitstream to the board.")
         software_subparser = action_argument.add_parser(
@@ -60,20 +172,57 @@ class GlasgowBoardStep(BoardStep):
 
     def run_cli(self, args):
         if args.action == "build-bitstream":
-            self.build_bitstream()
+            self.build_bitstream(seeds=args.seeds, target_freq=args.target_freq, jobs=args.jobs)
         if args.action == "load-bitstream":
             self.load_bitstream()
         if args.action == "flash-software":
             self.flash_software()
 
-    def build_bitstream(self):
-        plan = GlasgowBuildPlan(
-            find_toolchain(),
-            self.platform.prepare(_GlasgowTop(), nextpnr_opts="--timing-allow-fail"))
-        plan.execute(build_dir="build/board", debug=True)
+    def build_bitstream(self, *, seeds=1, target_freq=None, jobs=None):
+        from ..yosys import find_yosys
+
+        if self._soc_params.get("flash_lanes", 1) != 1:
+            raise ChipFlowError("The Glasgow board only has pins for one flash chip; "
+                                "set `flash_lanes` to 1")
+        if find_yosys().native:
+            # Glasgow checks the versions of the system tools itself, and falls back to its
+            # built-in (YoWASP) ones if any of them is missing or too old.
+            os.environ.setdefault("GLASGOW_TOOLCHAIN", "system,builtin")
+        if seeds > 1:
+            self._build_seeds(seeds, target_freq, jobs)
+        cache_dir = _build_cached(NEXTPNR_OPTS, self._soc_params)
+        shutil.copyfile(cache_dir / "top.bin", "build/board/top.bin")
+        _record_build(cache_dir)
+
+    def _build_seeds(self, seeds, target_freq, jobs):
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(_build_cached, f"{NEXTPNR_OPTS} --seed {seed}",
+                                self._soc_params): seed
+                for seed in range(1, seeds + 1)
+            }
+            best, results = _select_seed(
+                ((futures[future], future.result) for future in as_completed(futures)),
+                target_freq)
+            # Seeds that are already running still finish, but their results are not used.
+            for pending in futures:
+                pending.cancel()
+        print(f"Using seed {best['seed']}")
+
+        # Store the chosen bitstream under the key of the seedless build, so that later builds
+        # of the same design (including the one `load-bitstream` runs) pick it up from the cache.
+        default_plan = _build_plan(NEXTPNR_OPTS, self._soc_params)
+        _store_seed(best, results, target_freq, CACHE_DIR / default_plan.bitstream_id.hex())
+
+    def _run_tasks(self, tasks):
+        from doit.cmd_base import ModuleTaskLoader
+        from doit.doit_cmd import DoitMain
+        from ..board import doit_glasgow
+
+        DoitMain(ModuleTaskLoader(doit_glasgow)).run(tasks)
 
     def load_bitstream(self):
-        DoitMain(ModuleTaskLoader(doit_glasgow)).run(["load_bitstream"])
+        self._run_tasks(["load_bitstream"])
 
     def flash_software(self):
-        DoitMain(ModuleTaskLoader(doit_glasgow)).run(["flash_software"])
+        self._run_tasks(["flash_software"])
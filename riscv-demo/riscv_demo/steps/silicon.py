@@ -1,19 +1,30 @@
+import argparse
+import functools
+import operator
+
 from amaranth import *
 from amaranth.lib import io
 from amaranth.lib.cdc import FFSynchronizer
 
 from chipflow_lib.platforms.silicon import SiliconPlatformPort
+from chipflow_lib import ChipFlowError
 from chipflow_lib.steps.silicon import SiliconStep
 
-from ..soc import DemoSoC
 from ..ips.ports import PortGroup
+from ..estimate import find_liberty, estimate_design
+from ..history import record_build
 
 
 __all__ = ["IHP130SiliconStep"]
 
 
 class _IHP130Top(Elaboratable):
+    def __init__(self, **soc_params):
+        self._soc_params = soc_params
+
     def elaborate(self, platform):
+        from ..soc import DemoSoC
+
         m = Module()
 
         # Clock generation
@@ -38,19 +49,77 @@ class _IHP130Top(Elaboratable):
 
         ports.qspi = PortGroup()
         ports.qspi.sck = platform.request("flash_clk")
-        ports.qspi.io = (platform.request("flash_d0") + platform.request("flash_d1") +
-                         platform.request("flash_d2") + platform.request("flash_d3"))
+        # A striped flash needs the `flash_d4`, `flash_d5`, etc. pads too.
+        flash_lanes = self._soc_params.get("flash_lanes", 1)
+        ports.qspi.io = functools.reduce(operator.add,
+            (platform.request(f"flash_d{n}") for n in range(4 * flash_lanes)))
         ports.qspi.cs = platform.request("flash_csn")
 
         ports.uart = PortGroup()
         ports.uart.rx = platform.request("uart0_rx")
         ports.uart.tx = platform.request("uart0_tx")
 
-        m.submodules.soc = soc = DemoSoC(ports)
+        m.submodules.soc = soc = DemoSoC(ports, **self._soc_params)
 
         return m
 
 
+# The design is only imported by the actions that elaborate it: every `chipflow` command creates
+# all of the steps.
 class IHP130SiliconStep(SiliconStep):
+    def __init__(self, config):
+        super().__init__(config)
+        self._config = config
+
+    @property
+    def _soc_params(self):
+        from ..soc import soc_params
+        return soc_params(self._config)
+
+    def build_cli_parser(self, parser):
+        action_argument = parser.add_subparsers(dest="action")
+        prepare_subparser = action_argument.add_parser(
+            "prepare", help="Only prepare the design.")
+        submit_subparser = action_argument.add_parser(
+            "submit", help="Submit the design to ChipFlow cloud builder.")
+        submit_subparser.add_argument(
+            "--dry-run", help=argparse.SUPPRESS, default=False, action="store_true")
+        estimate_subparser = action_argument.add_parser(
+            "estimate", help="Estimate the area and logic depth of the design locally.")
+        estimate_subparser.add_argument(
+            "--liberty", metavar="FILE",
+            help="standard cell library (default: the sg13g2 typical corner in $PDK_ROOT)")
+        estimate_subparser.add_argument(
+            "--jobs", metavar="COUNT", type=int,
+            help="number of modules to synthesize at once (default: number of CPUs)")
+
+    def run_cli(self, args):
+        if args.action == "estimate":
+            self.estimate(liberty=args.liberty, jobs=args.jobs)
+        else:
+            super().run_cli(args)
+
     def prepare(self):
-        return self.platform.build(_IHP130Top(), name="ihp130_top")
+        return self.platform.build(_IHP130Top(**self._soc_params), name="ihp130_top")
+
+    def estimate(self, *, liberty=None, jobs=None):
+        liberty = liberty or find_liberty()
+        if liberty is None:
+            raise ChipFlowError("Could not find the sg13g2 standard cell library; "
+                                "set $PDK_ROOT or use --liberty")
+        results, top = estimate_design(self.prepare(), liberty, jobs=jobs)
+
+        print(f"{'module':<48} {'area (um2)':>12} {'cells':>8} {'depth':>6}")
+        for name, result in sorted(results.items()):
+            if result["instances"] == 0:
+                continue
+            name   = name.removeprefix("\\")
+            marker = "" if result["cached"] else " *"
+            print(f"{name:<48} {result['area']:>12.1f} "
+                  f"{result['cells']:>8} {result['depth']:>6}{marker}")
+        area  = sum(result["area"]  * result["instances"] for result in results.values())
+        cells = sum(result["cells"] * result["instances"] for result in results.values())
+        depth = max(result["depth"] for result in results.values() if result["instances"])
+        print(f"{'total':<48} {area:>12.1f} {cells:>8} {depth:>6}")
+        print("(* synthesized now, others from cache; area and cells exclude submodules)")
+        record_build("silicon", {"area": area, "cells": cells, "depth": depth})
@@ -1,30 +1,41 @@
 import os
+import sys
+import subprocess
 from pathlib import Path
 
 from amaranth import *
 from amaranth.lib import io
-from amaranth.back import rtlil
-
-from doit.cmd_base import ModuleTaskLoader
-from doit.doit_cmd import DoitMain
 
+from chipflow_lib import ChipFlowError
 from chipflow_lib.steps.sim import SimStep
 
-from ..soc import DemoSoC
-from ..sim import doit_build
 from ..ips.ports import PortGroup
 
 
-__all__ = ["CXXRTLSimStep"]
+__all__ = ["PIPELINES", "CXXRTLSimStep"]
+
+
+# The Yosys passes run on the design before `write_cxxrtl`, and the options of `write_cxxrtl`.
+PIPELINES = {
+    # Every wire can be inspected, in traces, with `--idle` and `--profile`, and in the debugger.
+    "debug": ([], "-g4"),
+    # Flattening and optimizing across modules, and only keeping debug information for the wires
+    # that hold state, makes the generated code much smaller. (The FF optimizations of `opt` are
+    # left out, as CXXRTL would need delta cycles to evaluate some of the enables they create.)
+    "fast":  (["proc", "flatten", "opt -noff"], "-g1"),
+}
 
 
 class _SimTop(Elaboratable):
-    def __init__(self):
+    def __init__(self, **soc_params):
+        self._soc_params = soc_params
+
         self.ports = PortGroup()
 
         self.ports.qspi = PortGroup()
         self.ports.qspi.sck = io.SimulationPort("o",  1, name="qspi_sck")
-        self.ports.qspi.io  = io.SimulationPort("io", 4, name="qspi_io")
+        self.ports.qspi.io  = io.SimulationPort("io", 4 * soc_params.get("flash_lanes", 1),
+                                                name="qspi_io")
         self.ports.qspi.cs  = io.SimulationPort("o",  1, name="qspi_cs")
 
         self.ports.uart = PortGroup()
@@ -32,22 +43,43 @@ class _SimTop(Elaboratable):
         self.ports.uart.tx = io.SimulationPort("o", 1, name="uart_tx")
 
     def elaborate(self, platform):
+        from ..soc import DemoSoC
+
         m = Module()
-        m.submodules.soc = soc = DemoSoC(self.ports)
+        m.submodules.soc = soc = DemoSoC(self.ports, **self._soc_params)
         return m
 
 
 class _SimPlatform:
-    def __init__(self):
-        self.build_dir = os.path.join(os.environ['CHIPFLOW_ROOT'], 'build', 'sim')
+    def __init__(self, build_dir=None, pipeline="debug"):
+        if build_dir is None:
+            build_dir = os.path.join(os.environ['CHIPFLOW_ROOT'], 'build', 'sim')
+        if pipeline not in PIPELINES:
+            raise ValueError(f"Unknown pipeline {pipeline!r}; expected one of "
+                             f"{', '.join(PIPELINES)}")
+        self.build_dir = build_dir
+        self.pipeline  = pipeline
         self.extra_files = dict()
 
+    def last_pipeline(self):
+        """Return the pipeline of the last build, which is recorded in `sim_soc.ys`."""
+        try:
+            with open(Path(self.build_dir) / "sim_soc.ys") as yosys_file:
+                first_line = yosys_file.readline()
+        except FileNotFoundError:
+            return "debug"
+        if first_line.startswith("# pipeline: ") and first_line[12:].strip() in PIPELINES:
+            return first_line[12:].strip()
+        return "debug"
+
     def add_file(self, filename, content):
         if not isinstance(content, (str, bytes)):
             content = content.read()
         self.extra_files[filename] = content
 
     def build(self, e):
+        from amaranth.back import rtlil
+
         Path(self.build_dir).mkdir(parents=True, exist_ok=True)
 
         ports = [
@@ -65,6 +97,7 @@ class _SimPlatform:
             rtlil_file.write(output)
         top_ys = Path(self.build_dir) / "sim_soc.ys"
         with open(top_ys, "w") as yosys_file:
+            print(f"# pipeline: {self.pipeline}", file=yosys_file)
             for extra_filename, extra_content in self.extra_files.items():
                 extra_path = Path(self.build_dir) / extra_filename
                 with open(extra_path, "w") as extra_file:
@@ -74,38 +107,186 @@ class _SimPlatform:
                 else:
                     # FIXME: use -defer (workaround for YosysHQ/yosys#4059)
                     print(f"read_verilog {extra_path}", file=yosys_file)
-            print("read_ilang sim_soc.il", file=yosys_file)
+            print("read_rtlil sim_soc.il", file=yosys_file)
             print("hierarchy -top sim_top", file=yosys_file)
-            print("write_cxxrtl -header sim_soc.cc", file=yosys_file)
+            passes, cxxrtl_options = PIPELINES[self.pipeline]
+            for yosys_pass in passes:
+                print(yosys_pass, file=yosys_file)
+            print(f"write_cxxrtl -header {cxxrtl_options} sim_soc.cc", file=yosys_file)
 
 
+# The design, doit and the Yosys toolchain are only imported by the actions that use them: every
+# `chipflow` command creates all of the steps.
 class CXXRTLSimStep(SimStep):
     def __init__(self, config):
         platform = _SimPlatform()
         super().__init__(config, platform)
+        self._config = config
+
+    @property
+    def _soc_params(self):
+        from ..soc import soc_params
+        return soc_params(self._config)
+
+    def _run_tasks(self, tasks):
+        from doit.doit_cmd import DoitMain
+        from ..sim import doit_build
+
+        status = DoitMain(doit_build.make_loader(self.build_rtlil)).run(tasks)
+        if status != 0:
+            sys.exit(status)
 
     def build_cli_parser(self, parser):
         action_argument = parser.add_subparsers(dest="action")
         rtlil_subparser = action_argument.add_parser(
             "build-rtlil", help="(internal) Build the RTLIL of the design.")
+        rtlil_subparser.add_argument(
+            "--pipeline", choices=PIPELINES)
         build_subparser = action_argument.add_parser(
             "build", help="Build the CXXRTL simulation.")
+        build_subparser.add_argument(
+            "--pipeline", choices=PIPELINES,
+            help="generate the simulation for debugging (all wires visible) or for speed "
+                 "(default: that of the last build, initially debug; see "
+                 "riscv_demo/pipeline_bench.py)")
+        build_subparser.add_argument(
+            "--pgo", action="store_true",
+            help="optimize the build with a profile of booting the firmware (the profile is "
+                 "cached for each design)")
+        build_subparser.add_argument(
+            "--pgo-marker", metavar="REGEX",
+            help="end the profiled run when the UART output matches REGEX "
+                 "(default: the Zephyr boot banner)")
         run_subparser = action_argument.add_parser(
             "run", help="Run the CXXRTL simulation.")
+        run_subparser.add_argument(
+            "--commands", metavar="FILE",
+            help="read input commands from FILE")
+        run_subparser.add_argument(
+            "--events", metavar="FILE",
+            help="write the event log to FILE")
+        run_subparser.add_argument(
+            "--cycles", metavar="N", type=int,
+            help="stop after N cycles")
+        run_subparser.add_argument(
+            "--timeout", metavar="SECONDS", type=float,
+            help="stop after SECONDS of wall-clock time")
+        run_subparser.add_argument(
+            "--after-commands", metavar="N", type=int,
+            help="stop N cycles after all input commands have been executed")
+        run_subparser.add_argument(
+            "--uart-match", metavar="REGEX",
+            help="stop when the current line of UART output matches REGEX")
+        run_subparser.add_argument(
+            "--idle", metavar="N", type=int,
+            help="stop when the CPU has made no data accesses, and only fetched instructions "
+                 "from a few words, for N cycles")
+        run_subparser.add_argument(
+            "--profile", metavar="FILE",
+            help="sample the address of the CPU instruction fetches and write a histogram to "
+                 "FILE (see tools/sim_profile.py)")
+        run_subparser.add_argument(
+            "--flash-stats", metavar="FILE",
+            help="write flash access statistics to FILE (see tools/flash_stats.py)")
+        run_subparser.add_argument(
+            "--flash-timing", metavar="OP=CYCLES", action="append",
+            help="make a flash program or erase operation (page_program, sector_erase, "
+                 "block_erase_32k, block_erase_64k, chip_erase) take CYCLES (may be repeated)")
+        run_subparser.add_argument(
+            "--uart-pty", action="store_true",
+            help="connect the UART to a pseudo-terminal (e.g. for a terminal emulator or "
+                 "tools/uart_boot.py) instead of the console")
+        run_subparser.add_argument(
+            "--uart-pty-pace", action="store_true",
+            help="only read input from the pseudo-terminal as fast as the UART can send it")
+        run_subparser.add_argument(
+            "--meter", metavar="SECONDS", type=float,
+            help="report the simulation speed every SECONDS (default: 10; 0 to only report it "
+                 "at exit)")
+        run_subparser.add_argument(
+            "--breakdown", action="store_true",
+            help="report the host time spent in the design and in each model at exit")
 
     def run_cli(self, args):
         if args.action == "build-rtlil":
-            self.build_rtlil()
+            self.build_rtlil(pipeline=args.pipeline)
         if args.action == "build":
-            self.build()
+            self.build(pipeline=args.pipeline, pgo=args.pgo, pgo_marker=args.pgo_marker)
         if args.action == "run":
-            self.run()
+            self.run(commands=args.commands, events=args.events, cycles=args.cycles,
+                     timeout=args.timeout, after_commands=args.after_commands,
+                     uart_match=args.uart_match, idle=args.idle, profile=args.profile,
+                     flash_stats=args.flash_stats, flash_timing=args.flash_timing,
+                     uart_pty=args.uart_pty, uart_pty_pace=args.uart_pty_pace,
+                     meter=args.meter, breakdown=args.breakdown)
+
+    def build_rtlil(self, *, pipeline=None):
+        self.platform.pipeline = pipeline or self.platform.last_pipeline()
+        self.platform.build(_SimTop(**self._soc_params))
+
+    def build(self, *, pipeline=None, pgo=False, pgo_marker=None):
+        # The RTLIL is always rebuilt (also by `run`), with the pipeline of the last build unless
+        # another one is given.
+        tasks = ["build_sim_rtlil"]
+        if pipeline is not None:
+            tasks += ["--pipeline", pipeline]
+        if pgo:
+            from ..sim.pgo import build_sim_pgo
+
+            self._run_tasks([*tasks, "build_sim_cxxrtl"])
+            build_sim_pgo(uart_baud=self._soc_params.get("uart_baud", 115200),
+                          **({} if pgo_marker is None else {"marker": pgo_marker}))
+        else:
+            from ..sim import doit_build
+
+            # `run` keeps a profile-guided build while it is current, but this replaces it.
+            doit_build.discard_pgo_build()
+            self._run_tasks([*tasks, "build_sim"])
+
+    def run(self, *, commands=None, events=None, cycles=None, timeout=None,
+            after_commands=None, uart_match=None, idle=None, profile=None, flash_stats=None,
+            flash_timing=(), uart_pty=False, uart_pty_pace=False, meter=None, breakdown=False):
+        """Run the simulation until one of the termination conditions is met.
 
-    def build_rtlil(self):
-        self.platform.build(_SimTop())
+        The run fails if the `cycles` or `timeout` limit is reached before any of
+        the `after_commands`, `uart_match`, or `idle` conditions; the process then exits with
+        the status of the simulator, 2 or 3 respectively.
 
-    def build(self):
-        DoitMain(ModuleTaskLoader(doit_build)).run(["build_sim"])
+        `idle` and `profile` read wires of the CPU, so they need a simulation built with the
+        debug pipeline.
+        """
+        if (idle is not None or profile is not None) and self.platform.last_pipeline() != "debug":
+            raise ChipFlowError("--idle and --profile need a simulation built with the debug "
+                                "pipeline; run `chipflow sim build --pipeline debug` first")
+        # The UART output is decoded at the baud rate the design starts with.
+        sim_args = ["--uart-baud", str(self._soc_params.get("uart_baud", 115200))]
+        for option, value in (("--commands", commands and os.path.abspath(commands)),
+                              ("--events", events and os.path.abspath(events)),
+                              ("--cycles", cycles),
+                              ("--timeout", timeout),
+                              ("--after-commands", after_commands),
+                              ("--uart-match", uart_match),
+                              ("--idle", idle),
+                              ("--profile", profile and os.path.abspath(profile)),
+                              ("--flash-stats", flash_stats and os.path.abspath(flash_stats)),
+                              ("--meter", meter)):
+            if value is not None:
+                sim_args += [option, str(value)]
+        for operation in flash_timing or ():
+            sim_args += ["--flash-timing", operation]
+        if uart_pty:
+            sim_args.append("--uart-pty")
+        if uart_pty_pace:
+            sim_args.append("--uart-pty-pace")
+        if breakdown:
+            sim_args.append("--breakdown")
+        # The simulator is run here rather than by the `run_sim` task, as doit would replace its
+        # exit status with its own.
+        from ..sim import doit_build
 
-    def run(self):
-        DoitMain(ModuleTaskLoader(doit_build)).run(["run_sim"])
+        self._run_tasks(["build_sim"])
+        executable = os.path.abspath(os.path.join(doit_build.OUTPUT_DIR,
+                                                  "sim_soc.exe" if os.name == "nt" else "sim_soc"))
+        status = subprocess.run([executable, *sim_args], cwd=doit_build.OUTPUT_DIR).returncode
+        if status != 0:
+            sys.exit(status)
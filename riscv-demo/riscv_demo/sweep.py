@@ -0,0 +1,185 @@
+import os
+import re
+import csv
+import json
+import hashlib
+import argparse
+import itertools
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from .sim import doit_build
+from .yosys import run_yosys
+from .estimate import find_liberty, estimate_design
+
+
+__all__ = ["expand_grid", "check_variants", "run_variant"]
+
+
+SWEEP_DIR = os.path.join("build", "sweep")
+
+
+def expand_grid(grid):
+    """Return the parameters of each variant in a grid, i.e. the cartesian product of the lists
+    of values in `grid` (a mapping of `DemoSoC` parameter names to lists of values).
+
+    E.g. `{"flash_continuous_read": [False, True], "flash_divisor_init": [0, 1, 2],
+    "flash_use_ddr_buffers": [False, True], "uart_baud": [115200, 1000000]}` sweeps the read
+    command and width, the SCK divisor and I/O buffers of the flash, and the UART baud rate.
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def check_variants(variants):
+    """Raise :exc:`TypeError` if any of `variants` has parameters that aren't `DemoSoC`
+    parameters."""
+    from .soc import soc_params
+
+    for params in variants:
+        soc_params({"chipflow": {"soc": params}})
+
+
+def _variant_key(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _build_variant(params, variant_dir, models_obj):
+    # Imported here so that the grid can be handled without the design's dependencies.
+    from .steps.sim import _SimTop, _SimPlatform
+
+    os.makedirs(variant_dir, exist_ok=True)
+    with open(os.path.join(variant_dir, "params.json"), "w") as f:
+        json.dump(params, f, indent=2)
+    _SimPlatform(build_dir=os.path.abspath(variant_dir)).build(_SimTop(**params))
+
+    # Elaborating is cheap compared to compiling; skip the rest if the netlist is unchanged.
+    exe = "sim_soc.exe" if os.name == "nt" else "sim_soc"
+    digest = hashlib.sha256(b"".join(
+        open(os.path.join(variant_dir, filename), "rb").read()
+        for filename in ("sim_soc.il", "sim_soc.ys")) + models_obj.encode()).hexdigest()
+    stamp = os.path.join(variant_dir, "sim_soc.stamp")
+    if os.path.exists(os.path.join(variant_dir, exe)) and os.path.exists(stamp):
+        with open(stamp) as f:
+            if f.read() == digest:
+                return exe
+
+    run_yosys(["-q", "sim_soc.ys"], cwd=variant_dir, check=True)
+    doit_build.run_compiler([doit_build.ZIG_CXX, doit_build.CXXFLAGS, doit_build.includes("."),
+                             f"-o {exe} sim_soc.cc {doit_build.SOURCE_DIR}/main.cc {models_obj}",
+                             doit_build.LIBS], cwd=variant_dir)
+    with open(stamp, "w") as f:
+        f.write(digest)
+    return exe
+
+
+def run_variant(params, *, marker, firmware, timeout=None, liberty=None, sweep_dir=SWEEP_DIR,
+                models_obj=None):
+    """Build the simulator of the `DemoSoC` variant with `params`, run `firmware` until the UART
+    output matches `marker`, and (given a `liberty`) estimate its area and logic depth.
+
+    The UART output is decoded at the `uart_baud` of the variant, i.e. the firmware is expected
+    to keep the baud rate it starts with.
+
+    Returns a dict with the number of `cycles`, whether the `marker` was reached, and the `area`,
+    `cells` and `logic_depth` estimates. The logic depth is the number of gates on the longest
+    path within any one module; it is a proxy for the maximum frequency, not a timing analysis
+    (it ignores the delays of the cells, and paths between modules).
+    """
+    key = _variant_key(params)
+    variant_dir = os.path.join(sweep_dir, key)
+    if models_obj is None:
+        models_obj = doit_build.build_models(sweep_dir)
+    exe = _build_variant(params, variant_dir, models_obj)
+
+    args = [os.path.join(".", exe), "--firmware", os.path.abspath(firmware),
+            "--uart-match", marker, "--uart-baud", str(params.get("uart_baud", 115200))]
+    if timeout is not None:
+        args += ["--timeout", str(timeout)]
+    result = subprocess.run(args, cwd=variant_dir, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    stopped = re.search(r"Simulation stopped after (\d+) cycles: (.*)", result.stderr)
+    row = {
+        "variant": key,
+        "cycles":  int(stopped[1]) if stopped else None,
+        "reached": stopped is not None and stopped[2] == "UART output matched",
+    }
+    if liberty is not None:
+        # Modules that are the same in several variants are only synthesized once.
+        modules, top = estimate_design(os.path.join(variant_dir, "sim_soc.il"), liberty)
+        row["area"]  = sum(module["area"]  * module["instances"] for module in modules.values())
+        row["cells"] = sum(module["cells"] * module["instances"] for module in modules.values())
+        row["logic_depth"] = max(module["depth"] for module in modules.values()
+                                 if module["instances"])
+    return row
+
+
+def _collect_rows(variants, futures):
+    # A variant that fails to build, run or be estimated is recorded with the error, rather than
+    # ending the sweep and losing the results of the others.
+    rows = []
+    for params, future in zip(variants, futures):
+        try:
+            row = {**future.result(), "error": ""}
+        except Exception as error:
+            message = str(error).strip().splitlines()
+            row = {"variant": _variant_key(params), "cycles": None, "reached": False,
+                   "error": f"{type(error).__name__}: {message[0] if message else ''}"}
+        rows.append({**params, **row})
+    rows.sort(key=lambda row: (not row["reached"], row["cycles"] or 0))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build and simulate each variant in a grid of DemoSoC parameters, and "
+                    "tabulate the cycles taken to reach a UART marker against estimates of the "
+                    "area and of the logic depth (a proxy for the maximum frequency).")
+    parser.add_argument("grid", type=argparse.FileType("r"),
+        help="JSON file mapping DemoSoC parameters to lists of values")
+    parser.add_argument("--marker", required=True, metavar="REGEX",
+        help="stop each simulation when a line of UART output matches REGEX")
+    parser.add_argument("--firmware", default="zephyr.bin", metavar="FILE",
+        help="firmware image to run (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, metavar="SECONDS",
+        help="give up on a variant after SECONDS of wall-clock time")
+    parser.add_argument("--liberty", metavar="FILE",
+        help="standard cell library for the area estimate (default: sg13g2 in $PDK_ROOT; "
+             "skipped if not found)")
+    parser.add_argument("--jobs", type=int, metavar="COUNT",
+        help="number of variants to build and run at once (default: number of CPUs)")
+    parser.add_argument("--output", default=os.path.join(SWEEP_DIR, "results.csv"),
+        metavar="FILE", help="write the results to FILE (default: %(default)s)")
+    args = parser.parse_args()
+
+    variants = expand_grid(json.load(args.grid))
+    check_variants(variants)
+    liberty  = args.liberty or find_liberty()
+    models_obj = doit_build.build_models(SWEEP_DIR)
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(run_variant, params, marker=args.marker, firmware=args.firmware,
+                            timeout=args.timeout, liberty=liberty, models_obj=models_obj)
+            for params in variants
+        ]
+        rows = _collect_rows(variants, futures)
+
+    # Failed variants have no estimates, so the columns are those of all of the rows.
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, columns, restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+    widths = [max(len(column), *(len(str(row.get(column, ""))) for row in rows))
+              for column in columns]
+    print(*(f"{column:>{width}}" for column, width in zip(columns, widths)))
+    for row in rows:
+        print(*(f"{str(row.get(column, '')):>{width}}" for column, width in zip(columns, widths)))
+    failed = sum(1 for row in rows if row["error"])
+    if failed:
+        print(f"{failed} of {len(rows)} variants failed; see the error column of {args.output}")
+
+
+if __name__ == "__main__":
+    main()
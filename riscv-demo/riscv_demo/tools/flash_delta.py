@@ -0,0 +1,139 @@
+import os
+import json
+import shlex
+import argparse
+import hashlib
+import subprocess
+import tempfile
+
+
+SECTOR_SIZE = 4096
+PAGE_SIZE   = 64
+
+
+class FlashVerifyError(Exception):
+    """The contents of the flash don't match the image that was programmed."""
+
+
+class Memory25xFlash:
+    """Access a 25-series flash through the interface of the `memory-25x` Glasgow applet.
+
+    All of the operations go through the same applet session, so the applet bitstream is only
+    loaded once however many ranges are rewritten."""
+    def __init__(self, iface):
+        self.iface = iface
+
+    async def read(self, address, length):
+        return bytes(await self.iface.read(address, length))
+
+    async def erase_program(self, address, data):
+        await self.iface.erase_program(address, data, SECTOR_SIZE, PAGE_SIZE)
+
+    async def verify(self, address, data):
+        return await self.read(address, len(data)) == data
+
+
+def sector_hashes(image):
+    return [hashlib.sha256(image[offset:offset + SECTOR_SIZE]).hexdigest()
+            for offset in range(0, len(image), SECTOR_SIZE)]
+
+
+def changed_ranges(image, old_hashes):
+    """Return `(offset, length)` of each run of consecutive sectors of `image` whose hash
+    differs from `old_hashes`."""
+    ranges = []
+    for index, sector_hash in enumerate(sector_hashes(image)):
+        if index < len(old_hashes) and old_hashes[index] == sector_hash:
+            continue
+        offset = index * SECTOR_SIZE
+        length = min(SECTOR_SIZE, len(image) - offset)
+        if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
+
+
+async def flash_delta(flash, image, address, record=None):
+    """Program `image` at `address`, erasing and programming only the sectors that changed.
+
+    `record` maps flash addresses (as hex strings) to the sector hashes of the image last
+    programmed there; it is updated in place. Without an entry for `address`, the current
+    contents are read back from the flash instead. Returns the list of `(address, length)`
+    ranges that were programmed.
+    """
+    if record is None:
+        record = {}
+    key = hex(address)
+    if key in record:
+        old_hashes = record[key]
+    else:
+        old_hashes = sector_hashes(await flash.read(address, len(image)))
+    # The record no longer describes the flash until the ranges below are verified.
+    record.pop(key, None)
+
+    ranges = changed_ranges(image, old_hashes)
+    for offset, length in ranges:
+        await flash.erase_program(address + offset, image[offset:offset + length])
+    for offset, length in ranges:
+        if not await flash.verify(address + offset, image[offset:offset + length]):
+            raise FlashVerifyError(f"Verification failed at {address + offset:#x}")
+    record[key] = sector_hashes(image)
+    return [(address + offset, length) for offset, length in ranges]
+
+
+async def run_session(iface, image_file, address, record_file, read_back=False):
+    """Program the image in `image_file` with :func:`flash_delta`, keeping the record in
+    `record_file`. Run by `glasgow script` (see :func:`main`), with the interface of the
+    `memory-25x` applet as `iface`."""
+    record = {}
+    if not read_back and os.path.exists(record_file):
+        with open(record_file) as f:
+            record = json.load(f)
+
+    with open(image_file, "rb") as f:
+        image = f.read()
+    try:
+        ranges = await flash_delta(Memory25xFlash(iface), image, address, record)
+    finally:
+        os.makedirs(os.path.dirname(record_file) or ".", exist_ok=True)
+        with open(record_file, "w") as f:
+            json.dump(record, f, indent=2)
+    if ranges:
+        print(f"Programmed {sum(length for _, length in ranges)} bytes in {len(ranges)} range(s)")
+    else:
+        print("Flash contents already up to date")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Program a firmware image into a 25-series flash, rewriting only the "
+                    "sectors that changed since the last time.")
+    parser.add_argument("image")
+    parser.add_argument("address", type=lambda arg: int(arg, 0))
+    parser.add_argument("--record", default="build/board/flash_record.json",
+        help="file that keeps the sector hashes of the programmed images "
+             "(default: %(default)s)")
+    parser.add_argument("--read-back", action="store_true",
+        help="ignore the record and compare against the contents of the flash")
+    parser.add_argument("applet_args", nargs="*",
+        help="arguments for the memory-25x applet (after `--`)")
+    args = parser.parse_args()
+
+    # The applet is run once, with a script that does all of the reads, erases and programs.
+    session_args = (os.path.abspath(args.image), args.address, os.path.abspath(args.record),
+                    args.read_back)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        script = os.path.join(tmp_dir, "flash_delta_session.py")
+        with open(script, "w") as f:
+            f.write("from riscv_demo.tools.flash_delta import run_session\n"
+                    f"await run_session(iface, *{session_args!r})\n")
+        command = ["glasgow", "script", script, "memory-25x", *args.applet_args]
+        print(shlex.join(command))
+        status = subprocess.run(command).returncode
+    if status != 0:
+        raise SystemExit(status)
+
+
+if __name__ == "__main__":
+    main()
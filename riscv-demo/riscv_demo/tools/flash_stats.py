@@ -0,0 +1,109 @@
+import csv
+import argparse
+import collections
+
+from .sim_profile import read_elf_symbols, symbolize
+
+
+def read_flash_stats(file):
+    """Return the `{kind: {key: count}}` tables from `sim_soc --flash-stats`.
+
+    With a striped flash, the simulator counts the accesses to one of the chips, each of which
+    holds every `lanes`-th byte; the byte counts, line addresses and size, and run lengths are
+    scaled to those of the whole flash as seen by the CPU.
+    """
+    tables = collections.defaultdict(dict)
+    for row in csv.DictReader(file):
+        key = row["key"]
+        if row["kind"] in ("command", "run", "line"):
+            key = int(key, 0)
+        tables[row["kind"]][key] = int(row["count"])
+
+    total = tables["total"]
+    lanes = total.setdefault("lanes", 1)
+    total.setdefault("continuous_reads", 0)
+    for key in ("bytes", "data_bytes", "line_size"):
+        total[key] *= lanes
+    for kind in ("run", "line"):
+        tables[kind] = {key * lanes: count for key, count in tables[kind].items()}
+    return tables
+
+
+def reads_per_function(tables, sections, symbols, flash_base=0):
+    """Attribute the line reads of `tables` to the `(section, function)` that the first byte of
+    each line belongs to, with the flash mapped at `flash_base`."""
+    lines = {flash_base + addr: count for addr, count in tables["line"].items()}
+    return symbolize(lines, sections, symbols)
+
+
+def reads_per_section(functions):
+    """Sum the line reads of :func:`reads_per_function` by section."""
+    per_section = collections.Counter()
+    for (section, _), count in functions.items():
+        per_section[section] += count
+    return per_section
+
+
+def _bar(fraction, width=40):
+    return "#" * round(fraction * width)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize flash statistics from `sim_soc --flash-stats`, and map the reads "
+                    "to the sections and functions of an ELF file.")
+    parser.add_argument("elf", type=argparse.FileType("rb"),
+        help="firmware ELF file (e.g. zephyr.elf)")
+    parser.add_argument("stats", type=argparse.FileType("r"),
+        help="statistics written by the simulator")
+    parser.add_argument("--flash-base", type=lambda arg: int(arg, 0), default=0,
+        help="CPU address at which the flash is mapped (default: %(default)#x)")
+    parser.add_argument("--top", type=int, default=25,
+        help="number of functions to print (default: %(default)s)")
+    args = parser.parse_args()
+
+    tables = read_flash_stats(args.stats)
+    total = tables["total"]
+
+    transactions = max(total["transactions"], 1)
+    print(f"{total['transactions']} transactions, {total['bytes']} bytes, "
+          f"of which {total['data_bytes']} data "
+          f"({100 * (1 - total['data_bytes'] / max(total['bytes'], 1)):.1f}% overhead)")
+    print(f"{total['cs_cycles'] / transactions:.1f} cycles with CS# asserted per transaction")
+    if total["lanes"] > 1:
+        print(f"striped over {total['lanes']} chips; bytes are those of all of the chips")
+
+    print("\nCommands:")
+    for command, count in sorted(tables["command"].items(), key=lambda item: -item[1]):
+        print(f"  {command:#04x} {count:12} {100 * count / transactions:6.2f}%")
+    # Reads in continuous read mode have no command byte, so they are counted separately.
+    if total["continuous_reads"]:
+        count = total["continuous_reads"]
+        print(f"  (none) {count:10} {100 * count / transactions:6.2f}% "
+              f"continuous reads, without a command")
+
+    runs = tables["run"]
+    if runs:
+        print("\nSequential read runs (bytes):")
+        run_count = sum(runs.values())
+        for length, count in sorted(runs.items()):
+            print(f"  {length:8} {count:12} {_bar(count / run_count)}")
+        print(f"  mean {sum(length * count for length, count in runs.items()) / run_count:.1f}")
+
+    # Attribute each line to the section and function that its first byte belongs to.
+    sections, symbols = read_elf_symbols(args.elf.read())
+    functions = reads_per_function(tables, sections, symbols, args.flash_base)
+    line_reads = max(sum(functions.values()), 1)
+
+    print(f"\nLine reads per section ({total['line_size']} byte lines):")
+    for section, count in reads_per_section(functions).most_common():
+        print(f"  {section:16} {count:12} {100 * count / line_reads:6.2f}% "
+              f"{_bar(count / line_reads)}")
+
+    print("\nLine reads per function:")
+    for (section, function), count in functions.most_common(args.top):
+        print(f"  {100 * count / line_reads:6.2f}% {count:12} {section:16} {function}")
+
+
+if __name__ == "__main__":
+    main()
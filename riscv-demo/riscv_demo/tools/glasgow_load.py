@@ -1,18 +1,40 @@
 import argparse
 import asyncio
+import hashlib
+import collections
 import usb1
 
 from glasgow.device import GlasgowDeviceError
 from glasgow.device.hardware import GlasgowHardwareDevice, REQ_FPGA_CFG, REQ_BITSTREAM_ID
 
 
-async def download_bitstream(self, bitstream, bitstream_id=b"\xff" * 16):
+def bitstream_id_for(bitstream):
+    # Derived from the contents, so that a device that already runs this bitstream reports it.
+    return hashlib.sha256(bitstream).digest()[:16]
+
+
+async def read_bitstream_id(self):
+    return bytes(await self.control_read(usb1.REQUEST_TYPE_VENDOR, REQ_BITSTREAM_ID, 0, 0, 16))
+
+
+async def download_bitstream(self, bitstream, bitstream_id=b"\xff" * 16, *, max_in_flight=8):
         # Send consecutive chunks of bitstream. Sending 0th chunk also clears the FPGA bitstream.
-        index = 0
-        while index * 1024 < len(bitstream):
-            await self.control_write(usb1.REQUEST_TYPE_VENDOR, REQ_FPGA_CFG,
-                                     0, index, bitstream[index * 1024:(index + 1) * 1024])
-            index += 1
+        # Up to `max_in_flight` chunks are queued at once; the transfers are submitted (and
+        # completed by the device) in order, but we don't wait for each one before sending the next.
+        in_flight = collections.deque()
+        try:
+            for index in range((len(bitstream) + 1023) // 1024):
+                if len(in_flight) == max_in_flight or index == 1:
+                    # The 0th chunk must complete first, since it resets the FPGA.
+                    await in_flight.popleft()
+                in_flight.append(asyncio.ensure_future(
+                    self.control_write(usb1.REQUEST_TYPE_VENDOR, REQ_FPGA_CFG,
+                                       0, index, bitstream[index * 1024:(index + 1) * 1024])))
+            while in_flight:
+                await in_flight.popleft()
+        finally:
+            for transfer in in_flight:
+                transfer.cancel()
         # Make sure IO voltage is set _before_ FPGA comes up
         await self.set_voltage("AB", 3.3)
         # Complete configuration by setting bitstream ID. This starts the FPGA.
@@ -23,14 +45,26 @@ async def download_bitstream(self, bitstream, bitstream_id=b"\xff" * 16):
             raise GlasgowDeviceError("FPGA configuration failed")
 
 
+async def load_bitstream(self, bitstream, *, force=False):
+    """Download `bitstream` unless the device is already running it; return whether it did."""
+    bitstream_id = bitstream_id_for(bitstream)
+    if not force and await read_bitstream_id(self) == bitstream_id:
+        return False
+    await download_bitstream(self, bitstream, bitstream_id)
+    return True
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("bitstream", type=argparse.FileType("rb"))
+    parser.add_argument("--force", action="store_true",
+        help="download the bitstream even if the device is already running it")
     args = parser.parse_args()
 
     async def do_program():
         device = GlasgowHardwareDevice()
-        await download_bitstream(device, args.bitstream.read())
+        if not await load_bitstream(device, args.bitstream.read(), force=args.force):
+            print("Bitstream already loaded")
         device.close()
 
     asyncio.run(do_program())
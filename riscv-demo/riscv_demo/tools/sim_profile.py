@@ -0,0 +1,118 @@
+import bisect
+import struct
+import argparse
+import collections
+
+
+SHT_SYMTAB     = 2
+SHF_EXECINSTR  = 0x4
+STT_NOTYPE     = 0
+STT_FUNC       = 2
+
+
+def read_elf_symbols(elf):
+    """Return the executable sections and the code symbols of an ELF file.
+
+    Sections are returned as `(addr, size, name)` and symbols as `(addr, size, name)` tuples,
+    both sorted by address.
+    """
+    if elf[:4] != b"\x7fELF" or elf[5] != 1:
+        raise ValueError("not a little-endian ELF file")
+    if elf[4] == 1:
+        shoff, = struct.unpack_from("<I", elf, 0x20)
+        shentsize, shnum, shstrndx = struct.unpack_from("<HHH", elf, 0x2e)
+        shdr_fmt, sym_fmt = "<IIIIIIIIII", "<IIIBBH"
+    else:
+        shoff, = struct.unpack_from("<Q", elf, 0x28)
+        shentsize, shnum, shstrndx = struct.unpack_from("<HHH", elf, 0x3a)
+        shdr_fmt, sym_fmt = "<IIQQQQIIQQ", "<IBBHQQ"
+
+    headers = [struct.unpack_from(shdr_fmt, elf, shoff + index * shentsize)
+               for index in range(shnum)]
+
+    def string(table_index, offset):
+        start = headers[table_index][4] + offset
+        return elf[start:elf.index(b"\0", start)].decode(errors="replace")
+
+    sections, symbols = [], []
+    for name, type, flags, addr, offset, size, link, info, align, entsize in headers:
+        if flags & SHF_EXECINSTR:
+            sections.append((addr, size, string(shstrndx, name)))
+        if type != SHT_SYMTAB:
+            continue
+        for sym_offset in range(offset, offset + size, entsize):
+            fields = struct.unpack_from(sym_fmt, elf, sym_offset)
+            if elf[4] == 1:
+                sym_name, sym_value, sym_size, sym_info, _, sym_shndx = fields
+            else:
+                sym_name, sym_info, _, sym_shndx, sym_value, sym_size = fields
+            if sym_info & 0xf not in (STT_FUNC, STT_NOTYPE) or sym_shndx >= len(headers):
+                continue
+            if not headers[sym_shndx][2] & SHF_EXECINSTR:
+                continue
+            sym_name = string(link, sym_name)
+            if sym_name and not sym_name.startswith("$"): # skip mapping symbols
+                symbols.append((sym_value, sym_size, sym_name))
+    return sorted(sections), sorted(symbols)
+
+
+def read_profile(file):
+    """Return the sampling interval and the `{address: count}` histogram from `sim_soc`."""
+    interval, samples = None, {}
+    for line in file:
+        if line.startswith("# interval"):
+            interval = int(line.split()[2])
+        elif line.strip() and not line.startswith("#"):
+            addr, count = line.split()
+            samples[int(addr, 16)] = int(count)
+    return interval, samples
+
+
+def symbolize(samples, sections, symbols):
+    """Aggregate samples into `{(section, function): count}`."""
+    sym_addrs = [addr for addr, _, _ in symbols]
+    sec_addrs = [addr for addr, _, _ in sections]
+    result = collections.Counter()
+    for addr, count in samples.items():
+        section = "[unknown]"
+        index = bisect.bisect_right(sec_addrs, addr) - 1
+        if index >= 0 and addr < sections[index][0] + sections[index][1]:
+            section = sections[index][2]
+        function = f"[{addr:#010x}]"
+        index = bisect.bisect_right(sym_addrs, addr) - 1
+        # symbols without a size (e.g. from assembly) extend up to the next one
+        if index >= 0 and (symbols[index][1] == 0 or addr < symbols[index][0] + symbols[index][1]):
+            function = symbols[index][2]
+        result[section, function] += count
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Map samples from `sim_soc --profile` to the functions of an ELF file.")
+    parser.add_argument("elf", type=argparse.FileType("rb"),
+        help="firmware ELF file (e.g. zephyr.elf)")
+    parser.add_argument("profile", type=argparse.FileType("r"),
+        help="profile written by the simulator")
+    parser.add_argument("--folded", type=argparse.FileType("w"),
+        help="write folded stacks (`section;function count`) for flamegraph tools")
+    parser.add_argument("--top", type=int, default=25,
+        help="number of functions to print (default: %(default)s)")
+    args = parser.parse_args()
+
+    sections, symbols = read_elf_symbols(args.elf.read())
+    interval, samples = read_profile(args.profile)
+    functions = symbolize(samples, sections, symbols)
+
+    if args.folded:
+        for (section, function), count in sorted(functions.items()):
+            print(f"{section};{function} {count}", file=args.folded)
+
+    total = sum(functions.values())
+    print(f"{total} samples, every {interval} cycles with an instruction fetch")
+    for (section, function), count in functions.most_common(args.top):
+        print(f"{100 * count / total:6.2f}% {count:10} {section:16} {function}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import sys
+import time
+import asyncio
+import argparse
+
+from riscv_demo.ips.uart.loader import frame_image
+from riscv_demo.sim import SimSession
+
+
+# Baud rate of the UART peripheral, at which the firmware output is monitored, unless
+# `uart_baud` is set in the `[chipflow.soc]` section of the configuration.
+UART_BAUD = 115200
+
+
+def configured_uart_baud(config_file="chipflow.toml"):
+    """Return the `uart_baud` of the `[chipflow.soc]` section of `config_file`, if it exists and
+    sets it, or :data:`UART_BAUD`."""
+    try:
+        import tomllib
+    except ImportError: # Python < 3.11
+        import tomli as tomllib
+
+    try:
+        with open(config_file, "rb") as f:
+            config = tomllib.load(f)
+    except FileNotFoundError:
+        return UART_BAUD
+    return config.get("chipflow", {}).get("soc", {}).get("uart_baud", UART_BAUD)
+
+
+def boot_serial(port, image, *, baud):
+    """Load `image` to the SRAM of a `DemoSoC` on the serial `port`, whose UART loader runs at
+    `baud`; the port must support that baud rate."""
+    import serial
+
+    frame = frame_image(image)
+    with serial.Serial(port, baud) as ser:
+        start = time.perf_counter()
+        ser.write(frame)
+        ser.flush()
+    print(f"Sent {len(frame)} bytes in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+
+
+async def boot_sim(session, image, *, baud, uart_baud=UART_BAUD):
+    """Load `image` to the SRAM of the design simulated in `session` (a :class:`SimSession`),
+    whose UART loader runs at `baud` and its UART peripheral at `uart_baud`. The bytes are queued
+    at once; the design receives them at the line rate."""
+    await session.send("uart", "baud", baud)
+    for byte in frame_image(image):
+        await session.send("uart", "tx", byte)
+    await session.send("uart", "baud", uart_baud)
+
+
+def _monitor_serial(port, uart_baud):
+    import serial
+
+    with serial.Serial(port, uart_baud) as ser:
+        while True:
+            sys.stdout.buffer.write(ser.read(ser.in_waiting or 1))
+            sys.stdout.flush()
+
+
+async def _run_sim(image, *, baud, uart_baud, monitor):
+    async with SimSession(args=["--uart-baud", str(uart_baud)]) as session:
+        await boot_sim(session, image, baud=baud, uart_baud=uart_baud)
+        while monitor:
+            event = await session.wait_for("uart", "tx")
+            sys.stdout.buffer.write(bytes([event["payload"]]))
+            sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load a firmware image to the SRAM of the SoC over its UART and run it, "
+                    "without programming the flash. The SoC must be built with "
+                    "`with_uart_loader`.")
+    parser.add_argument("image", type=argparse.FileType("rb"),
+        help="raw image, linked to run from the start of the SRAM")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--port", metavar="DEVICE",
+        help="serial port connected to the UART of the board")
+    target.add_argument("--sim", action="store_true",
+        help="load the image into the simulator built by `chipflow sim build`")
+    parser.add_argument("--baud", type=int, default=1_000_000,
+        help="baud rate of the UART loader, i.e. `uart_loader_baud` (default: %(default)s)")
+    parser.add_argument("--uart-baud", type=int, default=configured_uart_baud(),
+        help=f"baud rate of the UART peripheral, i.e. `uart_baud` (default: that in "
+             f"chipflow.toml, or {UART_BAUD})")
+    parser.add_argument("--monitor", action="store_true",
+        help="then print the UART output (at the baud rate of the UART peripheral) until "
+             "interrupted")
+    args = parser.parse_args()
+
+    image = args.image.read()
+    try:
+        if args.sim:
+            asyncio.run(_run_sim(image, baud=args.baud, uart_baud=args.uart_baud,
+                                 monitor=args.monitor))
+        else:
+            boot_serial(args.port, image, baud=args.baud)
+            if args.monitor:
+                _monitor_serial(args.port, args.uart_baud)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
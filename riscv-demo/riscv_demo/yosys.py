@@ -0,0 +1,128 @@
+import os
+import re
+import sys
+import time
+import shutil
+import subprocess
+import importlib.metadata
+import importlib.resources
+
+
+__all__ = ["Yosys", "parse_yosys_version", "find_yosys", "run_yosys"]
+
+
+# The local fallback for the compiled WebAssembly of YoWASP, if the user cache isn't writable.
+YOWASP_CACHE_DIR = os.path.join("build", "yowasp-cache")
+
+
+def parse_yosys_version(text):
+    """Return the version in the output of `yosys -V` (or of a YoWASP package version) as
+    a ``(major, minor)`` tuple, or ``None`` if there isn't one."""
+    matches = re.search(r"(?:^|Yosys )(\d+)\.(\d+)", text)
+    if matches is None:
+        return None
+    return int(matches[1]), int(matches[2])
+
+
+class Yosys:
+    """A Yosys to run: `command` is its command line prefix, and `runtime_dir` the CXXRTL
+    runtime matching the code its `write_cxxrtl` generates. `note` says why it was chosen, if
+    it isn't the obvious choice."""
+    def __init__(self, command, runtime_dir, *, native, version, note=None):
+        self.command     = command
+        self.runtime_dir = runtime_dir
+        self.native      = native
+        self.version     = version
+        self.note        = note
+
+    def __str__(self):
+        kind = "native" if self.native else "YoWASP"
+        version = ".".join(map(str, self.version)) if self.version else "unknown version"
+        return f"{kind} Yosys {version} ({self.command[0]})"
+
+
+def _builtin_yosys():
+    version = parse_yosys_version(importlib.metadata.version("yowasp-yosys"))
+    runtime_dir = (importlib.resources.files("yowasp_yosys") /
+                   "share/include/backends/cxxrtl/runtime")
+    return Yosys([shutil.which("yowasp-yosys") or "yowasp-yosys"], str(runtime_dir),
+                 native=False, version=version)
+
+
+def _native_yosys(builtin_version):
+    yosys = shutil.which("yosys")
+    if yosys is None:
+        return None, "not found on $PATH"
+    try:
+        version = parse_yosys_version(subprocess.run(
+            [yosys, "-V"], capture_output=True, text=True, check=True).stdout)
+        config = f"{yosys}-config" if os.path.exists(f"{yosys}-config") else "yosys-config"
+        datdir = subprocess.run(
+            [config, "--datdir"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, f"{yosys} (or its yosys-config) doesn't run"
+    # `main.cc` is written against the CXXRTL runtime (and debug server) of the YoWASP Yosys,
+    # which older versions don't have all of.
+    if version is None or version < builtin_version:
+        return None, (f"{yosys} is version {'.'.join(map(str, version or ()))}, older than "
+                      f"{'.'.join(map(str, builtin_version))}")
+    runtime_dir = os.path.join(datdir, "include", "backends", "cxxrtl", "runtime")
+    if not os.path.isdir(runtime_dir):
+        return None, f"{yosys} has no CXXRTL runtime in {datdir}"
+    return Yosys([yosys], runtime_dir, native=True, version=version), None
+
+
+def _enable_yowasp_cache():
+    # YoWASP compiles the WebAssembly to machine code on the first run and caches it in the user
+    # cache directory; if that can't be written, every run would compile it again.
+    if "YOWASP_CACHE_DIR" in os.environ:
+        return os.environ["YOWASP_CACHE_DIR"]
+    import platformdirs
+    cache_dir = platformdirs.user_cache_dir("YoWASP", appauthor=False)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.access(cache_dir, os.W_OK):
+            return cache_dir
+    except OSError:
+        pass
+    cache_dir = os.environ["YOWASP_CACHE_DIR"] = os.path.abspath(YOWASP_CACHE_DIR)
+    return cache_dir
+
+
+_found = None
+
+
+def find_yosys():
+    """Return the :class:`Yosys` to use.
+
+    A native Yosys on `$PATH` is preferred to the YoWASP one (which has to load and JIT-compile
+    its WebAssembly on every run) if it is at least as new. Set `$AMARANTH_USE_YOSYS` to `system`
+    or `builtin` to only consider either.
+    """
+    global _found
+    if _found is None:
+        use_yosys = os.environ.get("AMARANTH_USE_YOSYS", "")
+        builtin = _builtin_yosys()
+        native, reason = None, "$AMARANTH_USE_YOSYS is builtin"
+        if use_yosys != "builtin":
+            native, reason = _native_yosys(builtin.version)
+        if native is not None:
+            _found = native
+        elif use_yosys == "system":
+            raise RuntimeError(f"$AMARANTH_USE_YOSYS is system, but {reason}")
+        else:
+            _found = builtin
+            _found.note = (f"no native Yosys: {reason}; compiled WebAssembly cached in "
+                           f"{_enable_yowasp_cache()}")
+    return _found
+
+
+def run_yosys(args, *, cwd=None, **kwargs):
+    """Run Yosys with `args` in `cwd`, and report which one it was and the time it took; the other
+    arguments are those of :func:`subprocess.run`."""
+    yosys = find_yosys()
+    start = time.perf_counter()
+    result = subprocess.run([*yosys.command, *args], cwd=cwd, **kwargs)
+    print(f"Ran {yosys} in {time.perf_counter() - start:.1f} s" +
+          (f" ({yosys.note})" if yosys.note else ""), file=sys.stderr)
+    return result
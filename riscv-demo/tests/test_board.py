@@ -0,0 +1,104 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from chipflow_lib import ChipFlowError
+
+from riscv_demo.steps.board import GlasgowBoardStep, _select_seed, _store_seed
+
+
+def _nextpnr_log(fmax):
+    return "".join(f"Info: Max frequency for clock '{clock}': {freq:.2f} MHz (PASS at 48.00 MHz)\n"
+                   for clock, freq in fmax.items())
+
+
+class GlasgowBoardStepTestCase(unittest.TestCase):
+    def test_flash_lanes(self):
+        # Every `chipflow` command creates the board step, so only building a bitstream fails.
+        step = GlasgowBoardStep({"chipflow": {"soc": {"flash_lanes": 2}}})
+        with self.assertRaisesRegex(ChipFlowError, r"flash_lanes"):
+            step.build_bitstream()
+
+
+class SelectSeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.consumed = []
+
+    def build(self, seed, log):
+        """Return a `(seed, build)` pair for a seed whose nextpnr log is `log`, or whose build
+        fails if `log` is an exception."""
+        def build():
+            self.consumed.append(seed)
+            if isinstance(log, Exception):
+                raise log
+            cache_dir = Path(self._tmp.name) / str(seed)
+            cache_dir.mkdir()
+            for filename in ("top.bin", "top.rpt"):
+                (cache_dir / filename).write_text(f"{filename} of seed {seed}")
+            (cache_dir / "top.tim").write_text(log)
+            return cache_dir
+        return seed, build
+
+    def test_fastest(self):
+        best, results = _select_seed([
+            self.build(1, _nextpnr_log({"clk": 50.0, "usb": 70.0})),
+            self.build(2, "Info: no timing here\n"),
+            self.build(3, _nextpnr_log({"clk": 55.0, "usb": 52.0})),
+            self.build(4, RuntimeError("nextpnr crashed")),
+            self.build(5, _nextpnr_log({"clk": 60.0, "usb": 49.0})),
+        ])
+        # The slowest clock of each seed is ranked.
+        self.assertEqual(best["seed"], 3)
+        self.assertEqual([(result["seed"], result["fmax"]) for result in results], [
+            (1, {"clk": 50.0, "usb": 70.0}),
+            (2, {}),
+            (3, {"clk": 55.0, "usb": 52.0}),
+            (4, {}),
+            (5, {"clk": 60.0, "usb": 49.0}),
+        ])
+        self.assertIsNone(results[3]["build_dir"])
+
+    def test_target_reached(self):
+        best, results = _select_seed([
+            self.build(1, _nextpnr_log({"clk": 45.0})),
+            self.build(2, _nextpnr_log({"clk": 49.0})),
+            self.build(3, _nextpnr_log({"clk": 60.0})),
+        ], target_freq=48)
+        self.assertEqual(best["seed"], 2)
+        self.assertEqual([result["seed"] for result in results], [1, 2])
+        # The seeds after the first one to reach the target aren't waited for.
+        self.assertEqual(self.consumed, [1, 2])
+
+    def test_target_missed(self):
+        best, results = _select_seed([
+            self.build(1, _nextpnr_log({"clk": 45.0})),
+            self.build(2, _nextpnr_log({"clk": 47.0})),
+            self.build(3, RuntimeError("nextpnr crashed")),
+        ], target_freq=48)
+        self.assertEqual(best["seed"], 2)
+        self.assertEqual(self.consumed, [1, 2, 3])
+
+    def test_no_timing(self):
+        with self.assertRaisesRegex(ChipFlowError, r"None of the 2 seeds"):
+            _select_seed([
+                self.build(1, "Info: no timing here\n"),
+                self.build(2, RuntimeError("nextpnr crashed")),
+            ])
+
+    def test_store(self):
+        best, results = _select_seed([
+            self.build(1, _nextpnr_log({"clk": 45.0})),
+            self.build(2, _nextpnr_log({"clk": 47.0})),
+        ], target_freq=48)
+        default_dir = Path(self._tmp.name) / "default"
+        _store_seed(best, results, 48, default_dir)
+        self.assertEqual((default_dir / "top.bin").read_text(), "top.bin of seed 2")
+        self.assertEqual((default_dir / "top.tim").read_text(), _nextpnr_log({"clk": 47.0}))
+        with open(default_dir / "seeds.json") as f:
+            seeds = json.load(f)
+        self.assertEqual(seeds["selected"], 2)
+        self.assertEqual(seeds["target_freq"], 48)
+        self.assertEqual([result["seed"] for result in seeds["results"]], [1, 2])
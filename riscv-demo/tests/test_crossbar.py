@@ -0,0 +1,145 @@
+import unittest
+
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, connect
+from amaranth.sim import *
+
+from amaranth_soc import wishbone
+from amaranth_soc.memory import MemoryMap
+
+from riscv_demo.ips.interconnect import WishboneCrossbar
+
+
+class _Memory(wiring.Component):
+    """Read-only memory that returns the word address as data, `latency` cycles after the start
+    of each access."""
+    def __init__(self, *, addr_width, latency):
+        self._latency = latency
+        super().__init__({
+            "bus": In(wishbone.Signature(addr_width=addr_width, data_width=32, granularity=8)),
+        })
+        self.bus.memory_map = MemoryMap(addr_width=addr_width + 2, data_width=8)
+        self.bus.memory_map.add_resource(self, name="data", size=1 << (addr_width + 2))
+
+    def elaborate(self, platform):
+        m = Module()
+
+        timer = Signal(range(self._latency + 1))
+        with m.If(self.bus.ack):
+            m.d.sync += [
+                self.bus.ack.eq(0),
+                timer.eq(0),
+            ]
+        with m.Elif(self.bus.cyc & self.bus.stb):
+            with m.If(timer == self._latency - 1):
+                m.d.sync += [
+                    self.bus.ack.eq(1),
+                    self.bus.dat_r.eq(self.bus.adr),
+                ]
+            with m.Else():
+                m.d.sync += timer.eq(timer + 1)
+
+        return m
+
+
+class _SharedBus(Elaboratable):
+    """An arbiter followed by a decoder, which serializes all accesses."""
+    def __init__(self, *, addr_width, data_width, granularity):
+        self.arbiter = wishbone.Arbiter(addr_width=addr_width, data_width=data_width,
+                                        granularity=granularity)
+        self.decoder = wishbone.Decoder(addr_width=addr_width, data_width=data_width,
+                                        granularity=granularity)
+
+    def add_initiator(self, intr_bus):
+        self.arbiter.add(intr_bus)
+
+    def add_target(self, sub_bus, *, name=None, addr=None):
+        return self.decoder.add(sub_bus, name=name, addr=addr)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.arbiter = self.arbiter
+        m.submodules.decoder = self.decoder
+        connect(m, self.arbiter.bus, self.decoder.bus)
+        return m
+
+
+class CrossbarTestCase(unittest.TestCase):
+    flash_base = 0x0000_0000
+    sram_base  = 0x1000_0000
+
+    def run_accesses(self, interconnect_cls, accesses):
+        """Run the reads in `accesses` (a list of word addresses for each initiator) at once, and
+        return the number of cycles until all of them completed."""
+        interconnect = interconnect_cls(addr_width=30, data_width=32, granularity=8)
+        flash = _Memory(addr_width=20, latency=8)
+        sram  = _Memory(addr_width=10, latency=1)
+        interconnect.add_target(flash.bus, name="flash", addr=self.flash_base)
+        interconnect.add_target(sram.bus,  name="sram",  addr=self.sram_base)
+
+        initiators = []
+        for _ in accesses:
+            intr = wishbone.Signature(addr_width=30, data_width=32, granularity=8).create()
+            interconnect.add_initiator(intr)
+            initiators.append(intr)
+
+        m = Module()
+        m.submodules.interconnect = interconnect
+        m.submodules.flash = flash
+        m.submodules.sram  = sram
+
+        cycles = [0] * len(accesses)
+
+        def initiator(index):
+            bus = initiators[index]
+            async def testbench(ctx):
+                for addr in accesses[index]:
+                    ctx.set(bus.adr, addr)
+                    ctx.set(bus.cyc, 1)
+                    ctx.set(bus.stb, 1)
+                    while True:
+                        await ctx.tick()
+                        cycles[index] += 1
+                        if ctx.get(bus.ack):
+                            break
+                    # Each target only sees the address bits below its window, and no test
+                    # accesses more than the first 1024 words of one.
+                    self.assertEqual(ctx.get(bus.dat_r), addr & 0x3ff)
+                    ctx.set(bus.cyc, 0)
+                    ctx.set(bus.stb, 0)
+                    await ctx.tick()
+                    cycles[index] += 1
+            return testbench
+
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+        for index in range(len(accesses)):
+            sim.add_testbench(initiator(index))
+        sim.run()
+        return max(cycles)
+
+    def test_same_target(self):
+        # Accesses to the same target are still serialized, but none are lost.
+        accesses = [[self.sram_base // 4 + n for n in range(8)],
+                    [self.sram_base // 4 + n for n in range(8, 16)]]
+        self.run_accesses(WishboneCrossbar, accesses)
+
+    def test_benchmark(self):
+        # An instruction fetch stream from the flash and a data stream from the SRAM.
+        accesses = [[self.flash_base // 4 + n for n in range(32)],
+                    [self.sram_base  // 4 + n for n in range(32)]]
+        alone    = max(self.run_accesses(WishboneCrossbar, [addrs]) for addrs in accesses)
+        shared   = self.run_accesses(_SharedBus, accesses)
+        crossbar = self.run_accesses(WishboneCrossbar, accesses)
+        print(f"\nflash and SRAM streams: shared bus {shared} cycles, crossbar {crossbar} cycles "
+              f"(slowest stream alone: {alone} cycles)")
+        # The SRAM stream may wait a cycle for its arbiter to grant it the SRAM.
+        self.assertLessEqual(crossbar, alone + 1)
+        self.assertLess(crossbar, shared)
+
+    def test_unaligned_target(self):
+        crossbar = WishboneCrossbar(addr_width=30, data_width=32, granularity=8)
+        sram = _Memory(addr_width=10, latency=1)
+        with self.assertRaises(ValueError):
+            crossbar.add_target(sram.bus, addr=0x1000_0c00)
@@ -0,0 +1,49 @@
+import unittest
+
+from amaranth import *
+from amaranth.back import rtlil
+
+from riscv_demo.estimate import split_rtlil, _blackbox, _strip_src, _submodules
+
+
+class _Counter(Elaboratable):
+    def __init__(self, width):
+        self.o = Signal(width)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.d.sync += self.o.eq(self.o + 1)
+        return m
+
+
+class _Top(Elaboratable):
+    def __init__(self):
+        self.o = Signal(8)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.a = a = _Counter(8)
+        m.submodules.b = b = _Counter(4)
+        m.d.comb += self.o.eq(a.o ^ b.o)
+        return m
+
+
+class SplitRTLILTestCase(unittest.TestCase):
+    def setUp(self):
+        top = _Top()
+        self.modules, self.top = split_rtlil(rtlil.convert(top, name="top", ports=[top.o]))
+
+    def test_modules(self):
+        self.assertEqual(self.top, "\\top")
+        self.assertEqual(sorted(self.modules), ["\\top", "\\top.a", "\\top.b"])
+        self.assertEqual(sorted(_submodules(self.modules["\\top"])), ["\\top.a", "\\top.b"])
+        for name, text in self.modules.items():
+            self.assertIn(f"module {name}\n", text)
+            self.assertTrue(text.endswith("end\n"))
+
+    def test_blackbox(self):
+        stub = _blackbox("\\top.a", self.modules["\\top.a"])
+        self.assertTrue(stub.startswith("attribute \\blackbox 1\nmodule \\top.a\n"))
+        self.assertIn("output", stub)
+        self.assertNotIn("cell", stub)
+        self.assertNotIn("attribute \\src", _strip_src(self.modules["\\top.a"]))
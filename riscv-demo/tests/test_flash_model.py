@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+import importlib.util
+import importlib.resources
+
+
+_SOURCE_DIR = importlib.resources.files("riscv_demo") / "sim"
+
+# Drives the SPI flash model of `models.cc` in single SPI mode. Reads lines of the form
+# `xfer <hex bytes>` (a transaction; prints the bytes read back), `wait <cycles>`, and
+# `timing <operation> <cycles>` from stdin.
+_DRIVER = r"""
+#include <iostream>
+#include <sstream>
+#include "models.h"
+
+using namespace cxxrtl_design;
+
+int main(int argc, char **argv) {
+    value<1> clk, csn;
+    value<4> d_o, d_oe, d_i;
+    csn.set(true);
+    spiflash_model flash("flash", clk, csn, d_o, d_oe, d_i);
+    open_event_log(argv[1]);
+    unsigned timestamp = 0;
+    auto step = [&]() { flash.step(timestamp++); };
+    std::string line;
+    while (std::getline(std::cin, line)) {
+        std::istringstream in(line);
+        std::string op;
+        in >> op;
+        if (op == "timing") {
+            std::string operation;
+            unsigned cycles;
+            in >> operation >> cycles;
+            flash.set_timing(operation, cycles);
+        } else if (op == "wait") {
+            unsigned cycles;
+            in >> cycles;
+            while (cycles--)
+                step();
+        } else if (op == "xfer") {
+            csn.set(false);
+            step();
+            unsigned byte;
+            in >> std::hex;
+            while (in >> byte) {
+                unsigned result = 0;
+                for (int bit = 7; bit >= 0; bit--) {
+                    // sample on the rising edge, like the controller
+                    result = (result << 1) | ((d_i.get<unsigned>() >> 1) & 1);
+                    d_o.set((byte >> bit) & 1);
+                    clk.set(true);
+                    step();
+                    clk.set(false);
+                    step();
+                }
+                std::cout << stringf("%02x", result);
+            }
+            std::cout << std::endl;
+            csn.set(true);
+            step();
+        }
+    }
+    close_event_log();
+    return 0;
+}
+"""
+
+
+def _runtime_dir():
+    if importlib.util.find_spec("ziglang") is None:
+        return None
+    try:
+        from riscv_demo.yosys import find_yosys
+        return find_yosys().runtime_dir
+    except Exception:
+        return None
+
+
+@unittest.skipIf(_runtime_dir() is None, "needs ziglang and the CXXRTL runtime of a Yosys")
+class SPIFlashModelTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.build_dir = tempfile.mkdtemp()
+        driver = os.path.join(cls.build_dir, "driver.cc")
+        with open(driver, "w") as f:
+            f.write(_DRIVER)
+        cls.executable = os.path.join(cls.build_dir, "driver")
+        subprocess.run([
+            sys.executable, "-m", "ziglang", "c++", "-O1", "-std=c++17",
+            "-I", str(_SOURCE_DIR), "-I", str(_SOURCE_DIR / "vendor"), "-I", _runtime_dir(),
+            "-o", cls.executable, driver, str(_SOURCE_DIR / "models.cc"),
+            *([] if os.name == "nt" else ["-pthread"]),
+        ], check=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.build_dir)
+
+    def run_flash(self, *lines):
+        """Run the lines of a driver script, and return the bytes read in each transaction and
+        the logged events."""
+        events_file = os.path.join(self.build_dir, "events.json")
+        result = subprocess.run([self.executable, events_file], input="\n".join(lines) + "\n",
+                                capture_output=True, text=True, check=True)
+        with open(events_file) as f:
+            events = json.load(f)["events"]
+        return result.stdout.splitlines(), events
+
+    def test_write_enable(self):
+        reads, _ = self.run_flash(
+            "xfer 05 00",
+            "xfer 06",
+            "xfer 05 00",
+            "xfer 04",
+            "xfer 05 00")
+        self.assertEqual(reads[0][2:], "00")
+        self.assertEqual(reads[2][2:], "02")
+        self.assertEqual(reads[4][2:], "00")
+
+    def test_page_program(self):
+        reads, events = self.run_flash(
+            "timing page_program 100",
+            "xfer 06",
+            "xfer 02 00 10 fe 12 34 f3",
+            "xfer 05 00",
+            "wait 200",
+            "xfer 05 00",
+            # the address wraps around within the page, and only bits can be cleared
+            "xfer 03 00 10 fe 00 00 00",
+            "xfer 06",
+            "xfer 02 00 10 fe f0",
+            "wait 200",
+            "xfer 03 00 10 fe 00",
+            "xfer 03 00 10 00 00")
+        self.assertEqual(reads[2][2:], "03")
+        self.assertEqual(reads[3][2:], "00")
+        self.assertEqual(reads[4][8:], "1234ff")
+        self.assertEqual(reads[7][8:], "10")
+        self.assertEqual(reads[8][8:], "f3")
+        self.assertEqual(events[0], {"timestamp": events[0]["timestamp"], "peripheral": "flash",
+                                     "event": "program", "payload": {"addr": 0x10fe, "length": 3}})
+
+    def test_program_without_write_enable(self):
+        reads, events = self.run_flash(
+            "xfer 02 00 20 00 00",
+            "xfer 05 00",
+            "xfer 03 00 20 00 00")
+        self.assertEqual(reads[1][2:], "00")
+        self.assertEqual(reads[2][8:], "ff")
+        self.assertEqual(events, [])
+
+    def test_sector_erase(self):
+        reads, events = self.run_flash(
+            "timing page_program 0",
+            "xfer 06",
+            "xfer 02 00 30 00 00",
+            "xfer 06",
+            "xfer 02 00 40 00 00",
+            "timing sector_erase 1000",
+            "xfer 06",
+            "xfer 20 00 30 80",
+            "xfer 05 00",
+            "wait 2000",
+            "xfer 05 00",
+            "xfer 03 00 30 00 00",
+            "xfer 03 00 40 00 00")
+        self.assertEqual(reads[6][2:], "03")
+        self.assertEqual(reads[7][2:], "00")
+        self.assertEqual(reads[8][8:], "ff")
+        self.assertEqual(reads[9][8:], "00")
+        self.assertEqual([(event["event"], event["payload"]) for event in events][-1],
+                         ("erase", {"addr": 0x3000, "size": 0x1000}))
+
+    def test_busy(self):
+        # Commands other than status reads are ignored while busy, and reported.
+        reads, events = self.run_flash(
+            "timing chip_erase 1000",
+            "xfer 06",
+            "xfer c7",
+            "xfer 9f 00 00",
+            "xfer 06",
+            "xfer 02 00 50 00 00",
+            "xfer 05 00",
+            "wait 2000",
+            "xfer 05 00",
+            "xfer 9f 00 00")
+        self.assertEqual(reads[2], "000000")
+        self.assertEqual(reads[5][2:], "03")
+        self.assertEqual(reads[6][2:], "00")
+        self.assertEqual(reads[7], "00ca7c")
+        self.assertEqual([(event["event"], event["payload"]) for event in events][1:], [
+            ("ignored", {"command": 0x9f}),
+            ("ignored", {"command": 0x06}),
+            ("ignored", {"command": 0x02}),
+        ])
@@ -0,0 +1,65 @@
+import io
+import unittest
+
+from riscv_demo.tools.flash_stats import read_flash_stats, reads_per_function, reads_per_section
+
+
+_STATS = """\
+kind,key,count
+total,transactions,30
+total,continuous_reads,20
+total,cs_cycles,600
+total,bytes,250
+total,data_bytes,100
+total,line_size,16
+total,lanes,2
+command,0x05,2
+command,0xeb,8
+run,8,5
+run,32,2
+line,0x000000,4
+line,0x000010,1
+line,0x000020,3
+"""
+
+_SECTIONS = [(0x100000, 0x100, ".text"), (0x100100, 0x100, ".rodata")]
+_SYMBOLS  = [(0x100000, 0x40, "func_a"), (0x100040, 0x40, "func_b")]
+
+
+class FlashStatsTestCase(unittest.TestCase):
+    def test_read(self):
+        tables = read_flash_stats(io.StringIO(_STATS))
+        # Addresses and lengths of the chip are scaled to those of the striped flash.
+        self.assertEqual(tables["total"], {
+            "transactions": 30, "continuous_reads": 20, "cs_cycles": 600, "bytes": 500,
+            "data_bytes": 200, "line_size": 32, "lanes": 2,
+        })
+        self.assertEqual(tables["command"], {0x05: 2, 0xeb: 8})
+        self.assertEqual(tables["run"], {16: 5, 64: 2})
+        self.assertEqual(tables["line"], {0x00: 4, 0x20: 1, 0x40: 3})
+
+    def test_read_single(self):
+        # Statistics of an older simulator, without a lane count or continuous reads.
+        tables = read_flash_stats(io.StringIO(
+            "kind,key,count\n"
+            "total,bytes,10\n"
+            "total,data_bytes,4\n"
+            "total,line_size,16\n"
+            "line,0x000010,1\n"))
+        self.assertEqual(tables["total"], {
+            "bytes": 10, "data_bytes": 4, "line_size": 16, "lanes": 1, "continuous_reads": 0,
+        })
+        self.assertEqual(tables["line"], {0x10: 1})
+        self.assertEqual(tables["run"], {})
+
+    def test_aggregate(self):
+        tables = read_flash_stats(io.StringIO(_STATS))
+        functions = reads_per_function(tables, _SECTIONS, _SYMBOLS, flash_base=0x100000)
+        self.assertEqual(functions, {
+            (".text", "func_a"): 4 + 1,
+            (".text", "func_b"): 3,
+        })
+        self.assertEqual(reads_per_section(functions), {".text": 8})
+        # Lines outside of the ELF file
+        functions = reads_per_function(tables, _SECTIONS, _SYMBOLS, flash_base=0x200000)
+        self.assertEqual(reads_per_section(functions), {"[unknown]": 8})
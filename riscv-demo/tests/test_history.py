@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from riscv_demo.history import parse_yosys_log, parse_nextpnr_log, record_build, query_history
+
+
+class ReportParserTestCase(unittest.TestCase):
+    def test_yosys(self):
+        log = (
+            "=== top ===\n"
+            "\n"
+            "   Number of wires:               1234\n"
+            "   Number of cells:               3328\n"
+            "     SB_CARRY                      100\n"
+            "     SB_DFFE                       200\n"
+            "     SB_LUT4                      3000\n"
+            "     SB_RAM40_4K                     8\n"
+            "\n"
+            "End of script.\n"
+        )
+        self.assertEqual(parse_yosys_log(log), {
+            "SB_CARRY": 100, "SB_DFFE": 200, "SB_LUT4": 3000, "SB_RAM40_4K": 8,
+        })
+        self.assertEqual(parse_yosys_log("=== top ===\n     1234 wires\n     3000   SB_LUT4\n"),
+                         {"SB_LUT4": 3000})
+        self.assertEqual(parse_yosys_log("=== top ===\n"
+                                         "       32      384 cells\n"
+                                         "        8        -   $_AND_\n"
+                                         "        8      384   sg13g2_dfrbp_1\n"),
+                         {"$_AND_": 8, "sg13g2_dfrbp_1": 8})
+        self.assertEqual(parse_yosys_log("ERROR: no design\n"), {})
+
+    def test_nextpnr(self):
+        log = (
+            "Info: Device utilisation:\n"
+            "Info: \t         ICESTORM_LC:  4567/ 7680    59%\n"
+            "Info: \t        ICESTORM_RAM:     8/   32    25%\n"
+            "Info: Max frequency for clock 'clk': 40.00 MHz (FAIL at 48.00 MHz)\n"
+            "Info: Max frequency for clock 'clk': 51.20 MHz (PASS at 48.00 MHz)\n"
+        )
+        self.assertEqual(parse_nextpnr_log(log),
+                         ({"clk": 51.2}, {"ICESTORM_LC": 4567, "ICESTORM_RAM": 8}))
+
+
+class HistoryTestCase(unittest.TestCase):
+    def test_record_query(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "history.sqlite")
+            record_build("board",   {"fmax.clk": 50.0, "util.ICESTORM_LC": 4000},
+                         filename=filename)
+            record_build("silicon", {"area": 1e6}, filename=filename)
+            record_build("board",   {"fmax.clk": 52.5, "util.ICESTORM_LC": 4100},
+                         filename=filename)
+            names, builds = query_history("board", filename=filename)
+            self.assertEqual(names, ["fmax.clk", "util.ICESTORM_LC"])
+            # Both board builds are from the same commit, so only the last one is shown.
+            self.assertEqual(len(builds), 1)
+            self.assertEqual(builds[0][2], {"fmax.clk": 52.5, "util.ICESTORM_LC": 4100})
+            names, builds = query_history("board", metric="fmax.%", filename=filename)
+            self.assertEqual(names, ["fmax.clk"])
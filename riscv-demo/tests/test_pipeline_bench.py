@@ -0,0 +1,15 @@
+import unittest
+
+from riscv_demo.pipeline_bench import parse_meter
+
+
+class ParseMeterTestCase(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_meter(
+            "10.0 s: 1234567 cycles, 123.4 kcycles/s\n"
+            "Simulation stopped after 2000000 cycles: cycle limit reached\n"
+            "16.204 s of wall-clock time, 123.4 kcycles/s\n"), (2000000, 16.204))
+
+    def test_missing(self):
+        self.assertEqual(parse_meter("terminate called after throwing an instance of ...\n"),
+                         (None, None))
@@ -0,0 +1,269 @@
+import random
+import unittest
+
+from amaranth import *
+from amaranth.lib import io
+from amaranth.lib.wiring import connect
+from amaranth.sim import *
+
+from riscv_demo.ips.ports import PortGroup
+from riscv_demo.ips.qspi import QSPIController, WishboneQSPIFlashController
+
+
+class _FlashModel:
+    """SPI flash that implements the Read and Fast Read Quad I/O commands (with continuous read
+    mode), and whose outputs change `tco` cycles after the falling edge of SCK. It is connected
+    to IO0-IO3 of `lane`, and starts in continuous read mode if `continuous` is set. The data of
+    a transaction is inverted if `corrupt(ctx)` returns true when it starts."""
+    def __init__(self, ports, contents, *, tco, lane=0, continuous=False, corrupt=None):
+        self.ports      = ports
+        self.contents   = contents
+        self.tco        = tco
+        self.lane       = lane
+        self.continuous = continuous
+        self.corrupt    = corrupt
+        self.commands   = []
+
+    async def testbench(self, ctx):
+        prev_sck   = 1
+        prev_cs    = 1
+        continuous = self.continuous
+        pending    = [] # (cycle, io)
+        cycle      = 0
+        mask       = 0xf << (4 * self.lane)
+        while True:
+            await ctx.tick()
+            cycle += 1
+            sck = ctx.get(self.ports.sck.o)
+            cs  = ctx.get(self.ports.cs.o)
+            if not cs and prev_cs:
+                # In continuous read mode, a transaction starts with the address.
+                command = 0xeb if continuous else None
+                index, bits, shifter, addr, out = int(continuous), 0, 0, 0, 0
+                width = 4 if continuous else 1
+                invert = 0xff if self.corrupt is not None and self.corrupt(ctx) else 0
+            elif not cs and sck and not prev_sck:
+                io_o = (ctx.get(self.ports.io.o) & mask) >> (4 * self.lane)
+                shifter = (shifter << width) | (io_o & ((1 << width) - 1))
+                out = (out << width) & 0xff
+                bits += width
+                if bits == 8:
+                    octet, bits = shifter & 0xff, 0
+                    if index == 0:
+                        command = octet
+                        self.commands.append(command)
+                        width = 4 if command == 0xeb else 1
+                    elif index <= 3:
+                        addr = (addr << 8) | octet
+                    if command == 0xeb and index == 4:
+                        continuous = (octet & 0x30) == 0x20
+                    # 0x03: command, 3 address bytes; 0xEB: command, 3 address bytes, mode bits,
+                    # 4 dummy cycles.
+                    if (command == 0x03 and index >= 3) or (command == 0xeb and index >= 6):
+                        out = self.contents[addr % len(self.contents)] ^ invert
+                        addr += 1
+                    index += 1
+            elif not cs and not sck and prev_sck:
+                if width == 1:
+                    pending.append((cycle + self.tco, (out >> 7) << 1))
+                else:
+                    pending.append((cycle + self.tco, out >> 4))
+            prev_sck, prev_cs = sck, cs
+            while pending and pending[0][0] <= cycle:
+                _, io_i = pending.pop(0)
+                ctx.set(self.ports.io.i,
+                        (ctx.get(self.ports.io.i) & ~mask) | (io_i << (4 * self.lane)))
+
+
+class QSPIFlashTestCase(unittest.TestCase):
+    cal_addr = 0x1000
+
+    def setUp(self):
+        self.contents = bytes(random.Random(0).randrange(256) for _ in range(0x2000))
+
+    def run_flash(self, testbench, *, tco, max_sample_delay=3, lane_count=1,
+                  continuous_read=False, flash_continuous=False, corrupt=None):
+        """Run `testbench` against a controller and flash models, and return the models.
+
+        The flash reads back corrupted data when `corrupt(divisor, sample_delay)` is true."""
+        ports = PortGroup()
+        ports.sck = io.SimulationPort("o",  1, name="sck")
+        ports.io  = io.SimulationPort("io", 4 * lane_count, name="io")
+        ports.cs  = io.SimulationPort("o",  1, name="cs")
+
+        m = Module()
+        m.submodules.qspi = qspi = \
+            QSPIController(ports, lane_count=lane_count, max_sample_delay=max_sample_delay)
+        m.submodules.flash = flash = \
+            WishboneQSPIFlashController(addr_width=22, data_width=32, lane_count=lane_count,
+                                        continuous_read=continuous_read,
+                                        max_sample_delay=max_sample_delay)
+        connect(m, flash.spi_bus, qspi)
+
+        def corrupt_at(ctx):
+            return corrupt(ctx.get(flash.spi_bus.divisor), ctx.get(flash.spi_bus.sample_delay))
+
+        async def flash_testbench(ctx):
+            await testbench(ctx, flash)
+
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+        models = []
+        for lane in range(lane_count):
+            # Each chip holds every `lane_count`-th byte of the contents.
+            model = _FlashModel(ports, self.contents[lane::lane_count], tco=tco, lane=lane,
+                                continuous=flash_continuous,
+                                corrupt=None if corrupt is None else corrupt_at)
+            sim.add_testbench(model.testbench, background=True)
+            models.append(model)
+        sim.add_testbench(flash_testbench)
+        sim.run()
+        return models
+
+    async def csr_access(self, ctx, dut, addr, *, r_stb=0, w_stb=0, w_data=0):
+        r_data = 0
+        for offset in range(4):
+            ctx.set(dut.csr_bus.addr, addr + offset)
+            ctx.set(dut.csr_bus.r_stb, r_stb)
+            ctx.set(dut.csr_bus.w_stb, w_stb)
+            ctx.set(dut.csr_bus.w_data, (w_data >> (8 * offset)) & 0xff)
+            await ctx.tick()
+            r_data |= ctx.get(dut.csr_bus.r_data) << (8 * offset)
+        ctx.set(dut.csr_bus.r_stb, 0)
+        ctx.set(dut.csr_bus.w_stb, 0)
+        return r_data
+
+    async def read_words(self, ctx, dut, addr, count):
+        """Read `count` words from `addr` and return the number of cycles it took."""
+        cycles = 0
+        for word_addr in range(addr // 4, addr // 4 + count):
+            ctx.set(dut.wb_bus.adr, word_addr)
+            ctx.set(dut.wb_bus.cyc, 1)
+            ctx.set(dut.wb_bus.stb, 1)
+            while True:
+                await ctx.tick()
+                cycles += 1
+                if ctx.get(dut.wb_bus.ack):
+                    break
+            expected = int.from_bytes(self.contents[4 * word_addr:4 * word_addr + 4], "little")
+            self.assertEqual(ctx.get(dut.wb_bus.dat_r), expected)
+            ctx.set(dut.wb_bus.cyc, 0)
+            ctx.set(dut.wb_bus.stb, 0)
+            await ctx.tick()
+        return cycles
+
+    async def calibrate(self, ctx, dut, *, max_divisor):
+        await self.csr_access(ctx, dut, 0x4, w_stb=1, w_data=self.cal_addr)
+        await self.csr_access(ctx, dut, 0x8, w_stb=1, w_data=(1 << 16) | max_divisor)
+        while await self.csr_access(ctx, dut, 0xc, r_stb=1) & 1:
+            pass
+        phy_config = await self.csr_access(ctx, dut, 0x0, r_stb=1)
+        return phy_config & 0xffff, phy_config >> 16
+
+    def test_read(self):
+        async def testbench(ctx, dut):
+            await self.read_words(ctx, dut, 0x100, 4)
+
+        self.run_flash(testbench, tco=0)
+
+    def test_calibrate_fast_flash(self):
+        async def testbench(ctx, dut):
+            divisor, sample_delay = await self.calibrate(ctx, dut, max_divisor=4)
+            self.assertEqual(divisor, 0)
+            await self.read_words(ctx, dut, 0x200, 4)
+
+        self.run_flash(testbench, tco=0)
+
+    def test_calibrate_slow_flash(self):
+        # Without a sample delay, the data would be sampled before it is valid at the fastest
+        # divisors.
+        async def testbench(ctx, dut):
+            divisor, sample_delay = await self.calibrate(ctx, dut, max_divisor=4)
+            self.assertEqual(divisor, 0)
+            self.assertGreater(sample_delay, 0)
+            await self.read_words(ctx, dut, 0x200, 4)
+
+        self.run_flash(testbench, tco=2)
+
+    def test_calibrate_slow_flash_short_delay(self):
+        # With fewer sample delays to try, a slower divisor has to be used.
+        async def testbench(ctx, dut):
+            divisor, sample_delay = await self.calibrate(ctx, dut, max_divisor=4)
+            self.assertGreater(divisor, 0)
+            await self.read_words(ctx, dut, 0x200, 4)
+
+        self.run_flash(testbench, tco=2, max_sample_delay=1)
+
+    def test_calibrate_middle_delay_fails(self):
+        # The reads fail at sample delay 1, but not at 0, 2 or 3: only the first range of sample
+        # delays that work is used.
+        async def testbench(ctx, dut):
+            divisor, sample_delay = await self.calibrate(ctx, dut, max_divisor=8)
+            self.assertEqual(divisor, 6)
+            self.assertEqual(sample_delay, 0)
+            await self.read_words(ctx, dut, 0x200, 4)
+
+        self.run_flash(testbench, tco=0,
+                       corrupt=lambda divisor, sample_delay: divisor < 6 or sample_delay == 1)
+
+    def test_phy_config(self):
+        async def testbench(ctx, dut):
+            await self.csr_access(ctx, dut, 0x0, w_stb=1, w_data=3)
+            self.assertEqual(await self.csr_access(ctx, dut, 0x0, r_stb=1), 3)
+            await self.read_words(ctx, dut, 0x300, 2)
+            self.assertEqual(ctx.get(dut.spi_bus.divisor), 3)
+
+        self.run_flash(testbench, tco=0)
+
+    def test_striped_read(self):
+        cycles = {}
+        for lane_count in (1, 2):
+            async def testbench(ctx, dut):
+                cycles[lane_count] = await self.read_words(ctx, dut, 0x400, 8)
+
+            self.run_flash(testbench, tco=0, lane_count=lane_count)
+        print(f"\n8 words: {cycles[1]} cycles from one flash, {cycles[2]} cycles from two")
+        # The command, address and deselect take as long, but the 32 data bits of a word take
+        # 16 SCK cycles instead of 32 (2 clock cycles each, at the default divisor).
+        self.assertGreaterEqual(cycles[1] - cycles[2], 8 * 16 * 2)
+
+    def test_striped_calibrate(self):
+        async def testbench(ctx, dut):
+            divisor, sample_delay = await self.calibrate(ctx, dut, max_divisor=4)
+            self.assertEqual(divisor, 0)
+            await self.read_words(ctx, dut, 0x200, 4)
+
+        self.run_flash(testbench, tco=0, lane_count=2)
+
+    def test_continuous_read(self):
+        cycles = {}
+        for continuous_read in (False, True):
+            async def testbench(ctx, dut):
+                cycles[continuous_read] = await self.read_words(ctx, dut, 0x400, 8)
+
+            model, = self.run_flash(testbench, tco=0, continuous_read=continuous_read)
+        print(f"\n8 words: {cycles[False]} cycles with Read, "
+              f"{cycles[True]} cycles with Fast Read Quad I/O in continuous read mode")
+        # The mode bit reset sequence, then a single command: the other reads skip it.
+        self.assertEqual(model.commands, [0xff, 0xeb])
+        self.assertLess(cycles[True], cycles[False] // 2)
+
+    def test_continuous_read_exit(self):
+        # The flash is still in continuous read mode, e.g. after the SoC (but not the flash) was
+        # reset; the controller has to take it out of it first.
+        async def testbench(ctx, dut):
+            await self.read_words(ctx, dut, 0x400, 4)
+
+        model, = self.run_flash(testbench, tco=0, continuous_read=True, flash_continuous=True)
+        self.assertEqual(model.commands, [0xeb])
+
+    def test_continuous_read_calibrate(self):
+        async def testbench(ctx, dut):
+            divisor, sample_delay = await self.calibrate(ctx, dut, max_divisor=4)
+            self.assertEqual(divisor, 0)
+            self.assertGreater(sample_delay, 0)
+            await self.read_words(ctx, dut, 0x200, 4)
+
+        for lane_count in (1, 2):
+            with self.subTest(lane_count=lane_count):
+                self.run_flash(testbench, tco=2, lane_count=lane_count, continuous_read=True)
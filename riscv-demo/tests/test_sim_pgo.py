@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from doit.cmd_base import ModuleTaskLoader
+from doit.doit_cmd import DoitMain
+
+from riscv_demo.sim import doit_build
+
+
+class PGOBuildTestCase(unittest.TestCase):
+    """The `build_sim` task, which `chipflow sim run` runs first, against a profile-guided build
+    of the simulator. The generated code is given, and the compilers are replaced by writes of
+    the kind of build."""
+    def setUp(self):
+        cwd = os.getcwd()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        os.chdir(tmp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+
+        os.makedirs(doit_build.OUTPUT_DIR)
+        self.write_generated("// design 1")
+        self.exe = os.path.join(doit_build.OUTPUT_DIR,
+                                "sim_soc.exe" if os.name == "nt" else "sim_soc")
+        patcher = mock.patch.object(doit_build, "_build_sim_cmd",
+                                    lambda: f"echo plain> {self.exe}")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_generated(self, code):
+        for filename in ("sim_soc.cc", "sim_soc.h"):
+            with open(os.path.join(doit_build.OUTPUT_DIR, filename), "w") as f:
+                f.write(code)
+
+    def build_pgo(self):
+        # What `build_sim_pgo` does after compiling with the profile.
+        with open(self.exe, "w") as f:
+            f.write("pgo\n")
+        doit_build.record_pgo_build()
+
+    def build_sim(self):
+        loader = ModuleTaskLoader({"task_build_sim": doit_build.task_build_sim})
+        self.assertEqual(DoitMain(loader).run(["build_sim"]), 0)
+        with open(self.exe) as f:
+            return f.read().strip()
+
+    def test_keep_first_build(self):
+        self.build_pgo()
+        self.assertEqual(self.build_sim(), "pgo")
+        self.assertEqual(self.build_sim(), "pgo")
+
+    def test_keep_after_plain_build(self):
+        self.assertEqual(self.build_sim(), "plain")
+        self.build_pgo()
+        self.assertEqual(self.build_sim(), "pgo")
+
+    def test_stale(self):
+        self.assertEqual(self.build_sim(), "plain")
+        self.write_generated("// design 2")
+        self.build_pgo()
+        # Back to the sources that doit last saw, which the profile-guided build isn't built from.
+        self.write_generated("// design 1")
+        self.assertEqual(self.build_sim(), "plain")
+        self.assertFalse(os.path.exists(doit_build.PGO_STAMP))
+
+    def test_discard(self):
+        self.build_pgo()
+        doit_build.discard_pgo_build()
+        self.assertEqual(self.build_sim(), "plain")
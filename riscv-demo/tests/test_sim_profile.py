@@ -0,0 +1,103 @@
+import io
+import struct
+import unittest
+
+from riscv_demo.tools.sim_profile import read_elf_symbols, read_profile, symbolize
+
+
+def build_elf32(sections, symbols):
+    """Return a little-endian ELF32 file with `sections` (`(name, flags, addr, size)`) and
+    a symbol table of `symbols` (`(name, value, size, type, section index)`); the sections have
+    no contents."""
+    strtab = b"\0"
+    syms = [bytes(16)]
+    for name, value, size, type, shndx in symbols:
+        syms.append(struct.pack("<IIIBBH", len(strtab), value, size, type, 0, shndx))
+        strtab += name.encode() + b"\0"
+    symtab = b"".join(syms)
+
+    names = [name for name, *_ in sections] + [".symtab", ".strtab", ".shstrtab"]
+    shstrtab = b"\0"
+    name_offsets = []
+    for name in names:
+        name_offsets.append(len(shstrtab))
+        shstrtab += name.encode() + b"\0"
+
+    symtab_offset   = 52
+    strtab_offset   = symtab_offset + len(symtab)
+    shstrtab_offset = strtab_offset + len(strtab)
+    shoff           = shstrtab_offset + len(shstrtab)
+    symtab_index    = len(sections) + 1
+    headers = [bytes(40)]
+    for (name, flags, addr, size), name_offset in zip(sections, name_offsets):
+        headers.append(struct.pack("<IIIIIIIIII", name_offset, 1, flags, addr, 0, size,
+                                   0, 0, 4, 0))
+    headers.append(struct.pack("<IIIIIIIIII", name_offsets[-3], 2, 0, 0, symtab_offset,
+                               len(symtab), symtab_index + 1, 1, 4, 16))
+    headers.append(struct.pack("<IIIIIIIIII", name_offsets[-2], 3, 0, 0, strtab_offset,
+                               len(strtab), 0, 0, 1, 0))
+    headers.append(struct.pack("<IIIIIIIIII", name_offsets[-1], 3, 0, 0, shstrtab_offset,
+                               len(shstrtab), 0, 0, 1, 0))
+
+    header = b"\x7fELF\x01\x01\x01" + bytes(9) + struct.pack(
+        "<HHIIIIIHHHHHH", 2, 0xf3, 1, 0x100000, 0, shoff, 0, 52, 0, 0, 40, len(headers),
+        len(headers) - 1)
+    return header + symtab + strtab + shstrtab + b"".join(headers)
+
+
+_ELF = build_elf32(
+    sections=[
+        (".text",   0x6, 0x100000, 0x100),   # SHF_ALLOC | SHF_EXECINSTR
+        (".rodata", 0x2, 0x100100, 0x100),
+    ],
+    symbols=[
+        ("func_b",   0x100040, 0,    0, 1),  # no size, e.g. from assembly
+        ("func_a",   0x100000, 0x40, 2, 1),
+        ("$x",       0x100000, 0,    0, 1),  # mapping symbol
+        ("table",    0x100100, 0x10, 1, 2),  # object
+        ("ro_label", 0x100110, 0,    0, 2),  # not in an executable section
+        ("func_c",   0x100080, 0x10, 2, 1),
+    ])
+
+
+class ReadElfSymbolsTestCase(unittest.TestCase):
+    def test_symbols(self):
+        sections, symbols = read_elf_symbols(_ELF)
+        self.assertEqual(sections, [(0x100000, 0x100, ".text")])
+        self.assertEqual(symbols, [
+            (0x100000, 0x40, "func_a"),
+            (0x100040, 0,    "func_b"),
+            (0x100080, 0x10, "func_c"),
+        ])
+
+    def test_not_elf(self):
+        with self.assertRaises(ValueError):
+            read_elf_symbols(b"\0" * 64)
+
+
+class SymbolizeTestCase(unittest.TestCase):
+    def test_read_profile(self):
+        interval, samples = read_profile(io.StringIO(
+            "# interval 100\n"
+            "00100000 5\n"
+            "00100004 7\n"))
+        self.assertEqual(interval, 100)
+        self.assertEqual(samples, {0x100000: 5, 0x100004: 7})
+
+    def test_symbolize(self):
+        sections, symbols = read_elf_symbols(_ELF)
+        functions = symbolize({
+            0x100000: 5,
+            0x10003c: 7,
+            0x100078: 1,    # func_b extends up to func_c
+            0x100084: 2,
+            0x100090: 3,    # past the end of func_c
+            0x200000: 4,    # outside of any section
+        }, sections, symbols)
+        self.assertEqual(functions, {
+            (".text", "func_a"): 12,
+            (".text", "func_b"): 1,
+            (".text", "func_c"): 2,
+            (".text", "[0x00100090]"): 3,
+            ("[unknown]", "[0x00200000]"): 4,
+        })
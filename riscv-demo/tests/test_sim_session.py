@@ -0,0 +1,81 @@
+import os
+import sys
+import stat
+import asyncio
+import tempfile
+import textwrap
+import unittest
+
+from riscv_demo.sim import SimSession
+
+
+# Stands in for `sim_soc --interactive`: greets with "hi" on the UART, then echoes each byte sent
+# to the UART incremented by one, and exits when its input is closed.
+_FAKE_SIM = textwrap.dedent("""\
+    import sys, json
+    assert sys.argv[1] == "--interactive"
+    timestamp = 0
+    def event(payload):
+        global timestamp
+        timestamp += 100
+        print(json.dumps({"timestamp": timestamp, "peripheral": "uart", "event": "tx",
+                          "payload": payload}), flush=True)
+    for char in b"hi":
+        event(char)
+    for line in sys.stdin:
+        command = json.loads(line)
+        if command["payload"] == 0:
+            sys.exit(2)
+        event(command["payload"] + 1)
+""")
+
+
+@unittest.skipIf(os.name == "nt", "fake simulator is a shebang script")
+class SimSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.executable = tempfile.mkstemp(suffix=".py")
+        with os.fdopen(fd, "w") as f:
+            f.write(f"#!{sys.executable}\n{_FAKE_SIM}")
+        os.chmod(self.executable, stat.S_IRWXU)
+
+    def tearDown(self):
+        os.unlink(self.executable)
+
+    def test_wait_for(self):
+        async def testbench():
+            async with SimSession(self.executable) as session:
+                self.assertEqual((await session.wait_for("uart", "tx"))["payload"], ord("h"))
+                # events that arrived before the call are matched too, in order
+                await asyncio.sleep(0.1)
+                event = await session.wait_for("uart", "tx", ord("i"))
+                self.assertEqual(event["timestamp"], 200)
+                await session.send("uart", "tx", 41)
+                self.assertEqual((await session.wait_for("uart", "tx"))["payload"], 42)
+                with self.assertRaises(asyncio.TimeoutError):
+                    await session.wait_for("uart", "tx", timeout=0.1)
+            self.assertEqual(await session.close(), 0)
+
+        asyncio.run(testbench())
+
+    def test_exit(self):
+        async def testbench():
+            session = SimSession(self.executable)
+            await session.start()
+            await session.send("uart", "tx", 0)
+            with self.assertRaises(EOFError):
+                await session.wait_for("uart", "rx")
+            self.assertEqual(await session.close(), 2)
+
+        asyncio.run(testbench())
+
+    def test_concurrent(self):
+        async def converse(payload):
+            async with SimSession(self.executable) as session:
+                await session.wait_for("uart", "tx", ord("i"))
+                await session.send("uart", "tx", payload)
+                return (await session.wait_for("uart", "tx"))["payload"]
+
+        async def testbench():
+            return await asyncio.gather(*(converse(n) for n in range(1, 9)))
+
+        self.assertEqual(asyncio.run(testbench()), list(range(2, 10)))
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from riscv_demo.soc import soc_params
+from riscv_demo.steps.sim import _SimTop, _SimPlatform
+
+
+class SoCParamsTestCase(unittest.TestCase):
+    def test_section(self):
+        config = {"chipflow": {"soc": {"with_icache": True, "icache_nlines": 64}}}
+        self.assertEqual(soc_params(config), {"with_icache": True, "icache_nlines": 64})
+
+    def test_no_section(self):
+        self.assertEqual(soc_params({"chipflow": {}}), {})
+
+    def test_unknown_option(self):
+        with self.assertRaisesRegex(TypeError, r"with_fpu"):
+            soc_params({"chipflow": {"soc": {"with_fpu": True}}})
+
+
+class SoCElaborateTestCase(unittest.TestCase):
+    def test_cpu_options(self):
+        for params in [
+            {},
+            {"with_muldiv": False},
+            {"with_icache": True, "icache_nways": 2, "icache_nlines": 16},
+            {"with_icache": True, "with_dcache": True, "dcache_nwords": 8},
+            {"flash_lanes": 2},
+            {"flash_continuous_read": True},
+            {"flash_divisor_init": 2, "flash_use_ddr_buffers": True},
+            {"uart_baud": 1_000_000},
+            {"with_uart_loader": True, "uart_loader_baud": 3_000_000},
+        ]:
+            with self.subTest(**params), tempfile.TemporaryDirectory() as build_dir:
+                _SimPlatform(build_dir=build_dir).build(_SimTop(**params))
+                with open(os.path.join(build_dir, "sim_soc.il")) as f:
+                    self.assertIn("cpu", f.read())
@@ -0,0 +1,58 @@
+import json
+import unittest
+import subprocess
+from pathlib import Path
+from concurrent.futures import Future
+
+from riscv_demo.sweep import expand_grid, check_variants, _collect_rows
+
+
+class ExpandGridTestCase(unittest.TestCase):
+    def test_product(self):
+        self.assertEqual(expand_grid({"flash_use_ddr_buffers": [False, True],
+                                      "flash_divisor_init": [1, 2, 4]}), [
+            {"flash_divisor_init": 1, "flash_use_ddr_buffers": False},
+            {"flash_divisor_init": 1, "flash_use_ddr_buffers": True},
+            {"flash_divisor_init": 2, "flash_use_ddr_buffers": False},
+            {"flash_divisor_init": 2, "flash_use_ddr_buffers": True},
+            {"flash_divisor_init": 4, "flash_use_ddr_buffers": False},
+            {"flash_divisor_init": 4, "flash_use_ddr_buffers": True},
+        ])
+
+    def test_empty(self):
+        self.assertEqual(expand_grid({}), [{}])
+
+
+class CheckVariantsTestCase(unittest.TestCase):
+    def test_soc_params(self):
+        check_variants(expand_grid({
+            "flash_continuous_read": [False, True],
+            "flash_divisor_init":    [0, 1],
+            "flash_use_ddr_buffers": [False, True],
+            "uart_baud":             [115200, 1_000_000],
+        }))
+
+    def test_minerva_grid(self):
+        with open(Path(__file__).parent.parent / "sweeps" / "minerva.json") as f:
+            variants = expand_grid(json.load(f))
+        self.assertEqual(len(variants), 8)
+        check_variants(variants)
+
+    def test_unknown(self):
+        with self.assertRaisesRegex(TypeError, r"divisor"):
+            check_variants(expand_grid({"divisor": [1, 2]}))
+
+
+class CollectRowsTestCase(unittest.TestCase):
+    def test_failed_variant(self):
+        variants = expand_grid({"uart_baud": [115200, 1_000_000, 2_000_000]})
+        futures = [Future() for _ in variants]
+        futures[0].set_result({"variant": "a", "cycles": 2000, "reached": True, "area": 1.5})
+        futures[1].set_exception(subprocess.CalledProcessError(1, ["yosys", "-q", "sim_soc.ys"]))
+        futures[2].set_result({"variant": "c", "cycles": 1000, "reached": True, "area": 2.5})
+        rows = _collect_rows(variants, futures)
+        self.assertEqual([row["uart_baud"] for row in rows], [2_000_000, 115200, 1_000_000])
+        self.assertEqual(rows[0]["error"], "")
+        self.assertFalse(rows[2]["reached"])
+        self.assertIsNone(rows[2]["cycles"])
+        self.assertRegex(rows[2]["error"], r"^CalledProcessError: Command .* non-zero exit")
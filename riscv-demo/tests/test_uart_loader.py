@@ -0,0 +1,180 @@
+import os
+import shutil
+import struct
+import asyncio
+import tempfile
+import unittest
+import zlib
+import importlib.util
+
+from amaranth import *
+from amaranth.sim import *
+
+from riscv_demo.ips.uart import UARTLoader, frame_image, boot_rom
+from riscv_demo.sim import SimSession
+
+
+# Runs from the start of the SRAM: enables the UART transmitter and sends the message after the
+# code, waiting for the transmitter to be ready before each byte.
+_HELLO_CODE = [
+    0xb20002b7, # lui  t0, 0xb2000
+    0x00100313, # li   t1, 1
+    0x20628023, # sb   t1, 0x200(t0)
+    0x10000537, # lui  a0, 0x10000
+    0x03850513, # addi a0, a0, 56
+    0x00054583, # 1: lbu  a1, 0(a0)
+    0x00058e63, # beqz a1, 3f
+    0x2082c603, # 2: lbu  a2, 0x208(t0)
+    0x00167613, # andi a2, a2, 1
+    0xfe060ce3, # beqz a2, 2b
+    0x20b28623, # sb   a1, 0x20c(t0)
+    0x00150513, # addi a0, a0, 1
+    0xfe5ff06f, # j    1b
+    0x0000006f, # 3: j 3b
+]
+_HELLO = struct.pack(f"<{len(_HELLO_CODE)}I", *_HELLO_CODE) + b"hello from SRAM\n\0"
+
+
+class FrameTestCase(unittest.TestCase):
+    def test_frame(self):
+        frame = frame_image(b"\x01\x02\x03\x04\x05")
+        self.assertEqual(frame[:4], b"BOOT")
+        self.assertEqual(frame[4:8], struct.pack("<I", 8))
+        self.assertEqual(frame[8:16], b"\x01\x02\x03\x04\x05\0\0\0")
+        self.assertEqual(frame[16:], struct.pack("<I", zlib.crc32(frame[8:16])))
+
+    def test_boot_rom(self):
+        # Checked against the encodings of an assembler.
+        self.assertEqual(boot_rom(status_addr=0xb3000000, image_addr=0x10000000,
+                                  fallback_addr=0x00100000), [
+            0xb30002b7, # lui  t0, 0xb3000
+            0x0002c303, # lbu  t1, 0(t0)
+            0x00137313, # andi t1, t1, 1
+            0x100002b7, # lui  t0, 0x10000
+            0x00031463, # bnez t1, 1f
+            0x001002b7, # lui  t0, 0x100
+            0x00028067, # 1: jr t0
+        ])
+
+
+class LoaderTestCase(unittest.TestCase):
+    divisor  = 8
+    mem_base = 0x1000
+    mem_size = 0x40
+    timeout  = 100
+
+    def run_frames(self, *frames, idle=0):
+        """Send each of `frames` to the loader, and return the memory written and, after each
+        frame, whether `cpu_reset` was asserted during it and the status register."""
+        dut = UARTLoader(divisor=self.divisor, mem_base=self.mem_base, mem_size=self.mem_size,
+                         timeout=self.timeout)
+        memory  = {}
+        results = []
+
+        async def memory_model(ctx):
+            async for clk_edge, rst, cyc, stb, adr, dat_w in ctx.tick().sample(
+                    dut.wb_bus.cyc, dut.wb_bus.stb, dut.wb_bus.adr, dut.wb_bus.dat_w):
+                if ctx.get(dut.wb_bus.ack):
+                    ctx.set(dut.wb_bus.ack, 0)
+                elif cyc and stb:
+                    self.assertTrue(ctx.get(dut.wb_bus.we))
+                    memory[adr * 4] = dat_w
+                    ctx.set(dut.wb_bus.ack, 1)
+
+        async def testbench(ctx):
+            for frame in frames:
+                held_reset = False
+                for byte in frame:
+                    for bit in [0, *(byte >> n & 1 for n in range(8)), 1]:
+                        ctx.set(dut.rx, bit)
+                        for _ in range(self.divisor):
+                            await ctx.tick()
+                            held_reset |= ctx.get(dut.cpu_reset)
+                await ctx.tick().repeat(self.divisor + idle)
+
+                ctx.set(dut.csr_bus.addr, 0)
+                ctx.set(dut.csr_bus.r_stb, 1)
+                await ctx.tick()
+                ctx.set(dut.csr_bus.r_stb, 0)
+                status = ctx.get(dut.csr_bus.r_data)
+                results.append((held_reset, ctx.get(dut.cpu_reset), status))
+
+        sim = Simulator(dut)
+        sim.add_clock(1e-6)
+        sim.add_testbench(memory_model, background=True)
+        sim.add_testbench(testbench)
+        sim.run()
+        return memory, results
+
+    def test_load(self):
+        image = bytes(range(1, 21))
+        memory, results = self.run_frames(b"noise" + frame_image(image))
+        # loaded, and the CPU is out of reset
+        self.assertEqual(results, [(True, 0, 0b01)])
+        self.assertEqual(memory, {self.mem_base + offset:
+                                  int.from_bytes(image[offset:offset + 4], "little")
+                                  for offset in range(0, len(image), 4)})
+
+    def test_reload(self):
+        frame = frame_image(b"\xaa" * 8)
+        bad_crc = frame[:-1] + bytes([frame[-1] ^ 1])
+        _, results = self.run_frames(bad_crc, frame)
+        self.assertEqual(results, [(True, 0, 0b10), (True, 0, 0b01)])
+
+    def test_too_large(self):
+        memory, results = self.run_frames(frame_image(b"\0" * (self.mem_size + 4)))
+        self.assertEqual(results[0][1:], (0, 0b10))
+        self.assertEqual(memory, {})
+
+    def test_timeout(self):
+        memory, results = self.run_frames(frame_image(b"\x55" * 8)[:-2], idle=self.timeout)
+        self.assertEqual(results, [(True, 0, 0b10)])
+        self.assertEqual(len(memory), 2)
+
+
+def _runtime_dir():
+    if importlib.util.find_spec("ziglang") is None:
+        return None
+    try:
+        from riscv_demo.yosys import find_yosys
+        return find_yosys().runtime_dir
+    except Exception:
+        return None
+
+
+@unittest.skipIf(_runtime_dir() is None, "needs ziglang and the CXXRTL runtime of a Yosys")
+class SimLoaderTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from riscv_demo.sweep import _build_variant
+        from riscv_demo.sim import doit_build
+
+        # The default build of `chipflow sim build` has no loader; this is a variant with one.
+        cls.build_dir = tempfile.mkdtemp()
+        variant_dir = os.path.join(cls.build_dir, "loader")
+        exe = _build_variant({"with_uart_loader": True}, variant_dir,
+                             doit_build.build_models(cls.build_dir))
+        cls.executable = os.path.join(variant_dir, exe)
+        # Spins, so that all of the UART output is from the image sent to the loader.
+        cls.firmware = os.path.join(cls.build_dir, "firmware.bin")
+        with open(cls.firmware, "wb") as f:
+            f.write(struct.pack("<I", 0x0000006f)) # 1: j 1b
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.build_dir)
+
+    def test_hello(self):
+        from riscv_demo.tools.uart_boot import boot_sim
+
+        async def testbench():
+            args = ["--firmware", self.firmware, "--timeout", "120"]
+            async with SimSession(self.executable, args=args) as session:
+                await boot_sim(session, _HELLO, baud=1_000_000)
+                line = b""
+                while not line.endswith(b"\n"):
+                    event = await session.wait_for("uart", "tx", timeout=120)
+                    line += bytes([event["payload"]])
+                self.assertEqual(line, b"hello from SRAM\n")
+
+        asyncio.run(testbench())
@@ -54,7 +54,48 @@ class _LoopbackPHY(wiring.Component):
         return m
 
 
+class _ReadyPHY(wiring.Component):
+    """PHY that is ready to transmit even while held in reset."""
+    def __init__(self):
+        super().__init__(UARTPhy.Signature().flip())
+
+    def elaborate(self, platform):
+        m = Module()
+        m.d.comb += self.tx.symbols.ready.eq(1)
+        return m
+
+
 class PeripheralTestCase(unittest.TestCase):
+    def test_tx_ready_disabled(self):
+        dut = UARTPeripheral(divisor_init=int(48e6 // 115200))
+        phy = _ReadyPHY()
+
+        m = Module()
+        m.submodules.dut = dut
+        m.submodules.phy = phy
+
+        connect(m, dut.phy.rx, phy.rx)
+        connect(m, dut.phy.tx, phy.tx)
+
+        tx_config_addr = 0x200
+        tx_status_addr = 0x208
+
+        async def testbench(ctx):
+            # - read TxStatus (ready=0), as the transmitter is disabled:
+            await _csr_access(self, ctx, dut, tx_status_addr, r_stb=1, r_data=0)
+
+            # - write 1 to TxConfig:
+            await _csr_access(self, ctx, dut, tx_config_addr, w_stb=1, w_data=1)
+            await ctx.tick()
+
+            # - read TxStatus (ready=1):
+            await _csr_access(self, ctx, dut, tx_status_addr, r_stb=1, r_data=1)
+
+        sim = Simulator(m)
+        sim.add_clock(period=1 / 48e6)
+        sim.add_testbench(testbench)
+        sim.run()
+
     def test_sim(self):
         ports = PortGroup()
         ports.rx = io.SimulationPort("i", 1)
@@ -0,0 +1,15 @@
+import unittest
+
+from riscv_demo.yosys import parse_yosys_version
+
+
+class ParseYosysVersionTestCase(unittest.TestCase):
+    def test_native(self):
+        self.assertEqual(parse_yosys_version("Yosys 0.45+139 (git sha1 4d581a97d, clang++ 18)\n"),
+                         (0, 45))
+
+    def test_yowasp(self):
+        self.assertEqual(parse_yosys_version("0.70.0.0.post1259"), (0, 70))
+
+    def test_missing(self):
+        self.assertIsNone(parse_yosys_version("yosys: command not found\n"))
@@ -0,0 +1,89 @@
+import unittest
+
+from uart_demo.tools.flash_delta import SECTOR_SIZE, flash_delta
+
+
+class _SimulatedFlash:
+    """Stand-in for a 25-series flash: erasing sets a whole sector to ones, and programming
+    can only clear bits."""
+    def __init__(self, size=0x200000):
+        self.data    = bytearray(b"\xff" * size)
+        self.reads   = 0
+        self.erased  = []
+
+    def read(self, address, length):
+        self.reads += length
+        return bytes(self.data[address:address + length])
+
+    def erase_program(self, address, data):
+        for sector in range(address // SECTOR_SIZE, (address + len(data) - 1) // SECTOR_SIZE + 1):
+            start = sector * SECTOR_SIZE
+            # Like the memory-25x applet, keep the part of a sector outside of `data`.
+            keep = self.data[start:start + SECTOR_SIZE]
+            self.data[start:start + SECTOR_SIZE] = b"\xff" * SECTOR_SIZE
+            for offset in range(SECTOR_SIZE):
+                if not address <= start + offset < address + len(data):
+                    self.data[start + offset] = keep[offset]
+            self.erased.append(start)
+        for offset, byte in enumerate(data):
+            self.data[address + offset] &= byte
+
+    def verify(self, address, data):
+        return self.data[address:address + len(data)] == data
+
+
+class FlashDeltaTestCase(unittest.TestCase):
+    address = 0x100000
+
+    def test_full(self):
+        image = bytes(range(256)) * 40
+        flash = _SimulatedFlash()
+        record = {}
+        ranges = flash_delta(flash, image, self.address, record)
+        self.assertEqual(ranges, [(self.address, len(image))])
+        self.assertEqual(flash.data[self.address:self.address + len(image)], image)
+        self.assertEqual(flash.reads, len(image))
+        self.assertIn(hex(self.address), record)
+
+    def test_changed_sectors(self):
+        image = bytearray(bytes(range(256)) * 64)
+        flash = _SimulatedFlash()
+        record = {}
+        flash_delta(flash, bytes(image), self.address, record)
+        flash.erased.clear()
+        flash.reads = 0
+
+        image[SECTOR_SIZE + 10] ^= 0xff
+        image[3 * SECTOR_SIZE] ^= 0x01
+        ranges = flash_delta(flash, bytes(image), self.address, record)
+        self.assertEqual(ranges, [(self.address + SECTOR_SIZE, SECTOR_SIZE),
+                                  (self.address + 3 * SECTOR_SIZE, SECTOR_SIZE)])
+        self.assertEqual(flash.erased, [self.address + SECTOR_SIZE,
+                                        self.address + 3 * SECTOR_SIZE])
+        self.assertEqual(flash.reads, 0)
+        self.assertEqual(flash.data[self.address:self.address + len(image)], image)
+
+        self.assertEqual(flash_delta(flash, bytes(image), self.address, record), [])
+
+    def test_read_back(self):
+        image = bytearray(bytes(range(256)) * 48 + b"tail")
+        flash = _SimulatedFlash()
+        flash_delta(flash, bytes(image), self.address)
+        flash.erased.clear()
+
+        image[-1:] = b"!"
+        ranges = flash_delta(flash, bytes(image), self.address)
+        self.assertEqual(ranges, [(self.address + 3 * SECTOR_SIZE, 4)])
+        self.assertEqual(flash.erased, [self.address + 3 * SECTOR_SIZE])
+        self.assertEqual(flash.data[self.address:self.address + len(image)], image)
+
+    def test_verify_failure(self):
+        class _StuckFlash(_SimulatedFlash):
+            def erase_program(self, address, data):
+                pass
+
+        flash = _StuckFlash()
+        record = {}
+        with self.assertRaisesRegex(Exception, "Verification failed"):
+            flash_delta(flash, b"\x00" * 16, self.address, record)
+        self.assertEqual(record, {})
@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+
+from glasgow.device.hardware import REQ_FPGA_CFG, REQ_BITSTREAM_ID
+
+from uart_demo.tools.glasgow_load import bitstream_id_for, load_bitstream
+
+
+class _FakeGlasgowHardwareDevice:
+    """Stand-in for `GlasgowHardwareDevice` that completes control transfers after a delay,
+    recording the order in which they completed and how many were in flight at once."""
+    def __init__(self, bitstream_id=b"\x00" * 16):
+        self.bitstream_id = bitstream_id
+        self.bitstream    = bytearray()
+        self.voltage      = None
+        self.in_flight    = 0
+        self.max_in_flight = 0
+
+    async def control_read(self, request_type, request, value, index, length):
+        assert request == REQ_BITSTREAM_ID
+        return bytearray(self.bitstream_id)
+
+    async def control_write(self, request_type, request, value, index, data):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        if request == REQ_FPGA_CFG:
+            if index == 0:
+                self.bitstream = bytearray()
+                self.bitstream_id = b"\x00" * 16
+            assert len(self.bitstream) == index * 1024, "chunks completed out of order"
+            self.bitstream += data
+        if request == REQ_BITSTREAM_ID:
+            self.bitstream_id = data
+
+    async def set_voltage(self, ports, voltage):
+        self.voltage = voltage
+
+
+class GlasgowLoadTestCase(unittest.TestCase):
+    def test_download(self):
+        bitstream = bytes(range(256)) * 401
+        device = _FakeGlasgowHardwareDevice()
+        self.assertTrue(asyncio.run(load_bitstream(device, bitstream)))
+        self.assertEqual(device.bitstream, bitstream)
+        self.assertEqual(device.bitstream_id, bitstream_id_for(bitstream))
+        self.assertGreater(device.max_in_flight, 1)
+        self.assertLessEqual(device.max_in_flight, 8)
+
+    def test_skip_unchanged(self):
+        bitstream = bytes(range(256)) * 8
+        device = _FakeGlasgowHardwareDevice(bitstream_id=bitstream_id_for(bitstream))
+        self.assertFalse(asyncio.run(load_bitstream(device, bitstream)))
+        self.assertEqual(device.bitstream, b"")
+        self.assertTrue(asyncio.run(load_bitstream(device, bitstream, force=True)))
+        self.assertEqual(device.bitstream, bitstream)
+
+    def test_different_bitstream(self):
+        device = _FakeGlasgowHardwareDevice(bitstream_id=bitstream_id_for(b"\x01" * 2048))
+        self.assertTrue(asyncio.run(load_bitstream(device, b"\x02" * 2048)))
+        self.assertEqual(device.bitstream, b"\x02" * 2048)
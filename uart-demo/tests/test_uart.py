@@ -1,3 +1,4 @@
+import random
 import unittest
 
 from amaranth import *
@@ -8,4 +9,140 @@ from uart_demo.uart import LoopbackUART
 from uart_demo.ports import PortGroup
 
 
-# TODO
+class LoopbackUARTTestCase(unittest.TestCase):
+    clk_freq = 48e6
+
+    def setUp(self):
+        self.ports = PortGroup()
+        self.ports.rx = io.SimulationPort("i", 1, name="rx")
+        self.ports.tx = io.SimulationPort("o", 1, name="tx")
+
+    def run_loopback(self, dut, divisor, frames, *, count=None, check=None):
+        """Send `frames` (lists of line levels, one per bit) back-to-back and decode the `count`
+        bytes (by default, one per frame) transmitted in response, then run `check`. Returns the
+        bytes and the number of cycles the transfer took."""
+        if count is None:
+            count = len(frames)
+        received = bytearray()
+        cycles   = 0
+
+        async def sender(ctx):
+            ctx.set(self.ports.rx.i, 1)
+            for frame in frames:
+                for bit in frame:
+                    ctx.set(self.ports.rx.i, bit)
+                    await ctx.tick().repeat(divisor)
+            ctx.set(self.ports.rx.i, 1)
+
+        async def receiver(ctx):
+            nonlocal cycles
+            while len(received) < count:
+                while ctx.get(self.ports.tx.o):
+                    await ctx.tick()
+                    cycles += 1
+                # Sample in the middle of each bit.
+                await ctx.tick().repeat(divisor // 2)
+                byte = 0
+                for index in range(8):
+                    await ctx.tick().repeat(divisor)
+                    byte |= ctx.get(self.ports.tx.o) << index
+                await ctx.tick().repeat(divisor)
+                self.assertEqual(ctx.get(self.ports.tx.o), 1, "stop bit")
+                await ctx.tick().repeat(divisor - divisor // 2)
+                cycles += 10 * divisor
+                received.append(byte)
+            if check is not None:
+                await check(ctx)
+
+        sim = Simulator(dut)
+        sim.add_clock(1 / self.clk_freq)
+        sim.add_testbench(sender)
+        sim.add_testbench(receiver)
+        sim.run()
+        return bytes(received), cycles
+
+    @staticmethod
+    def frame(byte, stop=1):
+        return [0, *((byte >> index) & 1 for index in range(8)), stop]
+
+    def test_throughput(self):
+        # The smallest divisor at which AsyncSerialRX keeps up with back-to-back frames: it takes
+        # two cycles after sampling the stop bit (in the middle of it) to look for a start bit.
+        divisor = 5
+        dut  = LoopbackUART(self.ports, self.clk_freq, self.clk_freq / divisor, fifo_depth=16)
+        data = bytes(random.Random(0).randrange(256) for _ in range(1024))
+
+        async def check(ctx):
+            self.assertEqual(ctx.get(dut.dropped), 0)
+            self.assertEqual(ctx.get(dut.errors), 0)
+            self.assertLessEqual(ctx.get(dut.max_level), 2)
+
+        received, cycles = self.run_loopback(dut, divisor, [self.frame(byte) for byte in data],
+                                             check=check)
+        self.assertEqual(received, data)
+
+        # The echo of the last byte ends a few cycles after the last frame was sent.
+        baudrate = self.clk_freq / divisor
+        effective = len(data) * 10 / (cycles / self.clk_freq)
+        print(f"\n{len(data)} bytes at {baudrate / 1e6:g} Mbaud: "
+              f"{effective / 1e6:.3f} Mbaud effective ({effective / baudrate:.2%} of line rate)")
+        self.assertGreater(effective / baudrate, 0.99)
+
+    def test_counters(self):
+        divisor = 8
+        dut = LoopbackUART(self.ports, self.clk_freq, self.clk_freq / divisor, fifo_depth=4)
+        # The line is still low after a missing stop bit, which the receiver may take for
+        # the start bit of another (also invalid) frame.
+        frames = [self.frame(0x55), self.frame(0xaa, stop=0) + [1] * 10, self.frame(0x0f)]
+
+        async def check(ctx):
+            self.assertGreaterEqual(ctx.get(dut.errors), 1)
+            self.assertEqual(ctx.get(dut.dropped), 0)
+            self.assertEqual(ctx.get(dut.level), 0)
+            self.assertEqual(ctx.get(dut.max_level), 1)
+
+        received, _ = self.run_loopback(dut, divisor, frames, count=2, check=check)
+        self.assertEqual(received, bytes([0x55, 0x0f]))
+
+    def test_overrun(self):
+        # Frames whose bits are a little shorter than the divisor still decode correctly, but
+        # arrive faster than the transmitter can send them back, so the FIFO fills up.
+        divisor, bit_cycles, fifo_depth = 64, 62, 4
+        dut  = LoopbackUART(self.ports, self.clk_freq, self.clk_freq / divisor,
+                            fifo_depth=fifo_depth)
+        data = bytes(random.Random(1).randrange(256) for _ in range(256))
+        received = 0
+        done = False
+
+        async def sender(ctx):
+            nonlocal done
+            ctx.set(self.ports.rx.i, 1)
+            await ctx.tick().repeat(divisor)
+            for byte in data:
+                for bit in self.frame(byte):
+                    ctx.set(self.ports.rx.i, bit)
+                    await ctx.tick().repeat(bit_cycles)
+            # Let the FIFO drain.
+            await ctx.tick().repeat((fifo_depth + 3) * 10 * divisor)
+            self.assertGreater(ctx.get(dut.dropped), 0)
+            self.assertEqual(ctx.get(dut.errors), 0)
+            self.assertEqual(ctx.get(dut.max_level), fifo_depth)
+            self.assertEqual(ctx.get(dut.level), 0)
+            self.assertEqual(received + ctx.get(dut.dropped), len(data))
+            done = True
+
+        async def receiver(ctx):
+            nonlocal received
+            # Count the frames transmitted back.
+            while not done:
+                if ctx.get(self.ports.tx.o):
+                    await ctx.tick()
+                else:
+                    await ctx.tick().repeat(10 * divisor)
+                    received += 1
+
+        sim = Simulator(dut)
+        sim.add_clock(1 / self.clk_freq)
+        sim.add_testbench(sender)
+        sim.add_testbench(receiver)
+        sim.run()
@@ -1,3 +1,6 @@
+import shutil
+from pathlib import Path
+
 from amaranth import *
 
 from doit.cmd_base import ModuleTaskLoader
@@ -60,7 +63,14 @@ class GlasgowBoardStep(BoardStep):
         plan = GlasgowBuildPlan(
             find_toolchain(),
             self.platform.prepare(_GlasgowTop(), nextpnr_opts="--timing-allow-fail"))
-        plan.execute(build_dir="build/board", debug=True)
+        # The bitstream ID is a digest of the elaborated design and the toolchain version, so
+        # it can be used as a cache key; switching back to a design built before is a cache hit.
+        cache_dir = Path("build/board/cache") / plan.bitstream_id.hex()
+        if (cache_dir / "top.bin").exists():
+            print(f"Using cached bitstream {cache_dir}")
+        else:
+            plan.execute(build_dir=str(cache_dir), debug=True)
+        shutil.copyfile(cache_dir / "top.bin", "build/board/top.bin")
 
     def load_bitstream(self):
         DoitMain(ModuleTaskLoader(doit_glasgow)).run(["load_bitstream"])
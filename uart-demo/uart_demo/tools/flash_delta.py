@@ -0,0 +1,128 @@
+import os
+import json
+import shlex
+import argparse
+import hashlib
+import subprocess
+import tempfile
+
+
+SECTOR_SIZE = 4096
+
+
+class GlasgowFlash:
+    """Access a 25-series flash through the `glasgow run memory-25x` command line."""
+    def __init__(self, applet_args):
+        self.applet_args = list(applet_args)
+
+    def _run(self, *command, data=None, check=True):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "data.bin")
+            if data is not None:
+                with open(filename, "wb") as f:
+                    f.write(data)
+            args = ["glasgow", "run", "memory-25x", *self.applet_args,
+                    *map(str, command), "-f", filename]
+            print(shlex.join(args))
+            result = subprocess.run(args)
+            if check and result.returncode != 0:
+                raise subprocess.CalledProcessError(result.returncode, args)
+            if data is None:
+                with open(filename, "rb") as f:
+                    return f.read()
+            return result.returncode == 0
+
+    def read(self, address, length):
+        return self._run("read", hex(address), length)
+
+    def erase_program(self, address, data):
+        self._run("erase-program", "-S", SECTOR_SIZE, "-P", 64, hex(address), data=data)
+
+    def verify(self, address, data):
+        return self._run("verify", hex(address), data=data, check=False)
+
+
+def sector_hashes(image):
+    return [hashlib.sha256(image[offset:offset + SECTOR_SIZE]).hexdigest()
+            for offset in range(0, len(image), SECTOR_SIZE)]
+
+
+def changed_ranges(image, old_hashes):
+    """Return `(offset, length)` of each run of consecutive sectors of `image` whose hash
+    differs from `old_hashes`."""
+    ranges = []
+    for index, sector_hash in enumerate(sector_hashes(image)):
+        if index < len(old_hashes) and old_hashes[index] == sector_hash:
+            continue
+        offset = index * SECTOR_SIZE
+        length = min(SECTOR_SIZE, len(image) - offset)
+        if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
+
+
+def flash_delta(flash, image, address, record=None):
+    """Program `image` at `address`, erasing and programming only the sectors that changed.
+
+    `record` maps flash addresses (as hex strings) to the sector hashes of the image last
+    programmed there; it is updated in place. Without an entry for `address`, the current
+    contents are read back from the flash instead. Returns the list of `(address, length)`
+    ranges that were programmed.
+    """
+    if record is None:
+        record = {}
+    key = hex(address)
+    if key in record:
+        old_hashes = record[key]
+    else:
+        old_hashes = sector_hashes(flash.read(address, len(image)))
+    # The record no longer describes the flash until the ranges below are verified.
+    record.pop(key, None)
+
+    ranges = changed_ranges(image, old_hashes)
+    for offset, length in ranges:
+        flash.erase_program(address + offset, image[offset:offset + length])
+    for offset, length in ranges:
+        if not flash.verify(address + offset, image[offset:offset + length]):
+            raise Exception(f"Verification failed at {address + offset:#x}")
+    record[key] = sector_hashes(image)
+    return [(address + offset, length) for offset, length in ranges]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Program a firmware image into a 25-series flash, rewriting only the "
+                    "sectors that changed since the last time.")
+    parser.add_argument("image", type=argparse.FileType("rb"))
+    parser.add_argument("address", type=lambda arg: int(arg, 0))
+    parser.add_argument("--record", default="build/board/flash_record.json",
+        help="file that keeps the sector hashes of the programmed images "
+             "(default: %(default)s)")
+    parser.add_argument("--read-back", action="store_true",
+        help="ignore the record and compare against the contents of the flash")
+    parser.add_argument("applet_args", nargs="*",
+        help="arguments for the memory-25x applet (after `--`)")
+    args = parser.parse_args()
+
+    record = {}
+    if not args.read_back and os.path.exists(args.record):
+        with open(args.record) as f:
+            record = json.load(f)
+
+    try:
+        ranges = flash_delta(GlasgowFlash(args.applet_args), args.image.read(), args.address,
+                             record)
+    finally:
+        os.makedirs(os.path.dirname(args.record) or ".", exist_ok=True)
+        with open(args.record, "w") as f:
+            json.dump(record, f, indent=2)
+    if ranges:
+        print(f"Programmed {sum(length for _, length in ranges)} bytes in {len(ranges)} range(s)")
+    else:
+        print("Flash contents already up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,117 @@
 from amaranth import *
-from amaranth.lib import io, wiring
+from amaranth.lib import io, stream, wiring
+from amaranth.lib.fifo import SyncFIFOBuffered
+from amaranth.lib.wiring import In, Out
 
-from amaranth_stdio.serial import AsyncSerial
+from amaranth_stdio.serial import AsyncSerialRX
 
 
 __all__ = ["LoopbackUART"]
 
 
-# TODO
+class _Transmitter(wiring.Component):
+    """8N1 transmitter that starts the next frame right after the stop bit of the previous one.
+
+    `AsyncSerialTX` idles for a cycle between frames, so it can't keep up with a peer that
+    transmits back-to-back at the same divisor.
+    """
+    def __init__(self, divisor):
+        self._divisor = divisor
+        super().__init__({
+            "symbols": In(stream.Signature(unsigned(8))),
+            "o":       Out(1, init=1),
+        })
+
+    def elaborate(self, platform):
+        m = Module()
+
+        shreg = Signal(9)
+        bits  = Signal(range(10))
+        timer = Signal(range(self._divisor))
+
+        with m.If(timer != 0):
+            m.d.sync += timer.eq(timer - 1)
+        with m.Elif(bits != 0):
+            m.d.sync += [
+                self.o.eq(shreg[0]),
+                shreg.eq(shreg[1:]),
+                bits.eq(bits - 1),
+                timer.eq(self._divisor - 1),
+            ]
+        with m.Else():
+            m.d.comb += self.symbols.ready.eq(1)
+            with m.If(self.symbols.valid):
+                m.d.sync += [
+                    self.o.eq(0), # start bit
+                    shreg.eq(Cat(self.symbols.payload, C(1, 1))),
+                    bits.eq(9),
+                    timer.eq(self._divisor - 1),
+                ]
+            with m.Else():
+                m.d.sync += self.o.eq(1)
+
+        return m
+
+
+class LoopbackUART(wiring.Component):
+    """UART that transmits every byte it receives.
+
+    Received bytes are buffered in a FIFO of `fifo_depth` bytes and retransmitted at the same
+    baud rate without gaps between frames, so the loopback keeps up with back-to-back traffic.
+    Bytes received while the FIFO is full are dropped.
+
+    Members
+    -------
+    dropped : Out(32)
+        Number of bytes dropped because the FIFO was full.
+    errors : Out(32)
+        Number of bytes received with a framing error. These bytes are discarded.
+    level : Out(range(fifo_depth + 1))
+        Number of bytes in the FIFO.
+    max_level : Out(range(fifo_depth + 1))
+        Highest number of bytes that were in the FIFO at once.
+    """
+    def __init__(self, ports, clk_freq, baudrate, *, fifo_depth=256):
+        self._ports      = ports
+        self._divisor    = int(clk_freq // baudrate)
+        self._fifo_depth = fifo_depth
+        super().__init__({
+            "dropped":   Out(32),
+            "errors":    Out(32),
+            "level":     Out(range(fifo_depth + 1)),
+            "max_level": Out(range(fifo_depth + 1)),
+        })
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.rx_buffer = rx_buffer = io.Buffer("i", self._ports.rx)
+        m.submodules.tx_buffer = tx_buffer = io.Buffer("o", self._ports.tx)
+
+        m.submodules.rx = rx = AsyncSerialRX(divisor=self._divisor)
+        m.submodules.fifo = fifo = SyncFIFOBuffered(width=8, depth=self._fifo_depth)
+        m.submodules.tx = tx = _Transmitter(self._divisor)
+
+        m.d.comb += [
+            rx.i.eq(rx_buffer.i),
+            # Always accept received bytes; if there is no room for them, they are counted.
+            rx.ack.eq(1),
+            fifo.w_data.eq(rx.data),
+            fifo.w_en.eq(rx.rdy & ~rx.err.frame),
+
+            tx.symbols.payload.eq(fifo.r_data),
+            tx.symbols.valid.eq(fifo.r_rdy),
+            fifo.r_en.eq(tx.symbols.ready),
+            tx_buffer.o.eq(tx.o),
+
+            self.level.eq(fifo.level),
+        ]
+
+        with m.If(rx.rdy & rx.err.frame):
+            m.d.sync += self.errors.eq(self.errors + 1)
+        with m.Elif(rx.rdy & ~fifo.w_rdy):
+            m.d.sync += self.dropped.eq(self.dropped + 1)
+        with m.If(fifo.level > self.max_level):
+            m.d.sync += self.max_level.eq(fifo.level)
+
+        return m